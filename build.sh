@@ -15,6 +15,12 @@ python manage.py migrate
 echo "⛽ Loading fuel station data..."
 python manage.py load_fuel_data fuel_stations.csv --skip-geocoding
 
+# Warm the route cache for the busiest lanes (optional)
+if [ -n "$WARM_LANES_FILE" ] && [ -f "$WARM_LANES_FILE" ]; then
+    echo "🔥 Warming route cache..."
+    python manage.py warm_route_cache "$WARM_LANES_FILE" --concurrency 4
+fi
+
 # Collect static files
 echo "📁 Collecting static files..."
 python manage.py collectstatic --noinput
@@ -0,0 +1,29 @@
+"""
+ASGI config for fuel_project project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with an ASGI server to serve the async route endpoint, e.g.:
+
+    gunicorn fuel_project.asgi:application -k uvicorn.workers.UvicornWorker
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fuel_project.settings')
+
+from django.core.asgi import get_asgi_application
+
+django_application = get_asgi_application()
+
+# The lifespan wrapper owns the provider HTTP client shared by async requests
+from fuel_route.async_views import with_http_client_lifespan
+
+application = with_http_client_lifespan(django_application)
+
+# Load station and place data before the worker takes requests
+from fuel_route.planner import preload_route_planner
+
+preload_route_planner()
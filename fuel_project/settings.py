@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 
 # Middleware - Minimal for API-only application
 MIDDLEWARE = [
+    'fuel_route.logs.RequestIdMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -120,22 +121,139 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Caching (optional)
+# Caching: per-worker LRU in front of a cache shared by all workers.
+# The shared tier is a local SQLite file unless REDIS_URL is set
+# (RedisCache requires the redis package).
+if os.environ.get("REDIS_URL"):
+    SHARED_CACHE = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+        "OPTIONS": {"serializer": "fuel_route.cache_backends.CompactSerializer"},
+    }
+else:
+    SHARED_CACHE = {
+        "BACKEND": "fuel_route.cache_backends.SQLiteCache",
+        "LOCATION": os.environ.get("CACHE_SQLITE_PATH", str(BASE_DIR / "cache.sqlite3")),
+        "OPTIONS": {"MAX_ENTRIES": 50000},
+    }
+
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "unique-snowflake",
-    }
+        "BACKEND": "fuel_route.cache_backends.TwoTierCache",
+        "OPTIONS": {
+            "SHARED_ALIAS": "shared",
+            "L1_MAX_ENTRIES": 1000,
+            "L1_TIMEOUT": 60,
+            "L1_EXCLUDE_PREFIXES": ["singleflight_", "epoch_"],
+        },
+    },
+    "shared": SHARED_CACHE,
 }
 
+# Route planning
+# Thread pool size for CPU-bound planning steps of the async route endpoint
+ROUTE_PLANNER_THREADS = int(os.environ.get("ROUTE_PLANNER_THREADS", "4"))
+# Single-flight coalescing of identical concurrent route requests (seconds)
+ROUTE_COALESCE_LOCK_TIMEOUT = 60
+ROUTE_COALESCE_WAIT_TIMEOUT = 30
+# Stale-while-revalidate for route and geocode entries: entries are served
+# stale for CACHE_STALE_TTL seconds after expiry while one background
+# refresh runs; CACHE_REFRESH_BETA > 1 favours earlier refreshes
+CACHE_STALE_TTL = 900
+CACHE_REFRESH_BETA = 1.0
+CACHE_REFRESH_THREADS = 2
+CACHE_REFRESH_LOCK_TIMEOUT = 60
+# Optional JSON-lines log of requested lanes, used by warm_route_cache --from-log
+ROUTE_REQUEST_LOG = os.environ.get("ROUTE_REQUEST_LOG")
+
+# Corridor search width shared by all vehicles allowing a detour up to this
+# many miles; vehicles with a smaller limit filter the shared corridor
+ROUTE_CORRIDOR_WIDTH_MILES = 30
+
+# Distance precision of the planner (see fuel_route/distance.py): "exact"
+# ellipsoidal geodesics everywhere, "balanced" approximations for searches
+# with exact reported distances, or "fast" approximations everywhere. All
+# modes use exact math near the corridor and detour limits
+ROUTE_DISTANCE_PRECISION = os.environ.get("ROUTE_DISTANCE_PRECISION", "balanced")
+
+# Named vehicle profiles for the "vehicle" request field; fields left out
+# use the planner defaults (500 mile range, 10 MPG, 30 mile detour)
+VEHICLE_PROFILES = {
+    "semi": {"max_range_miles": 500, "miles_per_gallon": 10, "max_station_distance_miles": 30},
+    "semi_long_range": {"max_range_miles": 1200, "miles_per_gallon": 7, "max_station_distance_miles": 30},
+    "box_truck": {"max_range_miles": 350, "miles_per_gallon": 12, "max_station_distance_miles": 20},
+    "cargo_van": {"max_range_miles": 400, "miles_per_gallon": 18, "max_station_distance_miles": 10},
+}
+
+# Batch planning: trips per request and geocode/routing threads
+ROUTE_BATCH_MAX_TRIPS = int(os.environ.get("ROUTE_BATCH_MAX_TRIPS", "500"))
+ROUTE_BATCH_IO_THREADS = int(os.environ.get("ROUTE_BATCH_IO_THREADS", "4"))
+
+# Job queue (POST /api/jobs/, processed by manage.py run_route_worker):
+# default and maximum result TTL, how often a worker heartbeats a running
+# job, after how long without a heartbeat the job counts as abandoned, and
+# how often an abandoned job is retried
+ROUTE_JOB_RESULT_TTL = 3600
+ROUTE_JOB_MAX_RESULT_TTL = 86400
+ROUTE_JOB_HEARTBEAT_INTERVAL = 30
+ROUTE_JOB_RUNNING_TIMEOUT = 120
+ROUTE_JOB_MAX_ATTEMPTS = 3
+
+# Build the gazetteer and station index when a WSGI/ASGI worker starts
+# instead of on its first request; /api/ready/ reports 503 until done
+ROUTE_PLANNER_PRELOAD = os.environ.get("ROUTE_PLANNER_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# Geocoding and routing provider base URLs; point both at
+# `manage.py run_fake_providers` to run offline
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+OPENROUTESERVICE_URL = os.environ.get("OPENROUTESERVICE_URL", "https://api.openrouteservice.org")
+
+# On-demand profiling of route requests, off while the token is empty:
+# requests carrying it in an X-Route-Profile header run under cProfile
+# and tracemalloc. Reports are kept in the cache for
+# ROUTE_PROFILING_TTL seconds (and written to ROUTE_PROFILING_DIR if set)
+# and served by GET /api/profiles/<response id>/ with the same token
+ROUTE_PROFILING_TOKEN = os.environ.get("ROUTE_PROFILING_TOKEN", "")
+ROUTE_PROFILING_DIR = os.environ.get("ROUTE_PROFILING_DIR")
+ROUTE_PROFILING_TOP = 30
+ROUTE_PROFILING_TTL = 86400
+
 # Logging configuration for better debugging
+# fuel_route logs JSON lines through a non-blocking queue (see
+# fuel_route/logs.py). LOG_LEVEL sets its level; LOG_SAMPLE_DEBUG and
+# LOG_SAMPLE_INFO keep that share of DEBUG/INFO records per request
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATES = {
+    "DEBUG": float(os.environ.get("LOG_SAMPLE_DEBUG", "0.01")),
+    "INFO": float(os.environ.get("LOG_SAMPLE_INFO", "1.0")),
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'fuel_route.logs.JsonFormatter',
+        },
+    },
+    'filters': {
+        'context': {
+            '()': 'fuel_route.logs.ContextFilter',
+        },
+        'sampling': {
+            '()': 'fuel_route.logs.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'structured': {
+            '()': 'fuel_route.logs.QueueingStreamHandler',
+            'formatter': 'json',
+            'filters': ['context', 'sampling'],
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -147,5 +265,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'fuel_route': {
+            'handlers': ['structured'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
     },
 }
@@ -14,10 +14,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+
 from django.contrib import admin
 from django.urls import path
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from fuel_route.async_views import async_fuel_route_view
+from fuel_route.batch import batch_route_view
+from fuel_route.fast_path import route_view as fuel_route_view
+from fuel_route.jobs import job_result_view, job_status_view, submit_job_view
+from fuel_route.metrics import metrics_view
+from fuel_route.profiling import profile_detail_view
 
 def api_info(request):
     """Basic API info endpoint"""
@@ -25,26 +33,17 @@ def api_info(request):
         'message': 'Fuel Route Optimization API',
         'version': '1.0',
         'endpoints': {
-            'route': '/api/route/ (POST)'
+            'route': '/api/route/ (POST, ?stream=true for NDJSON events)',
+            'route_async': '/api/route/async/ (POST, ASGI)',
+            'routes_batch': '/api/routes/batch/ (POST)',
+            'jobs': '/api/jobs/ (POST), /api/jobs/<id>/ (GET), /api/jobs/<id>/result/ (GET)',
+            'cache_stats': '/api/cache/stats/ (GET)',
+            'ready': '/api/ready/ (GET)',
+            'metrics': '/api/metrics (GET, Prometheus format)',
+            'profiles': '/api/profiles/<response id>/ (GET, needs the profiling token)'
         }
     })
 
-@csrf_exempt
-def fuel_route_view(request):
-    """Direct import to avoid circular imports"""
-    from fuel_route.views import FuelRouteView
-    from rest_framework.test import APIRequestFactory
-    from rest_framework.request import Request
-    
-    # Convert Django request to DRF request
-    factory = APIRequestFactory()
-    drf_request = factory.post('/api/route/', request.body, content_type=request.content_type)
-    drf_request = Request(drf_request)
-    drf_request.user = request.user
-    
-    view = FuelRouteView()
-    return view.post(drf_request)
-
 @csrf_exempt
 def simple_route_view(request):
     """Simple route endpoint without DRF to test CSRF"""
@@ -132,12 +131,40 @@ def debug_view(request):
             'error_type': type(e).__name__
         }, status=500)
 
+def cache_stats_view(request):
+    """Cache hit/miss statistics of this worker, per tier and key namespace"""
+    from django.core.cache import cache
+    from fuel_route.normalization import normalization_stats
+    
+    return JsonResponse({
+        'status': 'success',
+        'pid': os.getpid(),
+        'cache': cache.get_stats() if hasattr(cache, 'get_stats') else None,
+        'normalization': normalization_stats.snapshot()
+    })
+
+def ready_view(request):
+    """Readiness probe: 200 once this worker's planner is preloaded and its backends respond"""
+    from fuel_route.planner import get_route_planner
+    
+    status = get_route_planner().readiness()
+    return JsonResponse(status, status=200 if status['ready'] else 503)
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/route/', fuel_route_view, name='fuel_route'),
+    path('api/route/async/', async_fuel_route_view, name='fuel_route_async'),
+    path('api/routes/batch/', batch_route_view, name='routes_batch'),
+    path('api/jobs/', submit_job_view, name='submit_job'),
+    path('api/jobs/<uuid:job_id>/', job_status_view, name='job_status'),
+    path('api/jobs/<uuid:job_id>/result/', job_result_view, name='job_result'),
     path('api/simple-route/', simple_route_view, name='simple_route'),
     path('api/test/', test_api_view, name='test_api'),
     path('api/test-post/', test_post_view, name='test_post'),
     path('api/debug/', debug_view, name='debug'),
+    path('api/cache/stats/', cache_stats_view, name='cache_stats'),
+    path('api/ready/', ready_view, name='ready'),
+    path('api/metrics', metrics_view, name='metrics'),
+    path('api/profiles/<str:profile_id>/', profile_detail_view, name='profile_detail'),
     path('', api_info, name='api_info'),
 ]
\ No newline at end of file
@@ -13,4 +13,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fuel_project.settings')
 
 from django.core.wsgi import get_wsgi_application
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Load station and place data before the worker takes requests
+from fuel_route.planner import preload_route_planner
+
+preload_route_planner()
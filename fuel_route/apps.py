@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class FuelRouteConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'fuel_route'
+
+    def ready(self):
+        # Connect station signal handlers that version cached fuel plans
+        from . import signals  # noqa: F401
+
+        # One planner service per worker process; data is loaded by preload()
+        from .planner import get_route_planner
+        get_route_planner()
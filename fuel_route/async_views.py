@@ -0,0 +1,276 @@
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+from django.conf import settings
+from django.http import JsonResponse
+
+from .coalescing import route_single_flight
+from .gazetteer import get_gazetteer
+from .metrics import in_request_context, provider_errors, stage, timed_view
+from .profiling import profiled_view
+from .refresh import stale_cache
+from .serializers import RouteRequestSerializer
+from .views import NOMINATIM_USER_AGENT, LocationNotFoundError, get_planner, location_labels, location_not_found_message
+
+
+logger = logging.getLogger(__name__)
+
+
+# Station search and stop optimization are CPU/DB bound, so they run here
+# instead of on the event loop
+planner_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ROUTE_PLANNER_THREADS', 4),
+    thread_name_prefix='route-planner'
+)
+
+# Provider HTTP client of the ASGI application, opened and closed by its
+# lifespan (see with_http_client_lifespan) so connections and TLS sessions
+# to Nominatim/ORS are pooled across requests. Held with its event loop.
+_shared_http_client = None
+
+
+async def open_http_client():
+    global _shared_http_client
+    _shared_http_client = (asyncio.get_running_loop(), httpx.AsyncClient())
+
+
+async def close_http_client():
+    global _shared_http_client
+    if _shared_http_client is not None:
+        _, client = _shared_http_client
+        _shared_http_client = None
+        await client.aclose()
+
+
+@asynccontextmanager
+async def provider_client():
+    """
+    The application's shared httpx.AsyncClient, or one closed after the
+    block when there is none for this loop (e.g. under WSGI, where each
+    async request runs in its own event loop)
+    """
+    shared = _shared_http_client
+    if shared is not None and shared[0] is asyncio.get_running_loop() and not shared[1].is_closed:
+        yield shared[1]
+        return
+    async with httpx.AsyncClient() as client:
+        yield client
+
+
+def with_http_client_lifespan(application):
+    """
+    Wrap an ASGI application to handle lifespan events: the shared provider
+    client is opened on startup and closed on shutdown. Django's ASGI
+    handler only serves HTTP, so other scopes are passed through.
+    """
+    async def app(scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await open_http_client()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_http_client()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    return app
+
+
+async def get_gazetteer_async():
+    """
+    get_gazetteer() with a cold build kept off the event loop, where its
+    station query would raise SynchronousOnlyOperation
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(planner_executor, get_gazetteer)
+
+
+async def geocode_location_async(client, planner, gazetteer, location_string):
+    """
+    Async counterpart of FuelRouteView.geocode_location.
+    Shares the geocode cache with the sync view.
+    """
+    # "City, ST" inputs resolve from the offline gazetteer
+    coords = gazetteer.lookup(location_string)
+    if coords:
+        return coords
+
+    try:
+        cache_key = planner.get_geocode_cache_key(location_string)
+        cached_coords = await stale_cache.aget(
+            cache_key, refresh=lambda: planner.geocode_from_provider(location_string)
+        )
+        if cached_coords:
+            return cached_coords
+
+        start = time.monotonic()
+        response = await client.get(
+            f"{settings.NOMINATIM_URL.rstrip('/')}/search",
+            params={'q': f"{location_string}, USA", 'format': 'json', 'limit': 1},
+            headers={'User-Agent': NOMINATIM_USER_AGENT},
+            timeout=10
+        )
+        if response.status_code != 200:
+            provider_errors.inc(provider='nominatim', error=f'http_{response.status_code}')
+        response.raise_for_status()
+        results = response.json()
+
+        if results:
+            coords = (float(results[0]['lat']), float(results[0]['lon']))
+            # Cache geocoding result for 24 hours
+            try:
+                await stale_cache.aset(cache_key, coords, 86400, time.monotonic() - start)
+            except Exception as e:
+                logger.warning("Error caching geocode result: %s", e)
+            return coords
+
+    except Exception as e:
+        if isinstance(e, httpx.TransportError):
+            provider_errors.inc(provider='nominatim', error=type(e).__name__)
+        logger.warning("Geocoding error for %r: %s", location_string, e)
+
+    return None
+
+
+async def get_route_async(client, planner, start_coords, end_coords, via_coords=()):
+    """
+    Async counterpart of FuelRouteView.get_route_from_openrouteservice.
+    Falls back to a straight-line route on any failure.
+    """
+    url, headers, body = planner.get_openrouteservice_request(start_coords, end_coords, via_coords)
+
+    try:
+        if headers:
+            response = await client.post(url, json=body, headers=headers, timeout=15)
+
+            if response.status_code == 200:
+                return planner.parse_openrouteservice_response(response.json())
+            else:
+                provider_errors.inc(provider='openrouteservice', error=f'http_{response.status_code}')
+                logger.warning("OpenRouteService API error: %s - %s", response.status_code, response.text)
+        else:
+            logger.info("No OpenRouteService API key found, using fallback route")
+
+    except Exception as e:
+        provider_errors.inc(provider='openrouteservice', error=type(e).__name__)
+        logger.warning("OpenRouteService API request failed: %s", e)
+
+    return planner.create_fallback_route(start_coords, end_coords, via_coords)
+
+
+async def compute_route_response_async(planner, start_location, end_location, waypoints=()):
+    """
+    Async counterpart of FuelRouteView.compute_route_response.
+    Raises LocationNotFoundError for bad locations.
+    """
+    geometry_key = planner.get_geometry_cache_key(start_location, end_location, waypoints)
+    route_data = await stale_cache.aget(
+        geometry_key,
+        refresh=lambda: planner.fetch_route_geometry(start_location, end_location, waypoints)
+    )
+
+    if not route_data:
+        start = time.monotonic()
+        locations = [start_location, *waypoints, end_location]
+        gazetteer = await get_gazetteer_async()
+        async with provider_client() as client:
+            with stage('geocode'):
+                coords = await asyncio.gather(*(
+                    geocode_location_async(client, planner, gazetteer, location) for location in locations
+                ))
+
+            for label, location, found in zip(location_labels(len(locations)), locations, coords):
+                if not found:
+                    raise LocationNotFoundError(location_not_found_message(label, location))
+
+            with stage('routing'):
+                route_data = await get_route_async(client, planner, coords[0], coords[-1], coords[1:-1])
+
+        try:
+            await stale_cache.aset(
+                geometry_key, route_data, planner.get_geometry_cache_timeout(route_data),
+                time.monotonic() - start
+            )
+        except Exception as e:
+            logger.warning("Error caching route geometry: %s", e)
+
+    # Corridor search, price lookup and optimization are CPU/DB bound
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        planner_executor, in_request_context(planner.plan_route), start_location, end_location, route_data, waypoints
+    )
+
+
+@profiled_view
+@timed_view('route_async')
+async def async_fuel_route_view(request):
+    """
+    Async version of the route endpoint for ASGI deployments.
+
+    POST /api/route/async/ accepts the same payload as /api/route/.
+    Geocoding and routing use non-blocking HTTP so one worker can keep many
+    slow provider requests in flight; station search and optimization run
+    in a thread pool. CSRF middleware is not installed, so no csrf_exempt
+    (which is sync-only in Django 4.2) is needed here.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+    try:
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+        serializer = RouteRequestSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        start_location = serializer.validated_data['start_location'].strip()
+        end_location = serializer.validated_data['end_location'].strip()
+        waypoints = tuple(serializer.validated_data.get('waypoints', ()))
+
+        planner = get_planner().with_vehicle(serializer.validated_data.get('vehicle') or {})
+        loop = asyncio.get_running_loop()
+        if getattr(settings, 'ROUTE_REQUEST_LOG', None):
+            # File write, kept off the event loop
+            await loop.run_in_executor(
+                planner_executor, planner.log_route_request, start_location, end_location, waypoints
+            )
+        planner.record_lane_normalization(start_location, end_location)
+
+        # Check cache for existing result (plan keys need the station epochs)
+        cached_response = await loop.run_in_executor(
+            planner_executor, in_request_context(planner.get_cached_response), start_location, end_location, waypoints
+        )
+        if cached_response:
+            return JsonResponse(cached_response)
+
+        # Identical concurrent requests share one computation, keyed by the
+        # plan key so a result computed under older station epochs is not shared
+        plan_key = await loop.run_in_executor(
+            planner_executor, planner.get_plan_cache_key, start_location, end_location, waypoints
+        )
+        try:
+            response_data = await route_single_flight.ado(
+                plan_key,
+                lambda: compute_route_response_async(planner, start_location, end_location, waypoints)
+            )
+        except LocationNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        return JsonResponse(response_data)
+
+    except Exception as e:
+        logger.exception("Unexpected error in async route optimization: %s", e)
+        return JsonResponse(
+            {'error': 'An unexpected error occurred while processing your request. Please try again.'},
+            status=500
+        )
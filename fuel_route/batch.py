@@ -0,0 +1,199 @@
+"""
+Batch route planning for fleet dispatch.
+
+POST /api/routes/batch/
+{
+    "trips": [
+        {"start_location": "Chicago, IL", "end_location": "Denver, CO"},
+        {"start_location": "Chicago, IL", "end_location": "Denver, CO",
+         "waypoints": ["Omaha, NE"]},
+        {"start_location": "Chicago, IL", "end_location": "Denver, CO",
+         "vehicle": {"max_range_miles": 600, "miles_per_gallon": 7}}
+    ]
+}
+
+Each distinct location is geocoded once and each distinct lane routed
+once, corridor candidates come from the shared station index once per
+lane and search width. Geocoding and routing overlap in a thread pool
+shared by the worker's batches; the per-trip optimization is pure Python and runs serially, since
+threads would only contend for the GIL (plan_routes spreads it over
+processes for large offline runs).
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from .metrics import in_request_context
+from .normalization import normalize_location
+from .serializers import RouteRequestSerializer
+from .station_index import get_station_index
+from .views import LocationNotFoundError, get_planner, location_labels, location_not_found_message
+
+
+logger = logging.getLogger(__name__)
+
+
+# Geocoding and routing calls of all batches in this worker
+batch_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ROUTE_BATCH_IO_THREADS', 4),
+    thread_name_prefix='route-batch'
+)
+
+
+def plan_batch(trips, planner=None):
+    """
+    Plan a list of trip dicts.
+    Returns (results, errors, summary); results is in trip order with None
+    for failed trips, errors lists {'index', 'error'} per failed trip.
+    """
+    planner = planner or get_planner()
+    results = [None] * len(trips)
+    errors = []
+    pending = []
+    cached_count = 0
+
+    # Validate trips and answer the ones with a cached fuel plan
+    for index, trip in enumerate(trips):
+        serializer = RouteRequestSerializer(data=trip)
+        if not serializer.is_valid():
+            errors.append({'index': index, 'error': serializer.errors})
+            continue
+
+        start_location = serializer.validated_data['start_location'].strip()
+        end_location = serializer.validated_data['end_location'].strip()
+        waypoints = tuple(serializer.validated_data.get('waypoints', ()))
+        trip_planner = planner.with_vehicle(serializer.validated_data.get('vehicle') or {})
+
+        cached_response = trip_planner.get_cached_response(start_location, end_location, waypoints)
+        if cached_response:
+            results[index] = cached_response
+            cached_count += 1
+        else:
+            pending.append((index, start_location, end_location, waypoints, trip_planner))
+
+    # Geocode each distinct location once
+    locations = {}
+    for _, start_location, end_location, waypoints, _ in pending:
+        for location in (start_location, *waypoints, end_location):
+            locations.setdefault(normalize_location(location), location)
+
+    # Pool threads run in a copy of this context, keeping the request's log fields
+    geocoded = [batch_executor.submit(in_request_context(planner.geocode_location), location)
+                for location in locations.values()]
+    coordinates = dict(zip(locations, (future.result() for future in geocoded)))
+
+    # Route each distinct lane once
+    lanes = {}
+    for index, start_location, end_location, waypoints, _ in pending:
+        lane_hash = planner.get_lane_hash(start_location, end_location, waypoints)
+        if lane_hash in lanes:
+            continue
+        trip_locations = (start_location, *waypoints, end_location)
+        missing = [
+            (label, location)
+            for label, location in zip(location_labels(len(trip_locations)), trip_locations)
+            if not coordinates[normalize_location(location)]
+        ]
+        if missing:
+            lanes[lane_hash] = LocationNotFoundError(location_not_found_message(*missing[0]))
+        else:
+            lanes[lane_hash] = batch_executor.submit(
+                in_request_context(planner.get_route_geometry), start_location, end_location, waypoints,
+                [coordinates[normalize_location(location)] for location in trip_locations]
+            )
+
+    geometries = {}
+    for lane_hash, lane in lanes.items():
+        try:
+            if isinstance(lane, Exception):
+                raise lane
+            geometries[lane_hash] = lane.result()
+        except Exception as e:
+            geometries[lane_hash] = e
+
+    # Corridor candidates once per lane and search width from the shared index
+    get_station_index()
+    corridors = {}
+    jobs = []
+    for index, start_location, end_location, waypoints, trip_planner in pending:
+        lane_hash = planner.get_lane_hash(start_location, end_location, waypoints)
+        route_data = geometries[lane_hash]
+        if isinstance(route_data, Exception):
+            message = str(route_data) if isinstance(route_data, LocationNotFoundError) else 'Routing failed for this trip'
+            errors.append({'index': index, 'error': message})
+            continue
+
+        corridor_key = (lane_hash, trip_planner.max_station_distance_miles)
+        if corridor_key not in corridors:
+            try:
+                corridors[corridor_key] = trip_planner.get_corridor_stations(
+                    start_location, end_location, route_data, waypoints
+                )
+            except Exception as e:
+                logger.warning("Error getting fuel stations: %s", e)
+                corridors[corridor_key] = []
+        jobs.append((
+            index, start_location, end_location, waypoints, trip_planner, route_data, corridors[corridor_key]
+        ))
+
+    # Optimization is CPU bound, so it runs in this thread
+    for index, start_location, end_location, waypoints, trip_planner, route_data, nearby_stations in jobs:
+        try:
+            results[index] = trip_planner.build_route_plan(route_data, nearby_stations)
+        except Exception as e:
+            logger.exception("Error planning batch trip %s: %s", index, e)
+            errors.append({'index': index, 'error': 'An unexpected error occurred while planning this trip'})
+            continue
+        try:
+            trip_planner.cache_response(start_location, end_location, results[index], waypoints=waypoints)
+        except Exception as e:
+            logger.warning("Error caching response: %s", e)
+
+    errors.sort(key=lambda error: error['index'])
+    summary = {
+        'trips': len(trips),
+        'succeeded': len(trips) - len(errors),
+        'failed': len(errors),
+        'cached': cached_count,
+        'unique_locations': len(locations),
+        'unique_lanes': len(lanes),
+    }
+    return results, errors, summary
+
+
+@csrf_exempt
+def batch_route_view(request):
+    """Plan many trips in one request; see module docstring for the payload"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    trips = data.get('trips') if isinstance(data, dict) else None
+    if not isinstance(trips, list) or not trips:
+        return JsonResponse({'error': 'trips must be a non-empty list'}, status=400)
+
+    max_trips = getattr(settings, 'ROUTE_BATCH_MAX_TRIPS', 500)
+    if len(trips) > max_trips:
+        return JsonResponse({'error': f'A batch can contain at most {max_trips} trips'}, status=400)
+
+    try:
+        started = time.monotonic()
+        results, errors, summary = plan_batch(trips)
+        summary['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+    except Exception as e:
+        logger.exception("Unexpected error in batch route optimization: %s", e)
+        return JsonResponse(
+            {'error': 'An unexpected error occurred while processing your request. Please try again.'},
+            status=500
+        )
+
+    return JsonResponse({'results': results, 'errors': errors, 'summary': summary})
@@ -0,0 +1,462 @@
+"""
+Offline benchmark of the route pipeline.
+
+Runs FuelRouteView's real pipeline (geocode, routing, station search,
+optimize, serialize) on fixed-seed synthetic routes of 100-3,000 miles
+with stubbed geocoding and routing providers, over the OPIS station
+dataset (or a generated station snapshot), and reports p50/p95 latency
+per stage and end to end. Used by the benchmark_routes command; nothing
+here calls the network or the station database. With live_providers the
+real HTTP clients are used instead of the stubs, against the provider
+URLs in settings (normally run_fake_providers, see fake_providers.py).
+
+OPIS rows have no coordinates, so each station is placed in its city
+from the shipped place file or, failing that, at a stable point inside
+its state's bounding box (derived from a hash of the city name).
+Stations outside the place file's states (Canada) are skipped.
+"""
+import csv
+import hashlib
+import math
+import os
+import random
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from . import fast_json
+from .distance import MEAN_RADIUS_MILES, MODES, DistancePrecision, sphere_miles
+from .gazetteer import load_place_file
+from .metrics import collect_stages, provider_errors, stage
+from .views import FuelRouteView, LocationNotFoundError
+
+
+DEFAULT_DATASET = Path(settings.BASE_DIR) / 'fuel-prices-for-be-assessment (1).csv'
+
+STAGES = ('cache', 'geocode', 'routing', 'station_search', 'optimize', 'serialize')
+
+# Start points and destinations stay inside the continental US
+CONUS_LATITUDES = (29.0, 48.5)
+CONUS_LONGITUDES = (-123.0, -71.0)
+
+METERS_PER_MILE = 1609.344
+
+
+def stable_fraction(text):
+    """Deterministic number in [0, 1) for a string"""
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16) / 0x100000000
+
+
+def destination_point(origin, bearing_degrees, distance_miles):
+    """Point reached from origin along a great circle"""
+    lat1, lon1 = map(math.radians, origin)
+    bearing = math.radians(bearing_degrees)
+    angle = distance_miles / MEAN_RADIUS_MILES
+    lat2 = math.asin(math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(bearing))
+    lon2 = lon1 + math.atan2(
+        math.sin(bearing) * math.sin(angle) * math.cos(lat1),
+        math.cos(angle) - math.sin(lat1) * math.sin(lat2)
+    )
+    return (math.degrees(lat2), math.degrees(lon2))
+
+
+def in_conus(point):
+    return (CONUS_LATITUDES[0] <= point[0] <= CONUS_LATITUDES[1] and
+            CONUS_LONGITUDES[0] <= point[1] <= CONUS_LONGITUDES[1])
+
+
+def random_route(rng, min_miles=100, max_miles=3000):
+    """(start, end, straight-line miles) of a random route inside the contiguous US"""
+    while True:
+        start = (rng.uniform(*CONUS_LATITUDES), rng.uniform(*CONUS_LONGITUDES))
+        distance = rng.uniform(min_miles, max_miles)
+        end = destination_point(start, rng.uniform(0, 360), distance)
+        if in_conus(end):
+            return start, end, distance
+
+
+def synthetic_routes(count, seed=42, min_miles=100, max_miles=3000):
+    """
+    `count` routes as dicts with start/end names and coordinates and the
+    straight-line distance, the same for the same seed
+    """
+    rng = random.Random(seed)
+    routes = []
+    while len(routes) < count:
+        start, end, distance = random_route(rng, min_miles, max_miles)
+        number = len(routes)
+        routes.append({
+            'start_location': f'Benchmark origin {seed}-{number}',
+            'end_location': f'Benchmark destination {seed}-{number}',
+            'start': start,
+            'end': end,
+            'miles': round(distance, 1),
+        })
+    return routes
+
+
+def route_polyline(points, spacing_miles=50):
+    """
+    Deterministic road-like [lng, lat] polyline through points: one vertex
+    every spacing_miles with a small sideways wobble, like a simplified
+    ORS geometry. Returns (coordinates, distance in meters, leg distances).
+    """
+    coordinates = []
+    leg_meters = []
+    for leg_start, leg_end in zip(points, points[1:]):
+        straight = sphere_miles(leg_start, leg_end)
+        steps = max(2, int(straight / spacing_miles))
+        leg = []
+        for step in range(0 if not coordinates else 1, steps + 1):
+            ratio = step / steps
+            lat = leg_start[0] + (leg_end[0] - leg_start[0]) * ratio
+            lng = leg_start[1] + (leg_end[1] - leg_start[1]) * ratio
+            if 0 < step < steps:
+                wobble = stable_fraction(f'{lat:.4f},{lng:.4f}') - 0.5
+                lat += wobble * 0.3
+                lng += wobble * 0.3
+            leg.append([lng, lat])
+        previous = coordinates[-1] if coordinates else leg[0]
+        meters = 0.0
+        for vertex in leg:
+            meters += sphere_miles((previous[1], previous[0]), (vertex[1], vertex[0])) * METERS_PER_MILE
+            previous = vertex
+        coordinates.extend(leg)
+        leg_meters.append(meters)
+    return coordinates, sum(leg_meters), leg_meters
+
+
+def directions_geojson(points, spacing_miles=50):
+    """OpenRouteService v2/directions geojson body for a route through points"""
+    coordinates, distance, leg_meters = route_polyline(points, spacing_miles)
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': coordinates},
+            'properties': {
+                'summary': {'distance': round(distance, 1), 'duration': round(distance / 26.8, 1)},
+                'segments': [
+                    {'distance': round(meters, 1), 'duration': round(meters / 26.8, 1)} for meters in leg_meters
+                ],
+            },
+        }],
+    }
+
+
+class StubLocation:
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class StubGeolocator:
+    """Stands in for geopy's Nominatim; knows the benchmark route endpoints"""
+
+    def __init__(self, places):
+        self.places = places
+
+    def geocode(self, query, timeout=None):
+        coords = self.places.get(query.rsplit(', USA', 1)[0])
+        return StubLocation(*coords) if coords else None
+
+
+class StubResponse:
+    status_code = 200
+    text = ''
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class StubSession:
+    """Stands in for the OpenRouteService requests session"""
+
+    def __init__(self, spacing_miles=50):
+        self.spacing_miles = spacing_miles
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        points = [(lat, lng) for lng, lat in json['coordinates']]
+        return StubResponse(directions_geojson(points, self.spacing_miles))
+
+
+class BenchmarkPlanner(FuelRouteView):
+    """
+    FuelRouteView searching a given station index instead of the database.
+    Prices are those of the index, remembered for the stations a corridor
+    search returned.
+    """
+
+    def __init__(self, station_index, **kwargs):
+        super().__init__(**kwargs)
+        self.station_index = station_index
+        self.prices = {}
+
+    def get_nearby_fuel_stations(self, route_coordinates, max_distance_miles=None):
+        stations = self.station_index.corridor(route_coordinates, max_distance_miles or self.max_station_distance_miles)
+        for station in stations:
+            self.prices[station['id']] = station['retail_price']
+        return stations
+
+    def get_station_prices(self, station_ids):
+        return {station_id: self.prices[station_id] for station_id in station_ids if station_id in self.prices}
+
+
+def load_opis_stations(path=DEFAULT_DATASET):
+    """Station rows (STATION_FIELDS) for the OPIS price file, placed as described above"""
+    places = {}
+    bounds = {}
+    for city, state, latitude, longitude in load_place_file():
+        places[(city.lower(), state)] = (latitude, longitude)
+        lat_min, lat_max, lon_min, lon_max = bounds.get(state, (latitude, latitude, longitude, longitude))
+        bounds[state] = (min(lat_min, latitude), max(lat_max, latitude), min(lon_min, longitude), max(lon_max, longitude))
+
+    stations = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            city, state = row['City'].strip(), row['State'].strip()
+            coords = places.get((city.lower(), state))
+            if coords is None:
+                if state not in bounds:
+                    continue
+                lat_min, lat_max, lon_min, lon_max = bounds[state]
+                coords = (
+                    lat_min - 0.5 + (lat_max - lat_min + 1.0) * stable_fraction(f'{city}|{state}|lat'),
+                    lon_min - 0.5 + (lon_max - lon_min + 1.0) * stable_fraction(f'{city}|{state}|lon'),
+                )
+            stations.append({
+                'id': len(stations) + 1,
+                'name': row['Truckstop Name'].strip(),
+                'address': row['Address'].strip(),
+                'city': city,
+                'state': state,
+                'retail_price': float(row['Retail Price']),
+                'latitude': coords[0],
+                'longitude': coords[1],
+                'rack_id': int(row['Rack ID'] or 0),
+            })
+    return stations
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(values):
+    """Latency summary in milliseconds for a list of seconds"""
+    if not values:
+        return None
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        'max_ms': round(max(values) * 1000, 3),
+    }
+
+
+def run_route(planner, route):
+    """Plan one route cold; returns (stage seconds, end-to-end seconds, response)"""
+    started = time.perf_counter()
+    with collect_stages() as stages:
+        response_data = planner.get_cached_response(route['start_location'], route['end_location'])
+        if not response_data:
+            response_data = planner.compute_route_response(route['start_location'], route['end_location'])
+        with stage('serialize'):
+            fast_json.dumps(response_data)
+    return stages, time.perf_counter() - started, response_data
+
+
+def provider_error_counts():
+    return {f'{dict(labels)["provider"]}:{dict(labels)["error"]}': value for _, labels, value in provider_errors.samples()}
+
+
+def run_benchmark(station_index, routes, spacing_miles=50, warmup=3, progress=None, live_providers=False):
+    """
+    Plan every route and return the report dict. Providers are stubbed
+    unless live_providers; then lane names start with their coordinates,
+    which the fake Nominatim resolves exactly. Routes failing to geocode
+    are counted in 'errors' and left out of the latencies.
+    The caller is expected to point the default cache at a private backend.
+    """
+    if live_providers:
+        routes = [
+            {**route,
+             'start_location': f"{route['start'][0]:.6f},{route['start'][1]:.6f} {route['start_location']}",
+             'end_location': f"{route['end'][0]:.6f},{route['end'][1]:.6f} {route['end_location']}"}
+            for route in routes
+        ]
+
+    # Warmup runs use their own lane names so the measured routes stay cold
+    warmup_routes = [
+        {**route, 'start_location': f"{route['start_location']} warmup",
+         'end_location': f"{route['end_location']} warmup"}
+        for route in routes[:warmup]
+    ]
+    places = {}
+    for route in routes + warmup_routes:
+        places[route['start_location']] = route['start']
+        places[route['end_location']] = route['end']
+
+    if live_providers:
+        planner = BenchmarkPlanner(station_index)
+    else:
+        planner = BenchmarkPlanner(
+            station_index,
+            geolocator=StubGeolocator(places),
+            http_session=StubSession(spacing_miles),
+        )
+    errors_before = provider_error_counts()
+    errors = {}
+
+    # Headers are only sent (and the stub session used) with an API key
+    previous_key = os.environ.get('OPENROUTE_API_KEY')
+    os.environ['OPENROUTE_API_KEY'] = 'benchmark'
+    try:
+        for route in warmup_routes:
+            try:
+                run_route(planner, route)
+            except LocationNotFoundError:
+                pass
+
+        stage_values = {name: [] for name in STAGES}
+        totals = []
+        by_distance = {}
+        for number, route in enumerate(routes, 1):
+            try:
+                stages, total, response_data = run_route(planner, route)
+            except LocationNotFoundError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            for name, seconds in stages.items():
+                stage_values.setdefault(name, []).append(seconds)
+            totals.append(total)
+            band = f"{int(route['miles'] // 500) * 500}-{int(route['miles'] // 500) * 500 + 500}"
+            by_distance.setdefault(band, []).append(total)
+            if progress:
+                progress(number, route, total, response_data)
+    finally:
+        if previous_key is None:
+            os.environ.pop('OPENROUTE_API_KEY', None)
+        else:
+            os.environ['OPENROUTE_API_KEY'] = previous_key
+
+    errors_after = provider_error_counts()
+    return {
+        'errors': errors,
+        'provider_errors': {
+            key: value - errors_before.get(key, 0)
+            for key, value in errors_after.items() if value > errors_before.get(key, 0)
+        },
+        'stages': {name: summarize(values) for name, values in stage_values.items() if values},
+        'end_to_end': summarize(totals),
+        'by_distance_miles': {
+            band: summarize(values) for band, values in sorted(by_distance.items(), key=lambda item: int(item[0].split('-')[0]))
+        },
+    }
+
+
+def distance_workloads(count=2000, seed=42, limit=30, samples=20):
+    """
+    Point sets for run_distance_benchmark, the same for the same seed:
+    'nearest' (a station up to 2 * limit miles off a straight route and
+    the route's sample points, like a corridor search), 'segment' (pairs
+    up to 60 miles apart, like polyline segments) and 'leg' (pairs
+    100-3,000 miles apart, like fallback route legs)
+    """
+    rng = random.Random(seed)
+    nearest = []
+    for _ in range(count):
+        start, end, _ = random_route(rng)
+        points = [
+            (start[0] + (end[0] - start[0]) * step / samples, start[1] + (end[1] - start[1]) * step / samples)
+            for step in range(samples + 1)
+        ]
+        ratio = rng.random()
+        base = (start[0] + (end[0] - start[0]) * ratio, start[1] + (end[1] - start[1]) * ratio)
+        nearest.append((destination_point(base, rng.uniform(0, 360), rng.uniform(0, 2 * limit)), points))
+
+    def pairs(min_miles, max_miles):
+        return [
+            (start, destination_point(start, rng.uniform(0, 360), rng.uniform(min_miles, max_miles)))
+            for start in ((rng.uniform(*CONUS_LATITUDES), rng.uniform(*CONUS_LONGITUDES)) for _ in range(count))
+        ]
+
+    return {'nearest': nearest, 'segment': pairs(0.1, 60), 'leg': pairs(100, 3000)}
+
+
+def run_distance_benchmark(count=2000, seed=42, limit=30):
+    """
+    Speed and error of every distance precision mode on distance_workloads.
+    Errors are against the exact mode; limit_mismatches counts nearest
+    distances on the other side of `limit` than the exact one (always 0
+    unless an error bound is wrong).
+    """
+    workloads = distance_workloads(count, seed, limit)
+    results = {}
+    for name, items in workloads.items():
+        values = {}
+        for mode in reversed(MODES):
+            precision = DistancePrecision(mode)
+            exact_calls = 0
+            started = time.perf_counter()
+            if name == 'nearest':
+                mode_values = []
+                for point, others in items:
+                    miles, calls = precision.nearest(point, others, limit)
+                    mode_values.append(miles)
+                    exact_calls += calls
+            else:
+                mode_values = [precision.miles(point_a, point_b) for point_a, point_b in items]
+            seconds = time.perf_counter() - started
+            values[mode] = mode_values
+
+            reference = values['exact']
+            errors = [abs(value - exact) for value, exact in zip(mode_values, reference)]
+            results.setdefault(name, {})[mode] = {
+                'calls': len(items),
+                'us_per_call': round(seconds / len(items) * 1e6, 3),
+                'speedup': round(results[name]['exact']['us_per_call'] / (seconds / len(items) * 1e6), 2)
+                if mode != 'exact' else 1.0,
+                'max_error_miles': round(max(errors), 6),
+                'max_relative_error': max(error / exact for error, exact in zip(errors, reference) if exact > 0),
+                'exact_per_call': round(exact_calls / len(items), 3) if name == 'nearest' else None,
+                'limit_mismatches': sum(
+                    (value <= limit) != (exact <= limit) for value, exact in zip(mode_values, reference)
+                ) if name == 'nearest' else None,
+            }
+    return results
+
+
+def compare_reports(baseline, current, threshold=0.10, min_delta_ms=0.05):
+    """
+    Regressions of current against baseline: every stage / end-to-end
+    p50 or p95 that grew by more than `threshold` (fraction) and at least
+    min_delta_ms. Returns (rows, regressions); rows cover every metric.
+    """
+    rows = []
+    pairs = [('end_to_end', baseline.get('end_to_end'), current.get('end_to_end'))]
+    for name in sorted(set(baseline.get('stages', {})) | set(current.get('stages', {}))):
+        pairs.append((name, baseline.get('stages', {}).get(name), current.get('stages', {}).get(name)))
+
+    for name, before, after in pairs:
+        if not before or not after:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            delta = after[metric] - before[metric]
+            change = delta / before[metric] if before[metric] else 0.0
+            rows.append({
+                'name': name,
+                'metric': metric,
+                'baseline': before[metric],
+                'current': after[metric],
+                'change': round(change, 4),
+                'regression': change > threshold and delta >= min_delta_ms,
+            })
+    return rows, [row for row in rows if row['regression']]
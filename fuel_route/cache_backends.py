@@ -0,0 +1,380 @@
+"""
+Cache backends for the route pipeline.
+
+TwoTierCache keeps a small bounded LRU in each worker process in front of
+a cache alias shared by all workers (SQLiteCache by default, or Django's
+RedisCache when REDIS_URL is configured). Entries are serialized with
+CompactSerializer, which compresses large payloads such as route geometry.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+
+# Largest value SQLite will sort correctly; used for "never expires"
+NEVER_EXPIRES = 1e18
+
+# Django creates cache instances per thread, so the in-process tier and its
+# statistics live at module level (as LocMemCache does) to be shared by all
+# threads of a worker
+_l1_stores = {}
+_l1_locks = {}
+_l1_stats = {}
+
+
+class CompactSerializer:
+    """
+    Pickle serializer that zlib-compresses payloads above a size threshold.
+    Compatible with the ``serializer`` option of Django's RedisCache.
+    """
+
+    def __init__(self, protocol=None, compress_threshold=1024):
+        self.protocol = pickle.HIGHEST_PROTOCOL if protocol is None else protocol
+        self.compress_threshold = compress_threshold
+
+    def dumps(self, obj):
+        # Plain ints stay unpickled so Redis INCR keeps working
+        if type(obj) is int:
+            return obj
+        data = pickle.dumps(obj, self.protocol)
+        if len(data) > self.compress_threshold:
+            return b'z' + zlib.compress(data, 6)
+        return b'p' + data
+
+    def loads(self, data):
+        try:
+            return int(data)
+        except ValueError:
+            pass
+        if data[:1] == b'z':
+            return pickle.loads(zlib.decompress(data[1:]))
+        return pickle.loads(data[1:])
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters per cache tier and key namespace"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._tiers = {}
+            self._namespaces = {}
+
+    @staticmethod
+    def namespace(key):
+        """Key namespace is the prefix before the first underscore (route, geocode, ...)"""
+        key = str(key)
+        return key.split('_', 1)[0] if '_' in key else 'other'
+
+    def record(self, tier, key, hit):
+        outcome = 'hits' if hit else 'misses'
+        namespace = self.namespace(key)
+        with self._lock:
+            tier_stats = self._tiers.setdefault(tier, {'hits': 0, 'misses': 0})
+            tier_stats[outcome] += 1
+            ns_stats = self._namespaces.setdefault(namespace, {})
+            ns_tier = ns_stats.setdefault(tier, {'hits': 0, 'misses': 0})
+            ns_tier[outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            tiers = {
+                tier: {**counts, 'hit_ratio': _ratio(counts)}
+                for tier, counts in self._tiers.items()
+            }
+            namespaces = {
+                namespace: {
+                    tier: {**counts, 'hit_ratio': _ratio(counts)}
+                    for tier, counts in ns_tiers.items()
+                }
+                for namespace, ns_tiers in self._namespaces.items()
+            }
+        return {'tiers': tiers, 'namespaces': namespaces}
+
+
+def _ratio(counts):
+    total = counts['hits'] + counts['misses']
+    return round(counts['hits'] / total, 4) if total else 0.0
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache stored in a local SQLite file, shared by every worker on the host.
+    Needs no external service; LOCATION is the database file path.
+    """
+
+    cull_interval = 256
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._local = threading.local()
+        self._writes = 0
+        self.serializer = CompactSerializer(
+            compress_threshold=options.get('COMPRESS_THRESHOLD', 1024)
+        )
+
+    def _connection(self):
+        # Connections are per thread and re-opened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expiry(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return NEVER_EXPIRES if expires is None else expires
+
+    def get_with_expiry(self, key, default=None, version=None):
+        """Return (value, expires_at); expires_at is None on a miss"""
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT value, expires FROM cache_entries WHERE key = ? AND expires > ?',
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return default, None
+        return self.serializer.loads(row[0]), row[1]
+
+    def get(self, key, default=None, version=None):
+        return self.get_with_expiry(key, default, version)[0]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+            (key, self._blob(value), self._expiry(timeout))
+        )
+        self._maybe_cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # Insert, or take over a row that has already expired
+        cursor = self._connection().execute(
+            'INSERT INTO cache_entries (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache_entries.expires <= ?',
+            (key, self._blob(value), self._expiry(timeout), time.time())
+        )
+        self._maybe_cull()
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache_entries SET expires = ? WHERE key = ? AND expires > ?',
+            (self._expiry(timeout), key, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache_entries WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        now = time.time()
+        # Ints are stored as SQLite integers, so the increment is a single
+        # UPDATE; the write transaction also covers reading the result back
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute(
+                "UPDATE cache_entries SET value = value + ? "
+                "WHERE key = ? AND expires > ? AND typeof(value) = 'integer'",
+                (delta, key, now)
+            )
+            row = conn.execute(
+                'SELECT value FROM cache_entries WHERE key = ? AND expires > ?', (key, now)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found.")
+            if cursor.rowcount:
+                value = row[0]
+            else:
+                # Pickled by an older version
+                value = self.serializer.loads(row[0]) + delta
+                conn.execute('UPDATE cache_entries SET value = ? WHERE key = ?', (value, key))
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return value
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+    def _blob(self, value):
+        # Ints stay raw (as for Redis) and are stored as SQLite integers
+        return self.serializer.dumps(value)
+
+    def _maybe_cull(self):
+        self._writes += 1
+        if self._writes % self.cull_interval:
+            return
+        conn = self._connection()
+        conn.execute('DELETE FROM cache_entries WHERE expires <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count > self._max_entries:
+            # Drop the entries closest to expiry
+            excess = count - self._max_entries + self._max_entries // self._cull_frequency
+            conn.execute(
+                'DELETE FROM cache_entries WHERE key IN '
+                '(SELECT key FROM cache_entries ORDER BY expires LIMIT ?)',
+                (excess,)
+            )
+
+
+class TwoTierCache(BaseCache):
+    """
+    Bounded in-process LRU (L1) in front of a shared cache alias (L2).
+
+    OPTIONS:
+        SHARED_ALIAS         alias in CACHES used as the shared tier
+        L1_MAX_ENTRIES       LRU size per worker process
+        L1_TIMEOUT           max seconds an entry lives in L1, bounds cross-worker staleness
+        L1_EXCLUDE_PREFIXES  keys that must always be read from the shared tier (locks)
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED_ALIAS', 'shared')
+        self._l1_max_entries = options.get('L1_MAX_ENTRIES', 1000)
+        self._l1_timeout = options.get('L1_TIMEOUT', 60)
+        self._l1_exclude = tuple(options.get('L1_EXCLUDE_PREFIXES', ('singleflight_',)))
+        name = location or self._shared_alias
+        self._l1 = _l1_stores.setdefault(name, OrderedDict())
+        self._lock = _l1_locks.setdefault(name, threading.Lock())
+        self.stats = _l1_stats.setdefault(name, CacheStats())
+
+    @cached_property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _use_l1(self, key):
+        return not str(key).startswith(self._l1_exclude)
+
+    def _l1_get(self, l1_key):
+        with self._lock:
+            entry = self._l1.get(l1_key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires <= time.time():
+                del self._l1[l1_key]
+                return None
+            self._l1.move_to_end(l1_key)
+        return entry
+
+    def _l1_set(self, l1_key, value, expires):
+        expires = min(expires, time.time() + self._l1_timeout)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1[l1_key] = (expires, data)
+            self._l1.move_to_end(l1_key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, l1_key):
+        with self._lock:
+            self._l1.pop(l1_key, None)
+
+    def get_stats(self):
+        """Hit/miss counters of this worker, per tier and key namespace"""
+        stats = self.stats.snapshot()
+        stats['l1_entries'] = len(self._l1)
+        stats['shared_backend'] = type(self.shared).__name__
+        return stats
+
+    def get(self, key, default=None, version=None):
+        use_l1 = self._use_l1(key)
+        l1_key = self.make_and_validate_key(key, version=version)
+
+        if use_l1:
+            entry = self._l1_get(l1_key)
+            self.stats.record('l1', key, entry is not None)
+            if entry is not None:
+                return pickle.loads(entry[1])
+
+        missing = object()
+        if hasattr(self.shared, 'get_with_expiry'):
+            value, expires = self.shared.get_with_expiry(key, missing, version=version)
+        else:
+            value = self.shared.get(key, missing, version=version)
+            expires = time.time() + self._l1_timeout
+        self.stats.record('shared', key, value is not missing)
+        if value is missing:
+            return default
+
+        if use_l1:
+            self._l1_set(l1_key, value, expires)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        l1_key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+        if self._use_l1(key) and (expires is None or expires > time.time()):
+            self._l1_set(l1_key, value, NEVER_EXPIRES if expires is None else expires)
+        else:
+            self._l1_delete(l1_key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # add() is used for cross-worker locks, so it is decided by the shared tier
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.add(key, value, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters (epochs) are decided by the shared tier
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        if self._use_l1(key) and self._l1_get(self.make_and_validate_key(key, version=version)):
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+        self.shared.clear()
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class _Call:
+    """An in-progress computation that other callers in this process can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _LeaderCancelled(Exception):
+    """Set on an async call whose leader was cancelled before finishing"""
+
+
+class SingleFlight:
+    """
+    Per-key request coalescing.
+
+    Concurrent callers asking for the same key share one computation:
+    inside a worker they wait on the leader's in-progress call, across
+    workers the leader holds a lock stored in the cache and publishes its
+    result there for a short time so waiting workers can pick it up.
+    The cross-worker part only helps when the cache backend is shared.
+    """
+
+    def __init__(self, lock_timeout=None, wait_timeout=None, result_timeout=30, poll_interval=0.05):
+        self.lock_timeout = lock_timeout or getattr(settings, 'ROUTE_COALESCE_LOCK_TIMEOUT', 60)
+        self.wait_timeout = wait_timeout or getattr(settings, 'ROUTE_COALESCE_WAIT_TIMEOUT', 30)
+        self.result_timeout = result_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+
+    def _lock_key(self, key):
+        return f"singleflight_lock_{key}"
+
+    def _result_key(self, key):
+        return f"singleflight_result_{key}"
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers of key and return its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if call.event.wait(self.wait_timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            # Leader is taking too long, compute independently
+            return fn()
+
+        try:
+            call.result = self._do_across_workers(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.event.set()
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _do_across_workers(self, key, fn):
+        lock_key = self._lock_key(key)
+        token = uuid.uuid4().hex
+
+        if cache.add(lock_key, token, self.lock_timeout):
+            try:
+                result = fn()
+                cache.set(self._result_key(key), result, self.result_timeout)
+                return result
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        # Another worker holds the lock - wait for its published result
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            result = cache.get(self._result_key(key))
+            if result is not None:
+                return result
+            if cache.get(lock_key) is None:
+                # Leader finished without publishing (it failed) - check once more
+                result = cache.get(self._result_key(key))
+                if result is not None:
+                    return result
+                break
+            time.sleep(self.poll_interval)
+
+        return fn()
+
+    async def ado(self, key, coro_fn):
+        """Async variant of do(); coro_fn is a zero-argument coroutine function"""
+        future = self._async_calls.get(key)
+        if future is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+            except (asyncio.TimeoutError, _LeaderCancelled):
+                # Leader is taking too long or was cancelled, compute independently
+                return await coro_fn()
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        try:
+            result = await self._ado_across_workers(key, coro_fn)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        except BaseException:
+            # Cancelled (e.g. the ASGI client disconnected): release the followers
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        finally:
+            self._async_calls.pop(key, None)
+
+    async def _ado_across_workers(self, key, coro_fn):
+        lock_key = self._lock_key(key)
+        token = uuid.uuid4().hex
+
+        if await cache.aadd(lock_key, token, self.lock_timeout):
+            try:
+                result = await coro_fn()
+                await cache.aset(self._result_key(key), result, self.result_timeout)
+                return result
+            finally:
+                if await cache.aget(lock_key) == token:
+                    await cache.adelete(lock_key)
+
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            result = await cache.aget(self._result_key(key))
+            if result is not None:
+                return result
+            if await cache.aget(lock_key) is None:
+                result = await cache.aget(self._result_key(key))
+                if result is not None:
+                    return result
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        return await coro_fn()
+
+
+# Shared by the sync and async route endpoints of this worker
+route_single_flight = SingleFlight()
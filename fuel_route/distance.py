@@ -0,0 +1,159 @@
+"""
+Distances for the route planner at a configurable precision.
+
+settings.ROUTE_DISTANCE_PRECISION picks one of
+
+- exact: geopy's ellipsoidal geodesic for every distance
+- balanced: approximations to search for the nearest route point, exact
+  geodesics for the distances that are kept and reported and for route
+  legs longer than FLAT_MAX_MILES
+- fast: approximations everywhere
+
+Pairs up to FLAT_MAX_MILES apart use a flat-earth approximation scaled by
+the WGS-84 radii of curvature at their mean latitude (relative error below
+FLAT_RELATIVE_ERROR), longer pairs the haversine formula (below
+SPHERE_RELATIVE_ERROR); both bounds hold with margin against geodesic for
+latitudes up to 70 degrees. Threshold tests (the corridor width and
+detour limit) switch to the exact geodesic whenever an approximate
+distance is within its error bound of the threshold, so every mode keeps
+and drops the same stations. benchmark_distance measures speed and
+maximum error per mode.
+"""
+import math
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from geopy.distance import geodesic
+
+
+MODES = ('fast', 'balanced', 'exact')
+
+# WGS-84 equatorial radius and eccentricity squared
+EQUATORIAL_RADIUS_MILES = 3963.1906
+ECCENTRICITY_SQUARED = 0.00669437999014
+MEAN_RADIUS_MILES = 3958.8
+
+FLAT_MAX_MILES = 100
+FLAT_RELATIVE_ERROR = 5e-4
+SPHERE_RELATIVE_ERROR = 6e-3
+
+
+def exact_miles(point_a, point_b):
+    return geodesic(point_a, point_b).miles
+
+
+def flat_miles(point_a, point_b):
+    """Flat-earth distance using the ellipsoid's scale at the mean latitude"""
+    cos_lat = math.cos(math.radians((point_a[0] + point_b[0]) / 2))
+    w2 = 1 / (1 - ECCENTRICITY_SQUARED * (1 - cos_lat * cos_lat))
+    w = math.sqrt(w2)
+    miles_per_radian = EQUATORIAL_RADIUS_MILES * w
+    d_lon = (point_b[1] - point_a[1] + 180) % 360 - 180
+    dx = math.radians(d_lon) * miles_per_radian * cos_lat
+    dy = math.radians(point_b[0] - point_a[0]) * miles_per_radian * w2 * (1 - ECCENTRICITY_SQUARED)
+    return math.sqrt(dx * dx + dy * dy)
+
+
+def sphere_miles(point_a, point_b):
+    lat1, lon1 = math.radians(point_a[0]), math.radians(point_a[1])
+    lat2, lon2 = math.radians(point_b[0]), math.radians(point_b[1])
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * MEAN_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def approx_miles(point_a, point_b):
+    """Approximate distance and its relative error bound"""
+    miles = flat_miles(point_a, point_b)
+    if miles <= FLAT_MAX_MILES:
+        return miles, FLAT_RELATIVE_ERROR
+    return sphere_miles(point_a, point_b), SPHERE_RELATIVE_ERROR
+
+
+class DistancePrecision:
+    """Distance functions of one precision mode (see the module docstring)"""
+
+    def __init__(self, mode='balanced'):
+        if mode not in MODES:
+            raise ValueError(f"Unknown distance precision {mode!r}, expected one of {', '.join(MODES)}")
+        self.mode = mode
+
+    def miles(self, point_a, point_b):
+        """Distance between two points, e.g. a route leg or segment"""
+        if self.mode == 'exact':
+            return exact_miles(point_a, point_b)
+        miles, error = approx_miles(point_a, point_b)
+        if self.mode == 'balanced' and error > FLAT_RELATIVE_ERROR:
+            return exact_miles(point_a, point_b)
+        return miles
+
+    def cumulative_miles(self, coordinates):
+        """Distance along a polyline at each of its points, starting with 0"""
+        distances = [0]
+        for i in range(len(coordinates) - 1):
+            distances.append(distances[-1] + self.miles(coordinates[i], coordinates[i + 1]))
+        return distances
+
+    def nearest_miles(self, point, others, limit=None, stop_below=None):
+        """
+        Smallest distance from point to any of others (inf without others).
+        Whether it is <= limit is decided as with exact geodesics. The
+        search stops at the first distance below stop_below, which makes
+        the result an upper bound there.
+        """
+        return self.nearest(point, others, limit, stop_below)[0]
+
+    def nearest(self, point, others, limit=None, stop_below=None):
+        """nearest_miles plus the number of exact geodesics it took"""
+        if self.mode == 'exact':
+            nearest = float('inf')
+            for count, other in enumerate(others, 1):
+                nearest = min(nearest, exact_miles(point, other))
+                if stop_below is not None and nearest < stop_below:
+                    return nearest, count
+            return nearest, len(others)
+
+        # Each approximation m with relative error e puts the true distance
+        # within [m / (1 + e), m / (1 - e)]
+        bounds = []
+        upper = float('inf')
+        nearest = float('inf')
+        for other in others:
+            miles, error = approx_miles(point, other)
+            if stop_below is not None and miles < stop_below:
+                if self.mode == 'balanced':
+                    return exact_miles(point, other), 1
+                return miles, 0
+            bounds.append((miles / (1 + error), other))
+            upper = min(upper, miles / (1 - error))
+            nearest = min(nearest, miles)
+        if not bounds:
+            return nearest, 0
+        lower = min(bound for bound, _ in bounds)
+
+        if self.mode == 'balanced':
+            # Exact for every distance that may pass the limit
+            needs_exact = limit is None or lower <= limit
+        else:
+            # Exact only when the bounds straddle the limit
+            needs_exact = limit is not None and lower <= limit < upper
+        if not needs_exact:
+            return nearest, 0
+
+        # Only points that can be closer than the nearest upper bound
+        candidates = [other for bound, other in bounds if bound <= upper]
+        return min(exact_miles(point, other) for other in candidates), len(candidates)
+
+
+_precisions = {}
+
+
+def distance_precision(mode=None):
+    """DistancePrecision for mode, by default settings.ROUTE_DISTANCE_PRECISION"""
+    mode = mode or getattr(settings, 'ROUTE_DISTANCE_PRECISION', 'balanced')
+    if mode not in _precisions:
+        try:
+            _precisions[mode] = DistancePrecision(mode)
+        except ValueError as e:
+            raise ImproperlyConfigured(str(e))
+    return _precisions[mode]
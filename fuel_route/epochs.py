@@ -0,0 +1,53 @@
+"""
+Station data epochs used to version cached fuel plans.
+
+The price epoch changes whenever a station price may have changed, the
+layout epoch whenever stations are added, removed or moved. Fuel plans
+are keyed by both; corridor candidate sets only by the layout epoch, so
+a price update re-runs the optimizer but reuses geometry and corridors.
+"""
+import time
+
+from django.core.cache import cache
+
+
+PRICE_EPOCH_KEY = 'epoch_station_prices'
+LAYOUT_EPOCH_KEY = 'epoch_station_layout'
+
+
+def _get_epoch(key):
+    epoch = cache.get(key)
+    if epoch is None:
+        # Seed from the clock so an evicted epoch never repeats an old value
+        cache.add(key, int(time.time() * 1000), None)
+        epoch = cache.get(key)
+    return epoch
+
+
+def _bump_epoch(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        _get_epoch(key)
+        return cache.incr(key)
+
+
+def get_price_epoch():
+    """Current station price epoch"""
+    return _get_epoch(PRICE_EPOCH_KEY)
+
+
+def get_layout_epoch():
+    """Current station layout (set of stations and their locations) epoch"""
+    return _get_epoch(LAYOUT_EPOCH_KEY)
+
+
+def bump_price_epoch():
+    """Invalidate cached fuel plans after a price change"""
+    return _bump_epoch(PRICE_EPOCH_KEY)
+
+
+def bump_station_epochs():
+    """Invalidate cached fuel plans and corridor candidates after a data load"""
+    _bump_epoch(LAYOUT_EPOCH_KEY)
+    return _bump_epoch(PRICE_EPOCH_KEY)
@@ -0,0 +1,268 @@
+"""
+Local stand-ins for the Nominatim and OpenRouteService APIs.
+
+One threaded HTTP server implements the subset of both APIs the app uses:
+
+    GET  /search                       Nominatim search, format=json
+    POST /v2/directions/driving-car    ORS directions, geojson response
+
+Point NOMINATIM_URL and OPENROUTESERVICE_URL at it (and set any
+OPENROUTE_API_KEY) to run the app, benchmarks and load tests offline.
+Responses are deterministic:
+
+- a query starting with "lat,lon" resolves to that point, so benchmark
+  lanes can carry their coordinates in the location name
+- "City, ST" and "City, State" queries resolve from the shipped place file
+- queries containing "nowhere" find nothing
+- anything else resolves to one of those places, picked by a hash of
+  the query
+- routes are the benchmark's road-like polyline through the requested
+  coordinates (see benchmark.directions_geojson)
+
+ProviderFaults adds latency, error responses and hanging requests
+(timeouts) per provider. Faults are drawn from a seeded generator, so a
+serial run sees the same sequence every time. They can be changed while
+the server runs with POST /_fake/faults; GET /_fake/stats counts requests
+per provider and outcome.
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .benchmark import directions_geojson, stable_fraction
+from .gazetteer import Gazetteer, load_place_file
+
+
+PROVIDERS = ('nominatim', 'openrouteservice')
+NOT_FOUND_MARKER = 'nowhere'
+COORDINATE_QUERY = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)')
+MAX_ROUTE_COORDINATES = 50
+
+
+class ProviderFaults:
+    """Latency, error and timeout injection for one provider"""
+
+    FIELDS = ('latency_ms', 'jitter_ms', 'error_rate', 'timeout_rate', 'error_status', 'hang_seconds')
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, timeout_rate=0.0,
+                 error_status=503, hang_seconds=30.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.error_status = error_status
+        self.hang_seconds = hang_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def update(self, values):
+        for field, value in values.items():
+            if field not in self.FIELDS:
+                raise ValueError(f'Unknown fault setting: {field}')
+            setattr(self, field, int(value) if field == 'error_status' else float(value))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def draw(self):
+        """(delay seconds, outcome) for the next request; outcome is 'ok', 'error' or 'timeout'"""
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            roll = self._random.random()
+        delay = max(0.0, self.latency_ms + jitter) / 1000
+        if roll < self.timeout_rate:
+            return delay, 'timeout'
+        if roll < self.timeout_rate + self.error_rate:
+            return delay, 'error'
+        return delay, 'ok'
+
+
+class FakeGeocoder:
+    """Deterministic answers for Nominatim search queries"""
+
+    def __init__(self):
+        self.gazetteer = Gazetteer(load_place_file())
+
+    def search(self, query):
+        """(latitude, longitude, display name) for a query, or None"""
+        query = re.sub(r',\s*(usa|united states)\s*$', '', query.strip(), flags=re.IGNORECASE)
+        if not query or NOT_FOUND_MARKER in query.lower():
+            return None
+
+        match = COORDINATE_QUERY.match(query)
+        if match:
+            return float(match.group(1)), float(match.group(2)), query
+
+        coords = self.gazetteer.lookup(query)
+        if coords:
+            return coords[0], coords[1], f'{query}, United States'
+
+        # Stable pick among known places, so made-up addresses land on land
+        index = int(stable_fraction(query) * len(self.gazetteer))
+        return self.gazetteer.latitudes[index], self.gazetteer.longitudes[index], f'{query}, United States'
+
+
+def nominatim_place(query, latitude, longitude, display_name):
+    """One Nominatim format=json search result"""
+    place_id = int(stable_fraction(query) * 1e9)
+    return {
+        'place_id': place_id,
+        'licence': 'Data for local testing only',
+        'osm_type': 'node',
+        'osm_id': place_id,
+        'lat': f'{latitude:.7f}',
+        'lon': f'{longitude:.7f}',
+        'class': 'place',
+        'type': 'city',
+        'place_rank': 16,
+        'importance': 0.5,
+        'addresstype': 'city',
+        'name': display_name.split(',')[0],
+        'display_name': display_name,
+        'boundingbox': [
+            f'{latitude - 0.1:.7f}', f'{latitude + 0.1:.7f}', f'{longitude - 0.1:.7f}', f'{longitude + 0.1:.7f}'
+        ],
+    }
+
+
+def ors_error(code, message):
+    return {'error': {'code': code, 'message': message}, 'info': {'engine': {'version': 'fake'}}}
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeProviders/1.0'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/search':
+            self.handle_provider('nominatim', lambda: self.nominatim_search(parse_qs(url.query)))
+        elif url.path == '/_fake/stats':
+            self.send_json(200, self.server.stats_snapshot())
+        elif url.path == '/_fake/faults':
+            self.send_json(200, self.server.faults_snapshot())
+        else:
+            self.send_json(404, {'error': f'Unknown path {url.path}'})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if path == '/v2/directions/driving-car':
+            self.handle_provider('openrouteservice', lambda: self.ors_directions(body))
+        elif path == '/_fake/faults':
+            try:
+                self.server.update_faults(json.loads(body or b'{}'))
+            except (ValueError, TypeError) as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            self.send_json(200, self.server.faults_snapshot())
+        else:
+            self.send_json(404, {'error': f'Unknown path {path}'})
+
+    def handle_provider(self, provider, respond):
+        delay, outcome = self.server.faults[provider].draw()
+        self.server.count(provider, outcome)
+        if delay:
+            time.sleep(delay)
+
+        if outcome == 'timeout':
+            # Hold the request past any sane client timeout, then give up
+            time.sleep(self.server.faults[provider].hang_seconds)
+            self.send_json(504, {'error': 'Gateway Timeout'})
+        elif outcome == 'error':
+            status = self.server.faults[provider].error_status
+            if provider == 'openrouteservice':
+                self.send_json(status, ors_error(2099, 'Injected error'))
+            else:
+                self.send_json(status, {'error': {'code': status, 'message': 'Injected error'}})
+        else:
+            self.send_json(*respond())
+
+    def nominatim_search(self, params):
+        query = params.get('q', [''])[0] or ', '.join(
+            params[field][0] for field in ('street', 'city', 'county', 'state', 'postalcode') if field in params
+        )
+        if params.get('format', ['xml'])[0] not in ('json', 'jsonv2'):
+            return 400, {'error': {'code': 400, 'message': 'Only format=json is supported'}}
+
+        found = self.server.geocoder.search(query)
+        return 200, [nominatim_place(query, *found)] if found else []
+
+    def ors_directions(self, body):
+        if not self.headers.get('Authorization'):
+            return 401, {'error': 'Authorization field missing'}
+        try:
+            coordinates = json.loads(body)['coordinates']
+            points = [(float(lat), float(lng)) for lng, lat in coordinates]
+        except (ValueError, KeyError, TypeError):
+            return 400, ors_error(2003, "Parameter 'coordinates' has incorrect value or format")
+        if not 2 <= len(points) <= MAX_ROUTE_COORDINATES:
+            return 400, ors_error(2004, f'Between 2 and {MAX_ROUTE_COORDINATES} coordinates are allowed')
+
+        return 200, directions_geojson(points, self.server.spacing_miles)
+
+    def send_json(self, status, data):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    """Threaded server for FakeProviderHandler with its faults and counters"""
+
+    daemon_threads = True
+
+    def __init__(self, address, faults=None, spacing_miles=50, verbose=False):
+        super().__init__(address, FakeProviderHandler)
+        self.faults = {provider: (faults or {}).get(provider) or ProviderFaults() for provider in PROVIDERS}
+        self.spacing_miles = spacing_miles
+        self.verbose = verbose
+        self.geocoder = FakeGeocoder()
+        self._stats = {provider: {'ok': 0, 'error': 0, 'timeout': 0} for provider in PROVIDERS}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, provider, outcome):
+        with self._stats_lock:
+            self._stats[provider][outcome] += 1
+
+    def stats_snapshot(self):
+        with self._stats_lock:
+            return {provider: dict(counts) for provider, counts in self._stats.items()}
+
+    def faults_snapshot(self):
+        return {provider: faults.as_dict() for provider, faults in self.faults.items()}
+
+    def update_faults(self, values):
+        """
+        Apply {"latency_ms": 200} to both providers, or
+        {"openrouteservice": {"error_rate": 0.5}} to one
+        """
+        for provider in PROVIDERS:
+            self.faults[provider].update({
+                field: value for field, value in values.items() if field not in PROVIDERS
+            })
+            self.faults[provider].update(values.get(provider, {}))
+
+
+def start_fake_providers(host='127.0.0.1', port=0, **kwargs):
+    """Start a FakeProviderServer in a daemon thread; port 0 picks a free port"""
+    server = FakeProviderServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, name='fake-providers', daemon=True)
+    thread.start()
+    return server
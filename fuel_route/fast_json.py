@@ -0,0 +1,41 @@
+"""
+JSON encoding for the hot route endpoints.
+
+Uses orjson when it is installed and the standard library's compact
+encoder otherwise.
+"""
+import json
+
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def dumps(data):
+    """Compact JSON as bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return _encoder.encode(data).encode('utf-8')
+
+
+def loads(data):
+    """Parse JSON bytes or text; raises ValueError for invalid input"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """JSON response encoded with orjson when available"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,111 @@
+"""
+Route endpoint without the DRF request/response machinery.
+
+Plain start/end requests are validated inline with the same rules as
+RouteRequestSerializer; anything else (waypoints, vehicle, invalid input)
+goes through the serializer so errors read exactly as before. The plan
+comes from the per-process planner and the response is encoded with
+fast_json. Stage timings are returned in a Server-Timing header.
+"""
+import logging
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import fast_json
+from .metrics import stage, timed_view
+from .normalization import normalize_location
+from .profiling import profiled_view
+from .serializers import RouteRequestSerializer
+from .streaming import streaming_route_response, wants_stream
+from .views import LocationNotFoundError, get_planner
+
+
+logger = logging.getLogger(__name__)
+
+
+ROUTE_FIELDS = {'start_location', 'end_location'}
+
+
+def validate_simple_request(data):
+    """
+    Validated {'start_location', 'end_location'} for a plain, valid request,
+    or None when the serializer has to decide.
+    """
+    if not isinstance(data, dict) or data.keys() != ROUTE_FIELDS:
+        return None
+
+    start_location, end_location = data['start_location'], data['end_location']
+    if not isinstance(start_location, str) or not isinstance(end_location, str):
+        return None
+
+    start_location, end_location = start_location.strip(), end_location.strip()
+    if not (3 <= len(start_location) <= 200 and 3 <= len(end_location) <= 200):
+        return None
+    if normalize_location(start_location) == normalize_location(end_location):
+        return None
+
+    return {'start_location': start_location, 'end_location': end_location}
+
+
+@csrf_exempt
+@profiled_view
+@timed_view('route')
+def route_view(request):
+    """
+    Main API endpoint for route optimization
+
+    POST /api/route/
+    {
+        "start_location": "New York, NY",
+        "end_location": "Los Angeles, CA",
+        "waypoints": ["Chicago, IL", "Denver, CO"],  (optional, in order)
+        "vehicle": "box_truck" or {"max_range_miles": 600, "miles_per_gallon": 7}  (optional)
+    }
+
+    Add ?stream=true (or Accept: application/x-ndjson) to receive the
+    result as NDJSON events, see streaming.py
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+    try:
+        try:
+            data = fast_json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+        validated_data = validate_simple_request(data)
+        if validated_data is None:
+            serializer = RouteRequestSerializer(data=data)
+            if not serializer.is_valid():
+                return fast_json.FastJsonResponse(serializer.errors, status=400)
+            validated_data = serializer.validated_data
+
+        start_location = validated_data['start_location'].strip()
+        end_location = validated_data['end_location'].strip()
+        waypoints = tuple(validated_data.get('waypoints', ()))
+        planner = get_planner()
+        if validated_data.get('vehicle'):
+            planner = planner.with_vehicle(validated_data['vehicle'])
+        planner.log_route_request(start_location, end_location, waypoints)
+        planner.record_lane_normalization(start_location, end_location)
+
+        # Opt-in NDJSON mode streams each stage as it finishes
+        if wants_stream(request):
+            return streaming_route_response(planner, start_location, end_location, waypoints)
+
+        try:
+            response_data = planner.get_route_response(start_location, end_location, waypoints)
+        except LocationNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        with stage('serialize'):
+            return fast_json.FastJsonResponse(response_data)
+
+    except Exception as e:
+        logger.exception("Unexpected error in route optimization: %s", e)
+        return JsonResponse(
+            {'error': 'An unexpected error occurred while processing your request. Please try again.'},
+            status=500
+        )
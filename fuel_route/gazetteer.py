@@ -0,0 +1,122 @@
+"""
+Offline gazetteer of US places for "City, ST" inputs.
+
+Places come from the shipped data/us_places.csv plus the cities of fuel
+stations that already have coordinates. They are held in a sorted list
+of normalized "city|st" keys with parallel coordinate arrays, so a lookup
+is one bisect and never touches the network. Free-form addresses are
+left to Nominatim.
+"""
+import csv
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+from django.core.exceptions import SynchronousOnlyOperation
+
+from .normalization import normalize_city, parse_city_state
+
+
+logger = logging.getLogger(__name__)
+
+
+PLACES_FILE = Path(__file__).resolve().parent / 'data' / 'us_places.csv'
+
+
+def place_key(city, state):
+    """Normalized "city|st" gazetteer key"""
+    return f"{normalize_city(city)}|{state.strip().lower()}"
+
+
+class Gazetteer:
+    """Sorted-array index of US places"""
+
+    def __init__(self, places=()):
+        merged = {}
+        for city, state, latitude, longitude in places:
+            # First source wins, so the curated place file beats station data
+            merged.setdefault(place_key(city, state), (latitude, longitude))
+
+        self.keys = sorted(merged)
+        self.latitudes = array('d', (merged[key][0] for key in self.keys))
+        self.longitudes = array('d', (merged[key][1] for key in self.keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, city, state):
+        """Coordinates for a city/state pair or None"""
+        key = place_key(city, state)
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return (self.latitudes[index], self.longitudes[index])
+        return None
+
+    def lookup(self, location_string):
+        """Resolve a "City, ST" string (any spelling normalize_location accepts)"""
+        city_state = parse_city_state(location_string)
+        if not city_state:
+            return None
+        return self.get(*city_state)
+
+    def search_prefix(self, prefix, limit=10):
+        """Places whose "city|st" key starts with prefix, e.g. "san " or "portland|"""
+        prefix = prefix.lower()
+        index = bisect_left(self.keys, prefix)
+        results = []
+        while index < len(self.keys) and len(results) < limit and self.keys[index].startswith(prefix):
+            city, state = self.keys[index].split('|')
+            results.append({
+                'city': city.title(),
+                'state': state.upper(),
+                'latitude': self.latitudes[index],
+                'longitude': self.longitudes[index],
+            })
+            index += 1
+        return results
+
+
+def load_place_file(path=PLACES_FILE):
+    """Rows of (city, state, latitude, longitude) from the shipped place file"""
+    with open(path, 'r', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            yield row['city'], row['state'], float(row['latitude']), float(row['longitude'])
+
+
+def load_station_places():
+    """City/state coordinates of fuel stations that have been geocoded"""
+    from .models import FuelStation
+
+    return FuelStation.objects.filter(
+        latitude__isnull=False,
+        longitude__isnull=False
+    ).values_list('city', 'state', 'latitude', 'longitude')
+
+
+def build_gazetteer():
+    """Gazetteer from the place file and station cities"""
+    places = list(load_place_file())
+    try:
+        places.extend(load_station_places())
+    except SynchronousOnlyOperation:
+        # Built from an event loop; don't keep a gazetteer without stations
+        raise
+    except Exception as e:
+        logger.warning("Error loading station cities into gazetteer: %s", e)
+    return Gazetteer(places)
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Process-wide gazetteer, built on first use"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = build_gazetteer()
+    return _gazetteer
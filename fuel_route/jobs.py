@@ -0,0 +1,330 @@
+"""
+Database-backed queue for route planning jobs.
+
+POST /api/jobs/ queues a route ({"start_location", "end_location",
+"waypoints", "vehicle"}) or a batch ({"trips": [...]}) with an optional "priority" and
+"result_ttl" and returns a job id right away. The run_route_worker
+command claims queued jobs (highest priority first, then oldest) and
+stores their results, which clients poll at /api/jobs/<id>/ and fetch
+from /api/jobs/<id>/result/ until the result TTL runs out.
+
+Identical requests share a job while it is queued, running or holds an
+unexpired result; a partial unique constraint on job_key for queued and
+running jobs stops concurrent identical submissions from both inserting.
+No broker is needed; any database Django supports works because a job
+is claimed with a conditional UPDATE. While a job runs its worker
+updates heartbeat_at, and a running job whose heartbeat is older than
+ROUTE_JOB_RUNNING_TIMEOUT is requeued, so slow jobs are not run twice.
+"""
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from .batch import plan_batch
+from .logs import log_context
+from .models import RouteJob
+from .normalization import normalize_location
+from .serializers import RouteRequestSerializer
+from .views import LocationNotFoundError, get_planner
+
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_trip(trip):
+    """Trip dict reduced to what determines its result"""
+    waypoints = trip.get('waypoints')
+    return {
+        'start_location': normalize_location(str(trip.get('start_location', ''))),
+        'end_location': normalize_location(str(trip.get('end_location', ''))),
+        'waypoints': [normalize_location(str(waypoint)) for waypoint in waypoints] if isinstance(waypoints, list) else [],
+        'vehicle': trip.get('vehicle') or {},
+    }
+
+
+def get_job_key(kind, payload):
+    """Hash of the normalized request; identical requests share a job"""
+    if kind == RouteJob.KIND_BATCH:
+        canonical = [canonical_trip(trip) if isinstance(trip, dict) else trip for trip in payload['trips']]
+    else:
+        canonical = canonical_trip(payload)
+    return hashlib.sha256(
+        json.dumps([kind, canonical], sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+
+def find_live_job(job_key):
+    """Queued or running job, or one with an unexpired result, for a job key"""
+    return RouteJob.objects.filter(job_key=job_key).filter(
+        Q(status__in=[RouteJob.STATUS_QUEUED, RouteJob.STATUS_RUNNING]) |
+        Q(status=RouteJob.STATUS_SUCCEEDED, expires_at__gt=timezone.now())
+    ).order_by('-created_at').first()
+
+
+def join_job(job, priority):
+    """Raise the priority of a still queued job an identical request joins"""
+    if job.status == RouteJob.STATUS_QUEUED and priority > job.priority:
+        RouteJob.objects.filter(id=job.id, status=RouteJob.STATUS_QUEUED).update(priority=priority)
+        job.priority = priority
+    return job
+
+
+def enqueue_job(kind, payload, priority=0, result_ttl=None):
+    """
+    Queue a job, or return the live job for an identical request.
+    Returns (job, created). A duplicate submitted with a higher priority
+    raises the priority of the job it joins while that job is still queued.
+    """
+    job_key = get_job_key(kind, payload)
+    result_ttl = result_ttl or getattr(settings, 'ROUTE_JOB_RESULT_TTL', 3600)
+
+    try:
+        with transaction.atomic():
+            existing = find_live_job(job_key)
+            if existing:
+                return join_job(existing, priority), False
+
+            job = RouteJob.objects.create(
+                kind=kind,
+                job_key=job_key,
+                payload=payload,
+                priority=priority,
+                result_ttl=result_ttl,
+            )
+    except IntegrityError:
+        # An identical request inserted its job between our check and insert
+        existing = find_live_job(job_key)
+        if existing is None:
+            raise
+        return join_job(existing, priority), False
+    return job, True
+
+
+def claim_next_job():
+    """Mark the next queued job as running and return it, or None if the queue is empty"""
+    while True:
+        job_id = RouteJob.objects.filter(
+            status=RouteJob.STATUS_QUEUED
+        ).order_by('-priority', 'created_at').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+
+        # Only one worker wins the update; the others try the next job
+        now = timezone.now()
+        claimed = RouteJob.objects.filter(id=job_id, status=RouteJob.STATUS_QUEUED).update(
+            status=RouteJob.STATUS_RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return RouteJob.objects.get(id=job_id)
+
+
+def run_job(job, planner=None):
+    """Run a claimed job and store its result or error"""
+    with log_context(job_id=str(job.id), job_kind=job.kind), heartbeat(job):
+        return _run_job(job, planner or get_planner())
+
+
+@contextmanager
+def heartbeat(job):
+    """Update the running job's heartbeat_at from a background thread while the block runs"""
+    interval = getattr(settings, 'ROUTE_JOB_HEARTBEAT_INTERVAL', 30)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    RouteJob.objects.filter(id=job.id, status=RouteJob.STATUS_RUNNING).update(
+                        heartbeat_at=timezone.now()
+                    )
+                except Exception as e:
+                    logger.warning("Error updating heartbeat of route job %s: %s", job.id, e)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'route-job-heartbeat-{job.id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _run_job(job, planner):
+    try:
+        if job.kind == RouteJob.KIND_BATCH:
+            results, errors, summary = plan_batch(job.payload['trips'], planner)
+            result = {'results': results, 'errors': errors, 'summary': summary}
+        else:
+            trip_planner = planner.with_vehicle(job.payload.get('vehicle') or {})
+            start_location = job.payload['start_location']
+            end_location = job.payload['end_location']
+            waypoints = tuple(job.payload.get('waypoints') or ())
+            result = (
+                trip_planner.get_cached_response(start_location, end_location, waypoints) or
+                trip_planner.compute_route_response(start_location, end_location, waypoints)
+            )
+    except LocationNotFoundError as e:
+        finish_job(job, error=str(e))
+    except Exception as e:
+        logger.exception("Error running route job %s: %s", job.id, e)
+        finish_job(job, error='An unexpected error occurred while processing this job')
+    else:
+        finish_job(job, result=result)
+    return job
+
+
+def finish_job(job, result=None, error=''):
+    now = timezone.now()
+    job.status = RouteJob.STATUS_FAILED if error else RouteJob.STATUS_SUCCEEDED
+    job.result = result
+    job.error = error
+    job.finished_at = now
+    job.expires_at = now + timedelta(seconds=job.result_ttl)
+    job.save(update_fields=['status', 'result', 'error', 'finished_at', 'expires_at'])
+
+
+def requeue_stale_jobs():
+    """
+    Requeue running jobs whose worker stopped sending heartbeats (it died),
+    or fail them after ROUTE_JOB_MAX_ATTEMPTS tries. Returns (requeued, failed).
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, 'ROUTE_JOB_RUNNING_TIMEOUT', 120))
+    max_attempts = getattr(settings, 'ROUTE_JOB_MAX_ATTEMPTS', 3)
+    stale = RouteJob.objects.filter(status=RouteJob.STATUS_RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) |
+        # Claimed before heartbeats were recorded
+        Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=RouteJob.STATUS_FAILED,
+        error='Job did not finish after repeated attempts',
+        finished_at=now,
+        expires_at=now + timedelta(seconds=getattr(settings, 'ROUTE_JOB_RESULT_TTL', 3600)),
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=RouteJob.STATUS_QUEUED)
+    return requeued, failed
+
+
+def purge_expired_jobs():
+    """Delete finished jobs whose result TTL has passed; returns the number deleted"""
+    deleted, _ = RouteJob.objects.filter(expires_at__lt=timezone.now()).delete()
+    return deleted
+
+
+def get_live_job(job_id):
+    """Job by id unless it does not exist or its result has expired"""
+    job = RouteJob.objects.filter(id=job_id).first()
+    if job is None or (job.expires_at and job.expires_at <= timezone.now()):
+        return None
+    return job
+
+
+def job_status(job):
+    """Status document returned by the job endpoints"""
+    return {
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'priority': job.priority,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'heartbeat_at': job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'error': job.error or None,
+        'status_url': f'/api/jobs/{job.id}/',
+        'result_url': f'/api/jobs/{job.id}/result/',
+    }
+
+
+@csrf_exempt
+def submit_job_view(request):
+    """Queue a route or batch job; see module docstring for the payload"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Request body must be a JSON object'}, status=400)
+
+    priority = data.get('priority', 0)
+    if not isinstance(priority, int) or isinstance(priority, bool) or not -100 <= priority <= 100:
+        return JsonResponse({'error': 'priority must be an integer between -100 and 100'}, status=400)
+
+    max_ttl = getattr(settings, 'ROUTE_JOB_MAX_RESULT_TTL', 86400)
+    result_ttl = data.get('result_ttl')
+    if result_ttl is not None and (
+        not isinstance(result_ttl, int) or isinstance(result_ttl, bool) or not 60 <= result_ttl <= max_ttl
+    ):
+        return JsonResponse({'error': f'result_ttl must be an integer between 60 and {max_ttl} seconds'}, status=400)
+
+    if 'trips' in data:
+        trips = data['trips']
+        if not isinstance(trips, list) or not trips:
+            return JsonResponse({'error': 'trips must be a non-empty list'}, status=400)
+        max_trips = getattr(settings, 'ROUTE_BATCH_MAX_TRIPS', 500)
+        if len(trips) > max_trips:
+            return JsonResponse({'error': f'A batch can contain at most {max_trips} trips'}, status=400)
+        # Trips are validated one by one when the job runs, like the batch endpoint
+        kind, payload = RouteJob.KIND_BATCH, {'trips': trips}
+    else:
+        serializer = RouteRequestSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse({'error': 'Invalid input data', 'details': serializer.errors}, status=400)
+        kind = RouteJob.KIND_ROUTE
+        payload = {
+            'start_location': serializer.validated_data['start_location'],
+            'end_location': serializer.validated_data['end_location'],
+            'waypoints': serializer.validated_data.get('waypoints', []),
+            'vehicle': dict(serializer.validated_data.get('vehicle') or {}),
+        }
+
+    try:
+        job, created = enqueue_job(kind, payload, priority, result_ttl)
+    except Exception as e:
+        logger.exception("Error queueing route job: %s", e)
+        return JsonResponse({'error': 'Could not queue the job. Please try again.'}, status=500)
+
+    return JsonResponse({**job_status(job), 'deduplicated': not created}, status=202 if created else 200)
+
+
+def job_status_view(request, job_id):
+    """Current status of a job"""
+    job = get_live_job(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job not found or its result has expired'}, status=404)
+    return JsonResponse(job_status(job))
+
+
+def job_result_view(request, job_id):
+    """Result of a finished job; 202 with the status while it is pending"""
+    job = get_live_job(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job not found or its result has expired'}, status=404)
+
+    if job.status == RouteJob.STATUS_SUCCEEDED:
+        return JsonResponse(job.result, safe=False)
+    if job.status == RouteJob.STATUS_FAILED:
+        return JsonResponse({'error': job.error, 'job_id': str(job.id)}, status=400)
+    return JsonResponse(job_status(job), status=202)
@@ -0,0 +1,296 @@
+"""
+Load generator for the route API.
+
+Each concurrency level runs a closed loop for a fixed duration: that many
+threads each send a request, wait for the answer and send the next. The
+request mix is
+
+- hot lanes: a small fixed set of lanes warmed before the first level,
+  so they measure the cache-hit path
+- cold lanes: a new random lane per request, so every stage misses
+- batch requests (optional): POST /api/routes/batch/ with trips drawn
+  from the same hot/cold mix
+
+Lane names start with their coordinates ("39.739200,-104.990300 Load
+cold 7-31"), which the fake Nominatim of fake_providers.py resolves
+exactly, so the server under test should use the stand-in providers.
+LocalStack starts them and a gunicorn server as subprocesses.
+
+Every level reports throughput, latency percentiles and error rates, per
+request kind and overall; find_knee() picks the level where throughput
+stops growing and the one where latency collapses. The generator shares
+one process and GIL with its threads, so keep the server on other cores
+for levels beyond a few dozen.
+"""
+import itertools
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+from .benchmark import percentile, random_route, synthetic_routes
+
+
+ENDPOINTS = {
+    'route': '/api/route/',
+    'async': '/api/route/async/',
+}
+BATCH_PATH = '/api/routes/batch/'
+
+
+def lane_name(point, label):
+    return f'{point[0]:.6f},{point[1]:.6f} {label}'
+
+
+class LaneMix:
+    """Picks the next request of a load test; one instance is shared by all threads"""
+
+    def __init__(self, hot_ratio=0.8, batch_ratio=0.0, batch_size=10, hot_lanes=20, seed=42,
+                 min_miles=100, max_miles=3000, endpoint='route'):
+        self.hot_ratio = hot_ratio
+        self.batch_ratio = batch_ratio
+        self.batch_size = batch_size
+        self.min_miles = min_miles
+        self.max_miles = max_miles
+        self.path = ENDPOINTS[endpoint]
+        self.run_id = f'{seed}-{os.getpid()}-{int(time.time())}'
+        self.hot = [
+            {'start_location': lane_name(route['start'], f'Load hot {number}'),
+             'end_location': lane_name(route['end'], f'Load hot {number}')}
+            for number, route in enumerate(synthetic_routes(hot_lanes, seed, min_miles, max_miles))
+        ]
+        self._numbers = itertools.count()
+
+    def trip(self, rng):
+        """(kind, trip payload) drawn from the hot/cold mix"""
+        if self.hot and rng.random() < self.hot_ratio:
+            return 'hot', rng.choice(self.hot)
+        start, end, _ = random_route(rng, self.min_miles, self.max_miles)
+        label = f'Load cold {self.run_id}-{next(self._numbers)}'
+        return 'cold', {'start_location': lane_name(start, label), 'end_location': lane_name(end, label)}
+
+    def next_request(self, rng):
+        """(kind, path, body) of the next request"""
+        if self.batch_ratio and rng.random() < self.batch_ratio:
+            return 'batch', BATCH_PATH, {'trips': [self.trip(rng)[1] for _ in range(self.batch_size)]}
+        kind, trip = self.trip(rng)
+        return kind, self.path, trip
+
+
+def send(session, base_url, path, body, timeout):
+    """(status, seconds); status is the HTTP status or the exception name"""
+    started = time.perf_counter()
+    try:
+        response = session.post(base_url + path, json=body, timeout=timeout)
+        status = response.status_code
+    except requests.RequestException as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - started
+
+
+def warm_hot_lanes(base_url, mix, timeout=60):
+    """Plan every hot lane once; returns the number that failed"""
+    failed = 0
+    with requests.Session() as session:
+        for trip in mix.hot:
+            status, _ = send(session, base_url, mix.path, trip, timeout)
+            failed += status != 200
+    return failed
+
+
+def summarize_latencies(seconds):
+    if not seconds:
+        return None
+    return {
+        'p50_ms': round(percentile(seconds, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(seconds, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(seconds, 0.99) * 1000, 1),
+        'max_ms': round(max(seconds) * 1000, 1),
+    }
+
+
+def summarize_samples(samples, elapsed):
+    """Throughput, error rate and latencies of (kind, status, seconds) samples"""
+    ok = [seconds for _, status, seconds in samples if status == 200]
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'error_rate': round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'latency': summarize_latencies(ok),
+        'statuses': statuses,
+    }
+
+
+def run_level(base_url, mix, concurrency, duration, timeout=30, seed=42):
+    """Closed-loop run at one concurrency level; returns its report"""
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(number):
+        rng = random.Random(f'{seed}-{concurrency}-{number}')
+        mine = []
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                kind, path, body = mix.next_request(rng)
+                status, seconds = send(session, base_url, path, body, timeout)
+                mine.append((kind, status, seconds))
+        with lock:
+            samples.extend(mine)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(number,), daemon=True) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Requests in flight at the deadline still count, so use the real span
+    elapsed = time.monotonic() - started
+
+    kinds = sorted({kind for kind, _, _ in samples})
+    return {
+        'concurrency': concurrency,
+        'elapsed_seconds': round(elapsed, 2),
+        **summarize_samples(samples, elapsed),
+        'by_kind': {kind: summarize_samples([sample for sample in samples if sample[0] == kind], elapsed) for kind in kinds},
+    }
+
+
+def find_knee(levels, latency_factor=3.0, max_error_rate=0.01, min_gain=0.10):
+    """
+    Peak throughput, the last level that still added at least min_gain
+    throughput (saturation) and the first level whose p95 exceeds
+    latency_factor times the lowest level's p95 or whose error rate tops
+    max_error_rate (collapse, None when no level collapsed)
+    """
+    measured = [level for level in levels if level['latency']]
+    if not measured:
+        return {'peak_throughput_rps': 0.0, 'peak_concurrency': None,
+                'saturation_concurrency': None, 'collapse_concurrency': None}
+
+    peak = max(measured, key=lambda level: level['throughput_rps'])
+    saturation = measured[0]
+    for level in measured[1:]:
+        if level['throughput_rps'] < saturation['throughput_rps'] * (1 + min_gain):
+            break
+        saturation = level
+
+    baseline_p95 = measured[0]['latency']['p95_ms']
+    collapse = next((
+        level for level in levels
+        if level['error_rate'] > max_error_rate
+        or (level['latency'] and level['latency']['p95_ms'] > baseline_p95 * latency_factor)
+    ), None)
+
+    return {
+        'peak_throughput_rps': peak['throughput_rps'],
+        'peak_concurrency': peak['concurrency'],
+        'saturation_concurrency': saturation['concurrency'],
+        'collapse_concurrency': collapse['concurrency'] if collapse else None,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'{url} exited with code {process.returncode} during startup')
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f'{url} not ready after {timeout}s')
+
+
+class LocalStack:
+    """
+    Fake providers plus a gunicorn server using them, as subprocesses.
+    Use as a context manager; url is the server's base URL.
+    """
+
+    def __init__(self, workers=2, threads=1, preload=True, provider_options=(), startup_timeout=180, log_path=None):
+        self.workers = workers
+        self.threads = threads
+        self.preload = preload
+        self.provider_options = list(provider_options)
+        self.startup_timeout = startup_timeout
+        self.log_path = log_path
+        self.processes = []
+        self.url = None
+
+    def __enter__(self):
+        self.log = open(self.log_path, 'ab') if self.log_path else subprocess.DEVNULL
+        try:
+            self.start()
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def spawn(self, args, env):
+        process = subprocess.Popen(
+            args, cwd=settings.BASE_DIR, env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        self.processes.append(process)
+        return process
+
+    def start(self):
+        provider_port = free_port()
+        provider_url = f'http://127.0.0.1:{provider_port}'
+        providers = self.spawn(
+            [sys.executable, 'manage.py', 'run_fake_providers', '--skip-checks',
+             '--port', str(provider_port), *self.provider_options],
+            os.environ.copy(),
+        )
+        wait_until_ready(provider_url + '/_fake/stats', 60, providers)
+
+        port = free_port()
+        env = {
+            **os.environ,
+            'NOMINATIM_URL': provider_url,
+            'OPENROUTESERVICE_URL': provider_url,
+            'OPENROUTE_API_KEY': os.environ.get('OPENROUTE_API_KEY') or 'fake',
+            'GUNICORN_PRELOAD': 'true' if self.preload else 'false',
+        }
+        server = self.spawn(
+            [sys.executable, '-m', 'gunicorn', 'fuel_project.wsgi:application', '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', '--workers', str(self.workers), '--threads', str(self.threads)],
+            env,
+        )
+        self.provider_url = provider_url
+        self.url = f'http://127.0.0.1:{port}'
+        wait_until_ready(self.url + '/api/ready/', self.startup_timeout, server)
+
+    def stop(self):
+        for process in reversed(self.processes):
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+        self.processes = []
+        if self.log not in (None, subprocess.DEVNULL):
+            self.log.close()
@@ -0,0 +1,206 @@
+"""
+Structured logging for fuel_route.
+
+Every module logs through logging.getLogger(__name__) with %-style
+arguments, so messages are only formatted for records that are kept.
+settings.LOGGING wires the fuel_route loggers to
+
+- ContextFilter: copies the correlation fields of the current request or
+  job (request_id, job_id, ...) from a context variable onto each record
+- SamplingFilter: keeps a share of DEBUG/INFO records per level, decided
+  once per request ID so a sampled request keeps all its lines; WARNING
+  and above are always kept
+- QueueingStreamHandler: puts records on a bounded queue and returns; a
+  listener thread formats them with JsonFormatter and writes them out,
+  and records are dropped (and counted) rather than blocking when the
+  queue is full
+
+RequestIdMiddleware gives every request an ID (the incoming X-Request-ID
+or a new one), echoes it in the response and makes it the request_id of
+its log lines; the job worker does the same with job_id. Fields passed
+with extra={...} (stage timings, counts) become JSON keys:
+
+    {"ts": "2026-10-19T12:00:00.123Z", "level": "INFO", "logger": "fuel_route.metrics",
+     "message": "route request finished", "request_id": "9f1c...", "status": 200,
+     "duration_ms": 839.5, "stages": {"geocode": 182.1, "routing": 640.3}}
+"""
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
+_log_context = contextvars.ContextVar('log_context', default={})
+
+REQUEST_ID_HEADER = 'HTTP_X_REQUEST_ID'
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+# Attributes every LogRecord has; anything else came from extra={...}
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'context'}
+
+
+def current_log_context():
+    return _log_context.get()
+
+
+@contextmanager
+def log_context(**fields):
+    """Add correlation fields to every record logged inside the block (in this context)"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+class RequestIdMiddleware:
+    """Sets the request_id log field and the X-Request-ID response header"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def request_id(self, request):
+        given = request.META.get(REQUEST_ID_HEADER, '')
+        return given if REQUEST_ID_RE.match(given) else new_request_id()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = self.request_id(request)
+        with log_context(request_id=request.request_id):
+            response = self.get_response(request)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = self.request_id(request)
+        with log_context(request_id=request.request_id):
+            response = await self.get_response(request)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+
+class ContextFilter(logging.Filter):
+    """Attach the correlation fields of the current request or job to the record"""
+
+    def filter(self, record):
+        record.context = _log_context.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep DEBUG/INFO records at the given per-level rates, e.g.
+    {'DEBUG': 0.01, 'INFO': 0.25}. Levels not listed are always kept.
+    Records logged with extra={'sample': False} are never sampled out.
+    """
+
+    def __init__(self, rates=None, name=''):
+        super().__init__(name)
+        self.rates = {logging.getLevelName(level) if isinstance(level, str) else level: float(rate)
+                      for level, rate in (rates or {}).items()}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        if rate is None or rate >= 1 or not getattr(record, 'sample', True):
+            return True
+        if rate <= 0:
+            return False
+
+        correlation_id = (getattr(record, 'context', None) or _log_context.get()).get('request_id')
+        if correlation_id:
+            # Same decision for every line of a request
+            digest = hashlib.blake2b(correlation_id.encode(), digest_size=8).digest()
+            return int.from_bytes(digest, 'big') / 2 ** 64 < rate
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the context and extra fields as keys"""
+
+    def format(self, record):
+        data = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'context', None) or {})
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and key != 'sample':
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class QueueingStreamHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking handler: emit() only enqueues, a listener thread formats
+    and writes to the stream. Configured formatters apply to the stream
+    side. The listener is restarted in forked children (gunicorn workers).
+    """
+
+    def __init__(self, stream=None, max_size=10000):
+        super().__init__(queue.Queue(max_size))
+        self.max_size = max_size
+        self.dropped = 0
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.listener = None
+        self.start()
+        atexit.register(self.stop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _after_fork(self):
+        # The listener thread did not survive the fork and the queue's
+        # locks may have been held; start over with empty ones
+        self.queue = queue.Queue(self.max_size)
+        self.start()
+
+    def close(self):
+        self.stop()
+        super().close()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Unlike QueueHandler.prepare, leave message formatting to the listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
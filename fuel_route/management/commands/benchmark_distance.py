@@ -0,0 +1,90 @@
+import json
+import platform
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fuel_route.benchmark import run_distance_benchmark
+from fuel_route.distance import MODES
+
+
+class Command(BaseCommand):
+    """
+    Django management command to benchmark the distance precision modes
+
+    Usage:
+        python manage.py benchmark_distance
+        python manage.py benchmark_distance --count 10000 --limit 10 --output distance.json
+
+    Runs the nearest-route-point search of the corridor and detour tests,
+    short segment distances and long leg distances in every mode of
+    ROUTE_DISTANCE_PRECISION and reports the time per call, the speedup
+    over exact geodesics, the maximum absolute and relative error, the
+    exact geodesics the fast paths escalated to, and how often a nearest
+    distance fell on the other side of --limit than the exact one.
+    """
+
+    help = 'Compare speed and maximum error of the distance precision modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=2000,
+            help='Calls per workload (default: 2000)',
+        )
+
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the points (default: 42)',
+        )
+
+        parser.add_argument(
+            '--limit',
+            type=float,
+            default=30,
+            help='Threshold of the nearest-point test in miles (default: 30)',
+        )
+
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Write the JSON report to this file',
+        )
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['limit'] <= 0:
+            raise CommandError('--count and --limit must be positive')
+
+        results = run_distance_benchmark(options['count'], options['seed'], options['limit'])
+        report = {
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                **{key: options[key] for key in ('count', 'seed', 'limit')},
+            },
+            'workloads': results,
+        }
+
+        self.stdout.write('\n' + '=' * 88)
+        self.stdout.write(f'{"workload":<10}{"mode":<10}{"us/call":>10}{"speedup":>9}{"max err mi":>12}'
+                          f'{"max rel err":>13}{"exact/call":>12}{"mismatches":>12}')
+        self.stdout.write('-' * 88)
+        for name, modes in results.items():
+            for mode in MODES:
+                row = modes[mode]
+                self.stdout.write(
+                    f'{name:<10}{mode:<10}{row["us_per_call"]:>10.2f}{row["speedup"]:>8.1f}x'
+                    f'{row["max_error_miles"]:>12.4f}{row["max_relative_error"]:>13.2e}'
+                    f'{"-" if row["exact_per_call"] is None else row["exact_per_call"]:>12}'
+                    f'{"-" if row["limit_mismatches"] is None else row["limit_mismatches"]:>12}'
+                )
+        self.stdout.write('=' * 88)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2), encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
@@ -0,0 +1,312 @@
+import json
+import platform
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from fuel_route.benchmark import (
+    DEFAULT_DATASET, STAGES, compare_reports, load_opis_stations, run_benchmark, synthetic_routes
+)
+from fuel_route.distance import MODES
+from fuel_route.station_index import SnapshotStationIndex, StationIndex
+
+
+# Private cache so runs are cold and never touch the shared route cache
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'route-benchmark',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+
+class Command(BaseCommand):
+    """
+    Django management command to benchmark the route pipeline offline
+
+    Usage:
+        python manage.py benchmark_routes --output baseline.json
+        python manage.py benchmark_routes --routes 500 --seed 7 --output run.json
+        python manage.py benchmark_routes --compare baseline.json --output current.json
+        python manage.py benchmark_routes --compare baseline.json --current current.json
+        python manage.py benchmark_routes --snapshot snapshots/stations_100000.idx \
+            --snapshot snapshots/stations_1000000.idx --output sweep.json
+        python manage.py benchmark_routes --providers http://127.0.0.1:8765 --routes 50
+        python manage.py benchmark_routes --precision exact --output exact.json
+        python manage.py benchmark_routes --precision fast --compare exact.json
+
+    Geocoding and routing are stubbed and stations come from the OPIS
+    price file, so runs are reproducible and need no network or database.
+    With --snapshot (repeatable; see generate_stations) the same routes
+    are run against each station snapshot instead, and the report gets a
+    'sweep' entry per snapshot plus a 'scaling' table for charting.
+    With --providers geocoding and routing go over HTTP to that URL,
+    normally run_fake_providers with injected latency or faults; failed
+    lanes and provider errors are reported.
+    --precision runs with that ROUTE_DISTANCE_PRECISION mode; see
+    benchmark_distance for the error of each mode.
+    With --compare the command exits with an error when a stage or the
+    end-to-end p50/p95 regressed by more than --threshold.
+    """
+
+    help = 'Benchmark the route pipeline on synthetic routes with stubbed providers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--routes',
+            type=int,
+            default=100,
+            help='Number of synthetic routes (default: 100)',
+        )
+
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic routes (default: 42)',
+        )
+
+        parser.add_argument(
+            '--min-miles',
+            type=float,
+            default=100,
+            help='Shortest route in miles (default: 100)',
+        )
+
+        parser.add_argument(
+            '--max-miles',
+            type=float,
+            default=3000,
+            help='Longest route in miles (default: 3000)',
+        )
+
+        parser.add_argument(
+            '--dataset',
+            type=str,
+            default=str(DEFAULT_DATASET),
+            help='OPIS price CSV used as the station data',
+        )
+
+        parser.add_argument(
+            '--snapshot',
+            action='append',
+            help='Station snapshot to sweep over instead of the OPIS data (repeatable)',
+        )
+
+        parser.add_argument(
+            '--providers',
+            type=str,
+            help='Base URL of Nominatim/OpenRouteService stand-ins to call instead of in-process stubs',
+        )
+
+        parser.add_argument(
+            '--spacing-miles',
+            type=float,
+            default=50,
+            help='Distance between vertices of the stubbed route geometry (default: 50)',
+        )
+
+        parser.add_argument(
+            '--precision',
+            choices=MODES,
+            help='Distance precision mode (default: ROUTE_DISTANCE_PRECISION)',
+        )
+
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=3,
+            help='Untimed routes planned first (default: 3)',
+        )
+
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Write the JSON report to this file',
+        )
+
+        parser.add_argument(
+            '--compare',
+            type=str,
+            help='Baseline report to compare against',
+        )
+
+        parser.add_argument(
+            '--current',
+            type=str,
+            help='Compare this existing report instead of running the benchmark',
+        )
+
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.10,
+            help='Relative p50/p95 increase counted as a regression (default: 0.10)',
+        )
+
+    def handle(self, *args, **options):
+        if options['current']:
+            if not options['compare']:
+                raise CommandError('--current needs --compare')
+            report = self.read_report(options['current'])
+        else:
+            report = self.run(options)
+            if 'sweep' in report:
+                self.print_scaling(report)
+            else:
+                self.print_report(report)
+            if options['output']:
+                Path(options['output']).write_text(json.dumps(report, indent=2), encoding='utf-8')
+                self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+
+        if options['compare']:
+            self.compare(self.read_report(options['compare']), report, options['threshold'])
+
+    def run(self, options):
+        routes = synthetic_routes(options['routes'], options['seed'], options['min_miles'], options['max_miles'])
+        meta = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'routes': len(routes),
+            'seed': options['seed'],
+            'min_miles': options['min_miles'],
+            'max_miles': options['max_miles'],
+            'spacing_miles': options['spacing_miles'],
+            'providers': options['providers'] or 'stub',
+            'precision': options['precision'] or settings.ROUTE_DISTANCE_PRECISION,
+        }
+
+        if not options['snapshot']:
+            if not Path(options['dataset']).exists():
+                raise CommandError(f'Dataset not found: {options["dataset"]}')
+            stage_start = time.perf_counter()
+            index = StationIndex(load_opis_stations(options['dataset']))
+            self.stdout.write(f'{len(index)} stations indexed in {time.perf_counter() - stage_start:.2f}s')
+            results = self.run_index(index, routes, options)
+            return {'meta': {**meta, 'dataset': Path(options['dataset']).name, 'stations': len(index)}, **results}
+
+        sweep = []
+        for path in options['snapshot']:
+            if not Path(path).exists():
+                raise CommandError(f'Snapshot not found: {path}')
+            stage_start = time.perf_counter()
+            index = SnapshotStationIndex(path)
+            self.stdout.write(f'{path}: {len(index)} stations opened in {time.perf_counter() - stage_start:.2f}s')
+            results = self.run_index(index, routes, options)
+            self.print_report(results)
+            sweep.append({'snapshot': Path(path).name, 'stations': len(index), **results})
+
+        sweep.sort(key=lambda entry: entry['stations'])
+        return {
+            'meta': meta,
+            'sweep': sweep,
+            'scaling': [
+                {
+                    'stations': entry['stations'],
+                    **{
+                        f'{name}_{metric}': summary[metric]
+                        for name, summary in [('end_to_end', entry['end_to_end']), *entry['stages'].items()]
+                        for metric in ('p50_ms', 'p95_ms')
+                    },
+                }
+                for entry in sweep
+            ],
+        }
+
+    def run_index(self, index, routes, options):
+        """Benchmark results of the routes against one station index"""
+        self.stdout.write(f'Planning {len(routes)} routes (seed {options["seed"]})')
+
+        def progress(number, route, seconds, response_data):
+            if number % 25 == 0 or number == len(routes):
+                self.stdout.write(f'  {number}/{len(routes)} routes')
+
+        overrides = {}
+        if options['providers']:
+            overrides = {'NOMINATIM_URL': options['providers'], 'OPENROUTESERVICE_URL': options['providers']}
+        if options['precision']:
+            overrides['ROUTE_DISTANCE_PRECISION'] = options['precision']
+
+        with override_settings(CACHES=BENCHMARK_CACHES, **overrides):
+            # Each index starts cold, also in a sweep over the same routes
+            cache.clear()
+            started = time.perf_counter()
+            results = run_benchmark(
+                index, routes, options['spacing_miles'], options['warmup'], progress,
+                live_providers=bool(options['providers'])
+            )
+        return {**results, 'elapsed_seconds': round(time.perf_counter() - started, 2)}
+
+    def read_report(self, path):
+        try:
+            return json.loads(Path(path).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read report {path}: {e}')
+
+    def print_report(self, report):
+        self.stdout.write('\n' + '=' * 64)
+        self.stdout.write(f'{"stage":<16}{"p50 ms":>12}{"p95 ms":>12}{"mean ms":>12}{"max ms":>12}')
+        self.stdout.write('-' * 64)
+        rows = [(stage, report['stages'].get(stage)) for stage in STAGES]
+        rows.append(('end_to_end', report['end_to_end']))
+        for name, summary in rows:
+            if summary:
+                self.stdout.write(
+                    f'{name:<16}{summary["p50_ms"]:>12.3f}{summary["p95_ms"]:>12.3f}'
+                    f'{summary["mean_ms"]:>12.3f}{summary["max_ms"]:>12.3f}'
+                )
+        self.stdout.write('-' * 64)
+        for band, summary in report['by_distance_miles'].items():
+            self.stdout.write(f'{band + " mi":<16}{summary["p50_ms"]:>12.3f}{summary["p95_ms"]:>12.3f}'
+                              f'{summary["mean_ms"]:>12.3f}{summary["max_ms"]:>12.3f}')
+        if report.get('errors') or report.get('provider_errors'):
+            self.stdout.write('-' * 64)
+            for name, count in {**report.get('errors', {}), **report.get('provider_errors', {})}.items():
+                self.stdout.write(self.style.WARNING(f'{name:<52}{count:>12}'))
+        self.stdout.write('=' * 64)
+
+    def print_scaling(self, report):
+        columns = ('end_to_end', 'station_search', 'optimize')
+        self.stdout.write('\n' + f'{"stations":>10}' + ''.join(f'{name + " p50/p95 ms":>30}' for name in columns))
+        for row in report['scaling']:
+            self.stdout.write(f'{row["stations"]:>10}' + ''.join(
+                f'{row.get(name + "_p50_ms", 0):>18.1f} /{row.get(name + "_p95_ms", 0):>9.1f}' for name in columns
+            ))
+
+    def compare(self, baseline, current, threshold):
+        for key in ('seed', 'routes', 'stations', 'spacing_miles', 'providers', 'precision'):
+            if baseline.get('meta', {}).get(key) != current.get('meta', {}).get(key):
+                self.stdout.write(self.style.WARNING(
+                    f'Reports differ in {key}: {baseline.get("meta", {}).get(key)} vs {current.get("meta", {}).get(key)}'
+                ))
+
+        # Sweeps are compared per station count present in both reports
+        if 'sweep' in baseline or 'sweep' in current:
+            baseline_entries = {entry['stations']: entry for entry in baseline.get('sweep', [])}
+            pairs = [
+                (f'{entry["stations"]} stations: ', baseline_entries[entry['stations']], entry)
+                for entry in current.get('sweep', []) if entry['stations'] in baseline_entries
+            ]
+        else:
+            pairs = [('', baseline, current)]
+
+        regressions = []
+        self.stdout.write(f'\n{"metric":<44}{"baseline":>12}{"current":>12}{"change":>10}')
+        for label, before, after in pairs:
+            rows, found = compare_reports(before, after, threshold)
+            regressions.extend(found)
+            for row in rows:
+                line = (f'{label + row["name"] + " " + row["metric"]:<44}{row["baseline"]:>12.3f}'
+                        f'{row["current"]:>12.3f}{row["change"]:>+10.1%}')
+                self.stdout.write(self.style.ERROR(line + '  REGRESSION') if row['regression'] else line)
+
+        if regressions:
+            raise CommandError(f'{len(regressions)} regressions above {threshold:.0%}')
+        self.stdout.write(self.style.SUCCESS(f'No regressions above {threshold:.0%}'))
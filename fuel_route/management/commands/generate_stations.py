@@ -0,0 +1,159 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from fuel_route.epochs import bump_station_epochs
+from fuel_route.models import FuelStation
+from fuel_route.signals import bulk_station_changes
+from fuel_route.station_index import write_snapshot_columns
+from fuel_route.synthetic import SYNTHETIC_RACK_ID_BASE, StationColumns, generate_stations
+
+
+class Command(BaseCommand):
+    """
+    Django management command to generate synthetic fuel stations for scale testing
+
+    Usage:
+        python manage.py generate_stations 100000
+        python manage.py generate_stations 1000000 --replace --batch-size 10000
+        python manage.py generate_stations 5000000 --no-load --snapshot-dir snapshots \\
+            --snapshot-sizes 100000,500000,1000000,5000000
+
+    Stations are clustered at interstate exits with per-state prices (see
+    fuel_route/synthetic.py) and get rack ids from 100,000,000 up, so
+    --replace can remove an earlier generated set without touching real
+    stations. Snapshots are station index files for
+    benchmark_routes --snapshot; smaller sizes are prefixes of the run.
+    """
+
+    help = 'Generate synthetic fuel stations along interstate corridors'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'count',
+            type=int,
+            help='Number of stations to generate'
+        )
+
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed (default: 42)',
+        )
+
+        parser.add_argument(
+            '--no-load',
+            action='store_true',
+            help='Only write snapshots, do not insert stations into the database',
+        )
+
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help='Delete previously generated stations first',
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Stations inserted per query (default: 5000)',
+        )
+
+        parser.add_argument(
+            '--snapshot-dir',
+            type=str,
+            help='Write station index snapshots (stations_<size>.idx) to this directory',
+        )
+
+        parser.add_argument(
+            '--snapshot-sizes',
+            type=str,
+            help='Comma-separated snapshot sizes (default: the full count)',
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        if count < 1:
+            raise CommandError('count must be positive')
+
+        sizes = []
+        if options['snapshot_dir']:
+            try:
+                sizes = sorted({int(size) for size in (options['snapshot_sizes'] or str(count)).split(',')})
+            except ValueError:
+                raise CommandError('--snapshot-sizes must be comma-separated integers')
+            if sizes[0] < 1 or sizes[-1] > count:
+                raise CommandError(f'Snapshot sizes must be between 1 and {count}')
+            os.makedirs(options['snapshot_dir'], exist_ok=True)
+        elif options['no_load']:
+            raise CommandError('--no-load needs --snapshot-dir')
+
+        deleted = 0
+        if not options['no_load']:
+            generated = FuelStation.objects.filter(rack_id__gte=SYNTHETIC_RACK_ID_BASE)
+            if options['replace']:
+                deleted = self.delete_generated()
+                self.stdout.write(f'Deleted {deleted} previously generated stations')
+            elif generated.exists():
+                raise CommandError('Generated stations already exist, use --replace to regenerate them')
+
+        started = time.monotonic()
+        columns = StationColumns() if sizes else None
+        batch = []
+        loaded = 0
+
+        # No per-instance signal work for millions of new rows; cached plans
+        # are versioned once below
+        with bulk_station_changes():
+            for position, station in enumerate(generate_stations(count, options['seed'])):
+                if columns is not None:
+                    columns.append(position + 1, station)
+                if not options['no_load']:
+                    name, address, city, state, rack_id, price, latitude, longitude = station
+                    batch.append(FuelStation(
+                        name=name, address=address, city=city, state=state, rack_id=rack_id,
+                        retail_price=price, latitude=latitude, longitude=longitude
+                    ))
+                    if len(batch) >= options['batch_size']:
+                        loaded += self.load_batch(batch)
+                        batch = []
+                if (position + 1) % 100000 == 0:
+                    self.stdout.write(f'Generated {position + 1} stations ({time.monotonic() - started:.0f}s)')
+
+            if batch:
+                loaded += self.load_batch(batch)
+        if loaded or deleted:
+            # bulk_create and the DELETE send no signals, so version cached plans here
+            bump_station_epochs()
+        if loaded:
+            self.stdout.write(self.style.SUCCESS(f'Loaded {loaded} stations into the database'))
+
+        for size in sizes:
+            path = os.path.join(options['snapshot_dir'], f'stations_{size}.idx')
+            write_snapshot_columns(path, *columns.prefix(size))
+            self.stdout.write(f'Snapshot: {size} stations -> {path} ({os.path.getsize(path) / 1e6:.1f} MB)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {count} stations in {time.monotonic() - started:.1f}s'
+        ))
+
+    @transaction.atomic
+    def delete_generated(self):
+        """
+        Delete generated stations with one DELETE, without loading the rows
+        or sending per-row signals (nothing references stations)
+        """
+        table = connection.ops.quote_name(FuelStation._meta.db_table)
+        column = connection.ops.quote_name(FuelStation._meta.get_field('rack_id').column)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {column} >= %s', [SYNTHETIC_RACK_ID_BASE])
+            return cursor.rowcount
+
+    @transaction.atomic
+    def load_batch(self, batch):
+        FuelStation.objects.bulk_create(batch, batch_size=len(batch))
+        return len(batch)
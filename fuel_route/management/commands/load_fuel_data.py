@@ -1,12 +1,18 @@
 import csv
+import logging
 import time
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+from fuel_route.epochs import bump_station_epochs
+from fuel_route.signals import bulk_station_changes
 from fuel_route.models import FuelStation
 
 
+logger = logging.getLogger(__name__)
+
+
 class Command(BaseCommand):
     """
     Django management command to load fuel station data from CSV file
@@ -62,7 +68,8 @@ class Command(BaseCommand):
             'updated': 0,
             'skipped': 0,
             'geocoded': 0,
-            'geocode_failed': 0
+            'geocode_failed': 0,
+            'invalid_rows': 0
         }
 
     def handle(self, *args, **options):
@@ -84,14 +91,19 @@ class Command(BaseCommand):
         try:
             with open(csv_file, 'r', encoding='utf-8') as file:
                 self.stdout.write(f'Successfully opened CSV file: {csv_file}')
-                self.process_csv_file(
-                    file, skip_geocoding, update_existing, batch_size, geocode_delay
-                )
+                # One epoch bump for the whole load (below) instead of one per row
+                with bulk_station_changes():
+                    self.process_csv_file(
+                        file, skip_geocoding, update_existing, batch_size, geocode_delay
+                    )
         except FileNotFoundError:
             raise CommandError(f'CSV file not found: {csv_file}')
         except Exception as e:
             raise CommandError(f'Error reading CSV file: {e}')
         
+        # Cached corridors and fuel plans refer to the old station data
+        bump_station_epochs()
+        
         self.print_final_stats()
 
     def process_csv_file(self, file, skip_geocoding, update_existing, batch_size, geocode_delay):
@@ -109,20 +121,19 @@ class Command(BaseCommand):
         
         batch = []
         
+        # Per-row output used to dominate the load time; bad rows are
+        # counted for the summary and logged instead
         for row_num, row in enumerate(reader, 1):
-            self.stdout.write(f'Processing row {row_num}: {row[:3]}...')  # Show first 3 columns
             if len(row) < 6:  # Need at least 6 columns for basic data
-                self.stdout.write(
-                    self.style.WARNING(f'Row {row_num}: Insufficient columns ({len(row)}), skipping')
-                )
+                logger.debug("Row %s: insufficient columns (%s), skipping", row_num, len(row))
+                self.stats['invalid_rows'] += 1
                 continue
             
             station_data = self.parse_csv_row(row, row_num)
             if station_data:
                 batch.append(station_data)
-                self.stdout.write(f'Added station: {station_data["name"]}')
             else:
-                self.stdout.write(f'Failed to parse row {row_num}')
+                self.stats['invalid_rows'] += 1
             
             # Process batch when it reaches the specified size
             if len(batch) >= batch_size:
@@ -160,9 +171,7 @@ class Command(BaseCommand):
                 rack_id = int(float(row[4])) if len(row) > 4 else 0
                 retail_price = float(row[5]) if len(row) > 5 else 0.0
             except (ValueError, IndexError):
-                self.stdout.write(
-                    self.style.WARNING(f'Row {row_num}: Invalid numeric data, using defaults')
-                )
+                logger.debug("Row %s: invalid numeric data, using defaults", row_num)
                 rack_id = 0
                 retail_price = 0.0
             
@@ -177,9 +186,7 @@ class Command(BaseCommand):
             }
             
         except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'Row {row_num}: Error parsing - {e}')
-            )
+            logger.warning("Row %s: error parsing - %s", row_num, e)
             return None
 
     @transaction.atomic
@@ -308,6 +315,7 @@ class Command(BaseCommand):
         self.stdout.write(f'Stations created: {self.stats["created"]}')
         self.stdout.write(f'Stations updated: {self.stats["updated"]}')
         self.stdout.write(f'Records skipped: {self.stats["skipped"]}')
+        self.stdout.write(f'Invalid rows: {self.stats["invalid_rows"]}')
         self.stdout.write(f'Locations geocoded: {self.stats["geocoded"]}')
         self.stdout.write(f'Geocoding failures: {self.stats["geocode_failed"]}')
         
@@ -0,0 +1,306 @@
+import json
+import platform
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fuel_route.loadtest import ENDPOINTS, LaneMix, LocalStack, find_knee, run_level, warm_hot_lanes
+
+
+class Command(BaseCommand):
+    """
+    Django management command to load test the route API with concurrency sweeps
+
+    Usage:
+        python manage.py load_test --start-server --workers 1,2,4 --concurrency 1,2,4,8,16,32
+        python manage.py load_test --start-server --hot-ratio 0.5 --batch-ratio 0.1 --duration 30
+        python manage.py load_test --url http://127.0.0.1:8000 --concurrency 4,8,16 --output load.json
+
+    --start-server starts the fake providers (run_fake_providers) and a
+    gunicorn server using them for every --workers value, so the sweep
+    shows how throughput scales with workers. With --url the server must
+    already use the fake providers (see fuel_route/loadtest.py). Each
+    level reports throughput, p50/p95/p99 latency and error rates, and
+    every sweep the concurrency where throughput saturates and where
+    latency collapses.
+    """
+
+    help = 'Load test /api/route/ and the batch endpoint at increasing concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            type=str,
+            help='Base URL of a running server to test',
+        )
+
+        parser.add_argument(
+            '--start-server',
+            action='store_true',
+            help='Start fake providers and a gunicorn server for the test',
+        )
+
+        parser.add_argument(
+            '--workers',
+            type=str,
+            default='2',
+            help='Comma-separated gunicorn worker counts to sweep with --start-server (default: 2)',
+        )
+
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=1,
+            help='Threads per gunicorn worker with --start-server (default: 1)',
+        )
+
+        parser.add_argument(
+            '--no-preload',
+            action='store_true',
+            help='Start gunicorn without GUNICORN_PRELOAD',
+        )
+
+        parser.add_argument(
+            '--concurrency',
+            type=str,
+            default='1,2,4,8,16,32',
+            help='Comma-separated concurrency levels (default: 1,2,4,8,16,32)',
+        )
+
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=15,
+            help='Seconds per concurrency level (default: 15)',
+        )
+
+        parser.add_argument(
+            '--endpoint',
+            choices=sorted(ENDPOINTS),
+            default='route',
+            help='Single-route endpoint to drive (default: route)',
+        )
+
+        parser.add_argument(
+            '--hot-ratio',
+            type=float,
+            default=0.8,
+            help='Share of trips on warmed, cached lanes (default: 0.8)',
+        )
+
+        parser.add_argument(
+            '--hot-lanes',
+            type=int,
+            default=20,
+            help='Number of hot lanes (default: 20)',
+        )
+
+        parser.add_argument(
+            '--batch-ratio',
+            type=float,
+            default=0.0,
+            help='Share of requests sent to the batch endpoint (default: 0)',
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Trips per batch request (default: 10)',
+        )
+
+        parser.add_argument(
+            '--min-miles',
+            type=float,
+            default=100,
+            help='Shortest lane in miles (default: 100)',
+        )
+
+        parser.add_argument(
+            '--max-miles',
+            type=float,
+            default=1500,
+            help='Longest lane in miles (default: 1500)',
+        )
+
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Client timeout per request in seconds (default: 30)',
+        )
+
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for lanes and the request mix (default: 42)',
+        )
+
+        parser.add_argument(
+            '--provider-latency-ms',
+            type=float,
+            default=50,
+            help='Fake geocoding latency with --start-server (default: 50)',
+        )
+
+        parser.add_argument(
+            '--routing-latency-ms',
+            type=float,
+            default=300,
+            help='Fake routing latency with --start-server (default: 300)',
+        )
+
+        parser.add_argument(
+            '--provider-error-rate',
+            type=float,
+            default=0.0,
+            help='Fake provider error rate with --start-server (default: 0)',
+        )
+
+        parser.add_argument(
+            '--latency-factor',
+            type=float,
+            default=3.0,
+            help='p95 growth over the lowest level that counts as collapse (default: 3)',
+        )
+
+        parser.add_argument(
+            '--max-error-rate',
+            type=float,
+            default=0.01,
+            help='Error rate that counts as collapse (default: 0.01)',
+        )
+
+        parser.add_argument(
+            '--server-log',
+            type=str,
+            help='Append the output of started servers to this file',
+        )
+
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Write the JSON report to this file',
+        )
+
+    def handle(self, *args, **options):
+        if bool(options['url']) == options['start_server']:
+            raise CommandError('Use exactly one of --url and --start-server')
+        levels = self.parse_levels(options['concurrency'], '--concurrency')
+        worker_counts = self.parse_levels(options['workers'], '--workers') if options['start_server'] else [None]
+        if not 0 <= options['hot_ratio'] <= 1 or not 0 <= options['batch_ratio'] <= 1:
+            raise CommandError('--hot-ratio and --batch-ratio must be between 0 and 1')
+
+        mix = LaneMix(
+            hot_ratio=options['hot_ratio'],
+            batch_ratio=options['batch_ratio'],
+            batch_size=options['batch_size'],
+            hot_lanes=options['hot_lanes'],
+            seed=options['seed'],
+            min_miles=options['min_miles'],
+            max_miles=options['max_miles'],
+            endpoint=options['endpoint'],
+        )
+        report = {
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                **{key: options[key] for key in (
+                    'endpoint', 'duration', 'hot_ratio', 'hot_lanes', 'batch_ratio', 'batch_size',
+                    'min_miles', 'max_miles', 'timeout', 'seed', 'threads',
+                )},
+            },
+            'runs': [],
+        }
+
+        for workers in worker_counts:
+            if workers is None:
+                run = self.sweep(options['url'], mix, levels, options)
+            else:
+                self.stdout.write(f'Starting gunicorn with {workers} workers and fake providers')
+                provider_options = [
+                    '--latency-ms', str(options['provider_latency_ms']),
+                    '--routing-latency-ms', str(options['routing_latency_ms']),
+                    '--error-rate', str(options['provider_error_rate']),
+                ]
+                try:
+                    with LocalStack(workers, options['threads'], not options['no_preload'],
+                                    provider_options, log_path=options['server_log']) as stack:
+                        run = self.sweep(stack.url, mix, levels, options)
+                except RuntimeError as e:
+                    raise CommandError(f'Could not start the server: {e}')
+            report['runs'].append({'workers': workers, **run})
+            self.print_run(report['runs'][-1])
+
+        if len(report['runs']) > 1:
+            self.print_workers(report['runs'])
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2), encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+
+    def parse_levels(self, value, option):
+        try:
+            levels = sorted({int(level) for level in value.split(',')})
+        except ValueError:
+            raise CommandError(f'{option} must be comma-separated integers')
+        if levels[0] < 1:
+            raise CommandError(f'{option} values must be positive')
+        return levels
+
+    def sweep(self, url, mix, levels, options):
+        url = url.rstrip('/')
+        failed = warm_hot_lanes(url, mix, options['timeout'] * 2)
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} of {len(mix.hot)} hot lanes failed to warm'))
+
+        results = []
+        for concurrency in levels:
+            level = run_level(url, mix, concurrency, options['duration'], options['timeout'], options['seed'])
+            latency = level['latency'] or {}
+            self.stdout.write(
+                f'  concurrency {concurrency:>4}: {level["throughput_rps"]:>8.1f} req/s  '
+                f'p95 {latency.get("p95_ms", 0):>8.1f} ms  errors {level["error_rate"]:.1%}'
+            )
+            results.append(level)
+
+        return {'levels': results, 'knee': find_knee(results, options['latency_factor'], options['max_error_rate'])}
+
+    def print_run(self, run):
+        title = f'{run["workers"]} workers' if run['workers'] else 'server'
+        self.stdout.write('\n' + '=' * 88)
+        self.stdout.write(f'{title}: {"req/s":>13}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>9}'
+                          f'{"hot p95":>11}{"cold p95":>11}')
+        self.stdout.write('-' * 88)
+        for level in run['levels']:
+            latency = level['latency'] or {}
+            kinds = level['by_kind']
+            self.stdout.write(
+                f'{"concurrency " + str(level["concurrency"]):<18}{level["throughput_rps"]:>8.1f}'
+                f'{latency.get("p50_ms", 0):>10.1f}{latency.get("p95_ms", 0):>10.1f}{latency.get("p99_ms", 0):>10.1f}'
+                f'{level["error_rate"]:>9.1%}'
+                + ''.join(
+                    f'{((kinds.get(kind) or {}).get("latency") or {}).get("p95_ms", 0):>11.1f}'
+                    for kind in ('hot', 'cold')
+                )
+            )
+        self.stdout.write('-' * 88)
+        knee = run['knee']
+        self.stdout.write(
+            f'Peak {knee["peak_throughput_rps"]} req/s at concurrency {knee["peak_concurrency"]}, '
+            f'saturates at {knee["saturation_concurrency"]}, '
+            + (f'latency collapses at {knee["collapse_concurrency"]}' if knee['collapse_concurrency']
+               else 'no latency collapse in the tested range')
+        )
+        self.stdout.write('=' * 88)
+
+    def print_workers(self, runs):
+        self.stdout.write(f'\n{"workers":>8}{"peak req/s":>12}{"at":>6}{"saturates":>11}{"collapses":>11}')
+        for run in runs:
+            knee = run['knee']
+            self.stdout.write(
+                f'{run["workers"]:>8}{knee["peak_throughput_rps"]:>12.1f}{str(knee["peak_concurrency"]):>6}'
+                f'{str(knee["saturation_concurrency"]):>11}{str(knee["collapse_concurrency"] or "-"):>11}'
+            )
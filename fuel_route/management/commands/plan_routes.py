@@ -0,0 +1,341 @@
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from fuel_route.serializers import VehicleSerializer
+from fuel_route.station_index import SnapshotStationIndex, get_station_index, write_snapshot
+from fuel_route.views import FuelRouteView, LocationNotFoundError, get_planner
+
+
+VEHICLE_COLUMNS = ('max_range_miles', 'miles_per_gallon', 'max_station_distance_miles')
+
+CSV_OUTPUT_FIELDS = (
+    'index', 'start_location', 'end_location', 'total_distance_miles', 'total_fuel_cost',
+    'total_fuel_needed_gallons', 'fuel_stop_count', 'fuel_stops', 'error'
+)
+
+@lru_cache(maxsize=1024)
+def _parse_vehicle(values):
+    vehicle = {
+        column: value.strip()
+        for column, value in zip(VEHICLE_COLUMNS, values)
+        if value.strip()
+    }
+    serializer = VehicleSerializer(data=vehicle)
+    if not serializer.is_valid():
+        return json.dumps(serializer.errors)
+    # Cached as an immutable tuple, every caller gets its own dict
+    return tuple(serializer.validated_data.items())
+
+
+def parse_vehicle(values):
+    """Vehicle overrides from the optional columns, or an error message"""
+    vehicle = _parse_vehicle(values)
+    return dict(vehicle) if isinstance(vehicle, tuple) else vehicle
+
+
+# Set in each worker process by init_worker
+_worker_index = None
+_worker_planner = None
+
+
+def init_worker(snapshot_path):
+    """Open the shared station snapshot once per worker process"""
+    global _worker_index, _worker_planner
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    _worker_index = SnapshotStationIndex(snapshot_path)
+    _worker_planner = FuelRouteView()
+
+
+def plan_chunk(jobs):
+    """
+    Corridor search and fuel-stop optimization for a chunk of routed trips.
+    Each job is (index, start, end, vehicle, lane_hash, route_data, error);
+    returns (rows, {'corridor': seconds, 'optimize': seconds}).
+    """
+    timings = {'corridor': 0.0, 'optimize': 0.0}
+    corridors = {}
+    rows = []
+
+    for index, start_location, end_location, vehicle, lane_hash, route_data, error in jobs:
+        if error:
+            rows.append((index, start_location, end_location, None, error))
+            continue
+
+        planner = _worker_planner.with_vehicle(vehicle)
+        try:
+            # Trips on the same lane share one corridor per detour limit
+            stage_start = time.monotonic()
+            corridor_key = (lane_hash, planner.max_station_distance_miles)
+            if corridor_key not in corridors:
+                corridors[corridor_key] = _worker_index.corridor(
+                    route_data['coordinates'], planner.max_station_distance_miles
+                )
+            timings['corridor'] += time.monotonic() - stage_start
+
+            stage_start = time.monotonic()
+            response_data = planner.build_route_plan(route_data, corridors[corridor_key])
+            timings['optimize'] += time.monotonic() - stage_start
+            rows.append((index, start_location, end_location, response_data, None))
+        except Exception as e:
+            rows.append((index, start_location, end_location, None, f'{type(e).__name__}: {e}'))
+
+    return rows, timings
+
+
+class Command(BaseCommand):
+    """
+    Django management command to plan fuel stops for a large file of trips
+
+    Usage:
+        python manage.py plan_routes trips.csv --workers 8
+        python manage.py plan_routes trips.csv --output plans.ndjson --format ndjson
+        python manage.py plan_routes trips.csv --output plans.csv --chunk-size 500
+
+    The trips file is a CSV of start_location,end_location with optional
+    max_range_miles,miles_per_gallon,max_station_distance_miles columns
+    (header optional). Input is read and output written chunk by chunk, so
+    memory stays flat for any file size. Station data is loaded once into a
+    memory-mapped snapshot shared by all worker processes.
+    """
+
+    help = 'Plan fuel stops for a CSV of trips using a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'trips_file',
+            type=str,
+            help='CSV file with start_location,end_location rows'
+        )
+
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: CPU count)',
+        )
+
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Trips sent to a worker at a time (default: 200)',
+        )
+
+        parser.add_argument(
+            '--io-threads',
+            type=int,
+            default=4,
+            help='Threads used for geocoding and routing (default: 4)',
+        )
+
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Output file (default: stdout)',
+        )
+
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'ndjson'),
+            default='csv',
+            help='Output format (default: csv)',
+        )
+
+        parser.add_argument(
+            '--snapshot',
+            type=str,
+            help='Keep the station snapshot at this path instead of a temporary file',
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['trips_file']):
+            raise CommandError(f'Trips file not found: {options["trips_file"]}')
+
+        workers = max(1, options['workers'])
+        chunk_size = max(1, options['chunk_size'])
+        self.planner = get_planner()
+        self.timings = {stage: 0.0 for stage in ('snapshot', 'read', 'geometry', 'corridor', 'optimize', 'write')}
+        self.counts = {'trips': 0, 'succeeded': 0, 'failed': 0}
+
+        # Station index is filled once and shared with the workers
+        stage_start = time.monotonic()
+        snapshot_path = options['snapshot']
+        if not snapshot_path:
+            fd, snapshot_path = tempfile.mkstemp(prefix='stations_', suffix='.idx')
+            os.close(fd)
+        index = get_station_index()
+        write_snapshot(index, snapshot_path)
+        self.timings['snapshot'] = time.monotonic() - stage_start
+        self.stderr.write(f'Station snapshot: {len(index)} stations -> {snapshot_path}')
+
+        # Workers never touch the database, so no connection is inherited
+        connections.close_all()
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        write_rows = self.csv_writer(output) if options['format'] == 'csv' else self.ndjson_writer(output)
+
+        started = time.monotonic()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=init_worker, initargs=(snapshot_path,)
+            ) as pool:
+                # Fork the workers before any I/O thread exists
+                pool.submit(os.getpid).result()
+                io_pool = ThreadPoolExecutor(max_workers=max(1, options['io_threads']))
+                in_flight = deque()
+                for chunk in self.read_chunks(options['trips_file'], chunk_size):
+                    jobs = self.route_chunk(chunk, io_pool)
+                    in_flight.append(pool.submit(plan_chunk, jobs))
+                    # Bound the chunks held in memory; results are written in input order
+                    while len(in_flight) > workers * 2:
+                        self.write_result(in_flight.popleft(), write_rows)
+                while in_flight:
+                    self.write_result(in_flight.popleft(), write_rows)
+                io_pool.shutdown()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            if not options['snapshot']:
+                os.remove(snapshot_path)
+
+        self.print_summary(time.monotonic() - started, workers)
+
+    def read_chunks(self, path, chunk_size):
+        """Yield lists of (index, start, end, vehicle or error) from the trips file"""
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            reader = csv.reader(file)
+            index = 0
+            while True:
+                stage_start = time.monotonic()
+                rows = list(islice(reader, chunk_size))
+                if not rows:
+                    break
+
+                chunk = []
+                for row in rows:
+                    if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                        continue
+                    if row[0].strip().lower() in ('start', 'start_location', 'origin'):
+                        continue
+                    chunk.append((index, row[0].strip(), row[1].strip(), parse_vehicle(tuple(row[2:5]))))
+                    index += 1
+                self.timings['read'] += time.monotonic() - stage_start
+
+                if chunk:
+                    yield chunk
+
+    def route_chunk(self, chunk, io_pool):
+        """Geometry for each distinct lane in a chunk; returns worker jobs"""
+        stage_start = time.monotonic()
+        lanes = {}
+        for _, start_location, end_location, vehicle in chunk:
+            if isinstance(vehicle, dict):
+                lane_hash = self.planner.get_lane_hash(start_location, end_location)
+                if lane_hash not in lanes:
+                    lanes[lane_hash] = io_pool.submit(self.get_route_geometry, start_location, end_location)
+
+        jobs = []
+        for index, start_location, end_location, vehicle in chunk:
+            if not isinstance(vehicle, dict):
+                jobs.append((index, start_location, end_location, {}, None, None, vehicle))
+                continue
+            lane_hash = self.planner.get_lane_hash(start_location, end_location)
+            route_data, error = lanes[lane_hash].result()
+            jobs.append((index, start_location, end_location, vehicle, lane_hash, route_data, error))
+
+        self.timings['geometry'] += time.monotonic() - stage_start
+        return jobs
+
+    def get_route_geometry(self, start_location, end_location):
+        try:
+            return self.planner.get_route_geometry(start_location, end_location), None
+        except LocationNotFoundError as e:
+            return None, str(e)
+        except Exception as e:
+            return None, f'{type(e).__name__}: {e}'
+        finally:
+            close_old_connections()
+
+    def write_result(self, future, write_rows):
+        rows, timings = future.result()
+        for stage, seconds in timings.items():
+            self.timings[stage] += seconds
+
+        stage_start = time.monotonic()
+        write_rows(rows)
+        self.timings['write'] += time.monotonic() - stage_start
+
+        for row in rows:
+            self.counts['trips'] += 1
+            self.counts['failed' if row[4] else 'succeeded'] += 1
+
+    def csv_writer(self, output):
+        writer = csv.writer(output)
+        writer.writerow(CSV_OUTPUT_FIELDS)
+
+        def write_rows(rows):
+            for index, start_location, end_location, response_data, error in rows:
+                if error:
+                    writer.writerow([index, start_location, end_location, '', '', '', '', '', error])
+                    continue
+                stops = '; '.join(
+                    f"{stop['name']} ({stop['city']}, {stop['state']}) ${stop['price']:.3f}"
+                    for stop in response_data['fuel_stops']
+                )
+                writer.writerow([
+                    index, start_location, end_location,
+                    response_data['total_distance_miles'],
+                    response_data['total_fuel_cost'],
+                    response_data['total_fuel_needed_gallons'],
+                    len(response_data['fuel_stops']),
+                    stops,
+                    ''
+                ])
+            output.flush()
+
+        return write_rows
+
+    def ndjson_writer(self, output):
+        def write_rows(rows):
+            for index, start_location, end_location, response_data, error in rows:
+                line = {'index': index, 'start_location': start_location, 'end_location': end_location}
+                if error:
+                    line['error'] = error
+                else:
+                    line['result'] = response_data
+                output.write(json.dumps(line) + '\n')
+            output.flush()
+
+        return write_rows
+
+    def print_summary(self, elapsed, workers):
+        """Throughput and time spent per stage"""
+        self.stderr.write('\n' + '='*50)
+        self.stderr.write(self.style.SUCCESS('ROUTE PLANNING COMPLETE'))
+        self.stderr.write('='*50)
+        self.stderr.write(f'Trips: {self.counts["trips"]}')
+        self.stderr.write(f'Succeeded: {self.counts["succeeded"]}')
+        self.stderr.write(f'Failed: {self.counts["failed"]}')
+        self.stderr.write(f'Workers: {workers}')
+        self.stderr.write(f'Elapsed: {elapsed:.2f}s')
+        if elapsed > 0:
+            self.stderr.write(f'Throughput: {self.counts["trips"] / elapsed:.1f} trips/s')
+
+        self.stderr.write('Stage time (corridor and optimize summed across workers):')
+        for stage, seconds in self.timings.items():
+            self.stderr.write(f'  {stage:<10} {seconds:8.2f}s')
+        self.stderr.write('='*50)
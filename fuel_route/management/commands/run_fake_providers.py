@@ -0,0 +1,143 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from fuel_route.fake_providers import FakeProviderServer, ProviderFaults
+
+
+class Command(BaseCommand):
+    """
+    Django management command to serve local stand-ins for Nominatim and OpenRouteService
+
+    Usage:
+        python manage.py run_fake_providers
+        python manage.py run_fake_providers --port 8765 --latency-ms 80 --routing-latency-ms 400
+        python manage.py run_fake_providers --error-rate 0.05 --timeout-rate 0.01 --hang-seconds 20
+
+    Then run the app (or benchmark_routes --providers) with
+        NOMINATIM_URL=http://127.0.0.1:8765 OPENROUTESERVICE_URL=http://127.0.0.1:8765
+        OPENROUTE_API_KEY=fake
+
+    Responses are deterministic (see fuel_route/fake_providers.py). Fault
+    options apply to both providers; POST /_fake/faults changes them per
+    provider while the server runs and GET /_fake/stats counts outcomes.
+    """
+
+    help = 'Serve deterministic fake Nominatim and OpenRouteService APIs for offline testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            type=str,
+            default='127.0.0.1',
+            help='Interface to listen on (default: 127.0.0.1)',
+        )
+
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8765,
+            help='Port to listen on (default: 8765)',
+        )
+
+        parser.add_argument(
+            '--latency-ms',
+            type=float,
+            default=0,
+            help='Added latency per request in milliseconds (default: 0)',
+        )
+
+        parser.add_argument(
+            '--routing-latency-ms',
+            type=float,
+            help='Latency for directions requests instead of --latency-ms',
+        )
+
+        parser.add_argument(
+            '--jitter-ms',
+            type=float,
+            default=0,
+            help='Random +/- variation of the latency in milliseconds (default: 0)',
+        )
+
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Share of requests answered with --error-status (default: 0)',
+        )
+
+        parser.add_argument(
+            '--error-status',
+            type=int,
+            default=503,
+            help='HTTP status of injected errors (default: 503)',
+        )
+
+        parser.add_argument(
+            '--timeout-rate',
+            type=float,
+            default=0.0,
+            help='Share of requests held for --hang-seconds before a 504 (default: 0)',
+        )
+
+        parser.add_argument(
+            '--hang-seconds',
+            type=float,
+            default=30,
+            help='How long a timed out request is held (default: 30)',
+        )
+
+        parser.add_argument(
+            '--spacing-miles',
+            type=float,
+            default=50,
+            help='Distance between vertices of returned route geometries (default: 50)',
+        )
+
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed for latency jitter and fault injection (default: 0)',
+        )
+
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Log every request',
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['error_rate'] + options['timeout_rate'] <= 1:
+            raise CommandError('--error-rate plus --timeout-rate must be between 0 and 1')
+
+        faults = {}
+        for number, provider in enumerate(('nominatim', 'openrouteservice')):
+            latency_ms = options['latency_ms']
+            if provider == 'openrouteservice' and options['routing_latency_ms'] is not None:
+                latency_ms = options['routing_latency_ms']
+            faults[provider] = ProviderFaults(
+                latency_ms=latency_ms,
+                jitter_ms=options['jitter_ms'],
+                error_rate=options['error_rate'],
+                timeout_rate=options['timeout_rate'],
+                error_status=options['error_status'],
+                hang_seconds=options['hang_seconds'],
+                seed=options['seed'] + number,
+            )
+
+        try:
+            server = FakeProviderServer(
+                (options['host'], options['port']), faults, options['spacing_miles'], options['verbose']
+            )
+        except OSError as e:
+            raise CommandError(f'Could not listen on {options["host"]}:{options["port"]}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Fake providers listening on {server.url}'))
+        self.stdout.write(f'  NOMINATIM_URL={server.url} OPENROUTESERVICE_URL={server.url} OPENROUTE_API_KEY=fake')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Requests served: {server.stats_snapshot()}')
@@ -0,0 +1,115 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from fuel_route.jobs import claim_next_job, purge_expired_jobs, requeue_stale_jobs, run_job
+from fuel_route.planner import preload_route_planner
+
+
+class Command(BaseCommand):
+    """
+    Django management command to process queued route jobs
+
+    Usage:
+        python manage.py run_route_worker
+        python manage.py run_route_worker --concurrency 4 --poll-interval 0.5
+        python manage.py run_route_worker --once
+
+    Jobs are submitted through POST /api/jobs/ and stored in the database,
+    so several workers (on one or more machines) can share the queue.
+    """
+
+    help = 'Process queued route planning jobs from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Number of jobs processed in parallel (default: 1)',
+        )
+
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty (default: 1.0)',
+        )
+
+        parser.add_argument(
+            '--maintenance-interval',
+            type=float,
+            default=60,
+            help='Seconds between requeueing stale jobs and purging expired ones (default: 60)',
+        )
+
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when the queue is empty instead of waiting for new jobs',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        self.planner = preload_route_planner().view
+        self.stop = threading.Event()
+        self.stdout.write(self.style.SUCCESS(f'Route worker started with concurrency {concurrency}'))
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(self.work, options['poll_interval'], options['maintenance_interval'], options['once'])
+                for _ in range(concurrency)
+            ]
+            try:
+                while not all(future.done() for future in futures):
+                    time.sleep(0.2)
+            except KeyboardInterrupt:
+                # Let running jobs finish, then stop
+                self.stdout.write(self.style.WARNING('Route worker interrupted, finishing running jobs'))
+                self.stop.set()
+            processed = sum(future.result() for future in futures)
+
+        self.stdout.write(self.style.SUCCESS(f'Route worker stopped after {processed} jobs'))
+
+    def work(self, poll_interval, maintenance_interval, once):
+        """Claim and run jobs until the queue is empty (--once) or forever"""
+        processed = 0
+        next_maintenance = 0
+
+        while not self.stop.is_set():
+            try:
+                if time.monotonic() >= next_maintenance:
+                    self.maintain()
+                    next_maintenance = time.monotonic() + maintenance_interval
+
+                job = claim_next_job()
+                if job is None:
+                    if once:
+                        break
+                    self.stop.wait(poll_interval)
+                    continue
+
+                started = time.monotonic()
+                run_job(job, self.planner)
+                processed += 1
+                elapsed_ms = (time.monotonic() - started) * 1000
+                if job.error:
+                    self.stdout.write(self.style.ERROR(f'FAILED {job.kind} job {job.id} ({elapsed_ms:.0f}ms): {job.error}'))
+                else:
+                    self.stdout.write(f'OK     {job.kind} job {job.id} ({elapsed_ms:.0f}ms)')
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Worker error: {e}'))
+                self.stop.wait(poll_interval)
+            finally:
+                close_old_connections()
+
+        return processed
+
+    def maintain(self):
+        requeued, failed = requeue_stale_jobs()
+        purged = purge_expired_jobs()
+        if requeued or failed or purged:
+            self.stdout.write(f'Requeued {requeued} stale jobs, failed {failed}, purged {purged} expired')
@@ -0,0 +1,223 @@
+import csv
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from fuel_route.views import LocationNotFoundError, get_planner
+
+
+class Command(BaseCommand):
+    """
+    Django management command to precompute route geometry, corridor
+    candidates and fuel plans for the busiest lanes
+
+    Usage:
+        python manage.py warm_route_cache lanes.csv
+        python manage.py warm_route_cache --from-log /var/log/route_requests.jsonl --top 100
+        python manage.py warm_route_cache lanes.csv --concurrency 8 --force
+
+    The lanes file is a CSV of start_location,end_location (header optional).
+    The request log is the JSON-lines file written when ROUTE_REQUEST_LOG is set.
+    """
+
+    help = 'Precompute cached route geometry, corridors and fuel plans for a list of lanes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'lanes_file',
+            nargs='?',
+            type=str,
+            help='CSV file with start_location,end_location rows'
+        )
+
+        parser.add_argument(
+            '--from-log',
+            type=str,
+            help='Read lanes from a route request log (JSON lines) instead of a CSV file',
+        )
+
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=50,
+            help='Number of most requested lanes to warm from the request log (default: 50)',
+        )
+
+        parser.add_argument(
+            '--since-hours',
+            type=float,
+            default=24,
+            help='Only count request log entries from the last N hours (default: 24)',
+        )
+
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Number of lanes warmed in parallel (default: 4)',
+        )
+
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute entries that are already cached',
+        )
+
+    def handle(self, *args, **options):
+        if options['from_log']:
+            lanes = self.read_request_log(options['from_log'], options['top'], options['since_hours'])
+        elif options['lanes_file']:
+            lanes = self.read_lanes_file(options['lanes_file'])
+        else:
+            raise CommandError('Provide a lanes CSV file or --from-log')
+
+        if not lanes:
+            self.stdout.write(self.style.WARNING('No lanes to warm'))
+            return
+
+        concurrency = max(1, options['concurrency'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Warming {len(lanes)} lanes with concurrency {concurrency}')
+        )
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(
+                lambda lane: self.warm_lane(lane[0], lane[1], options['force']), lanes
+            ))
+        elapsed = time.monotonic() - started
+
+        for result in results:
+            self.print_lane_result(result)
+        self.print_summary(results, elapsed)
+
+    def read_lanes_file(self, path):
+        """Read start,end pairs from a CSV file"""
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                rows = list(csv.reader(file))
+        except FileNotFoundError:
+            raise CommandError(f'Lanes file not found: {path}')
+
+        lanes = []
+        for row in rows:
+            if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                continue
+            if row[0].strip().lower() in ('start', 'start_location', 'origin'):
+                continue
+            lanes.append((row[0].strip(), row[1].strip()))
+        return self.dedupe(lanes)
+
+    def read_request_log(self, path, top, since_hours):
+        """Most requested lanes from the route request log"""
+        cutoff = time.time() - since_hours * 3600
+        counts = Counter()
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    # Lanes are start/end pairs; multi-stop routes are not warmed
+                    if entry.get('timestamp', 0) < cutoff or entry.get('waypoints'):
+                        continue
+                    counts[(entry['start_location'], entry['end_location'])] += 1
+        except FileNotFoundError:
+            raise CommandError(f'Request log not found: {path}')
+
+        return [lane for lane, _ in counts.most_common(top)]
+
+    def dedupe(self, lanes):
+        seen = set()
+        unique = []
+        for lane in lanes:
+            key = (lane[0].lower(), lane[1].lower())
+            if key not in seen:
+                seen.add(key)
+                unique.append(lane)
+        return unique
+
+    def warm_lane(self, start_location, end_location, force):
+        """Warm one lane and time each pipeline stage"""
+        view = get_planner()
+        result = {
+            'lane': f'{start_location} -> {end_location}',
+            'stages': {},
+            'error': None
+        }
+
+        try:
+            # Geometry
+            geometry_key = view.get_geometry_cache_key(start_location, end_location)
+            cached = cache.has_key(geometry_key)
+            if force:
+                cache.delete(geometry_key)
+            stage_start = time.monotonic()
+            route_data = view.get_route_geometry(start_location, end_location)
+            result['stages']['geometry'] = (time.monotonic() - stage_start, cached)
+
+            # Corridor candidates
+            corridor_key = view.get_corridor_cache_key(start_location, end_location, route_data)
+            cached = cache.has_key(corridor_key)
+            if force:
+                cache.delete(corridor_key)
+            stage_start = time.monotonic()
+            nearby_stations = view.get_corridor_stations(start_location, end_location, route_data)
+            result['stages']['corridor'] = (time.monotonic() - stage_start, cached)
+
+            # Fuel plan
+            plan_key = view.get_plan_cache_key(start_location, end_location)
+            cached = cache.has_key(plan_key)
+            stage_start = time.monotonic()
+            if force or not cached:
+                response_data = view.build_route_plan(route_data, nearby_stations)
+                view.cache_response(
+                    start_location, end_location, response_data,
+                    compute_time=time.monotonic() - stage_start
+                )
+            result['stages']['plan'] = (time.monotonic() - stage_start, cached)
+
+        except LocationNotFoundError as e:
+            result['error'] = str(e)
+        except Exception as e:
+            result['error'] = f'{type(e).__name__}: {e}'
+        finally:
+            close_old_connections()
+
+        return result
+
+    def print_lane_result(self, result):
+        if result['error']:
+            self.stdout.write(self.style.ERROR(f'FAILED {result["lane"]}: {result["error"]}'))
+            return
+
+        stages = '  '.join(
+            f'{stage} {seconds * 1000:.0f}ms ({"hit" if cached else "miss"})'
+            for stage, (seconds, cached) in result['stages'].items()
+        )
+        total = sum(seconds for seconds, _ in result['stages'].values())
+        self.stdout.write(f'OK     {result["lane"]}: {total * 1000:.0f}ms  {stages}')
+
+    def print_summary(self, results, elapsed):
+        """Cache coverage before warming and lanes warmed"""
+        total = len(results)
+        warmed = [result for result in results if not result['error']]
+
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write(self.style.SUCCESS('ROUTE CACHE WARMING COMPLETE'))
+        self.stdout.write('='*50)
+        self.stdout.write(f'Lanes warmed: {len(warmed)}/{total}')
+        self.stdout.write(f'Lanes failed: {total - len(warmed)}')
+        self.stdout.write(f'Elapsed: {elapsed:.2f}s')
+
+        for stage in ('geometry', 'corridor', 'plan'):
+            hits = sum(1 for result in warmed if result['stages'].get(stage, (0, False))[1])
+            self.stdout.write(f'{stage.capitalize()} coverage before warming: {hits}/{total}')
+        self.stdout.write(f'Coverage after warming: {len(warmed)}/{total} lanes')
+        self.stdout.write('='*50)
@@ -0,0 +1,303 @@
+"""
+Stage timings and in-process metrics.
+
+Pipeline steps are wrapped with @timed_stage / stage() and recorded into
+per-stage latency histograms. Views wrapped with @timed_view also collect
+the stages of their own request and return them in a Server-Timing
+header, e.g.
+
+    Server-Timing: cache;dur=0.4, geocode;dur=182.1, routing;dur=640.3,
+                   station_search;dur=12.8, optimize;dur=1.9, serialize;dur=0.2, total;dur=839.5
+
+GET /api/metrics renders the histograms, provider error counts and cache
+hit ratios in the Prometheus text format. Metrics are per worker process,
+like the cache statistics. Each finished request is also logged at INFO
+with its stage durations as fields, and each stage at (sampled) DEBUG.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.http import HttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with labels, in seconds"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, (bucket_counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    samples.append((f'{self.name}_bucket', labels + (('le', f'{bound:g}'),), cumulative))
+                samples.append((f'{self.name}_bucket', labels + (('le', '+Inf'),), count))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, count))
+        return samples
+
+
+stage_seconds = Histogram('fuel_route_stage_seconds', 'Duration of route pipeline stages')
+request_seconds = Histogram('fuel_route_request_seconds', 'Duration of route requests by endpoint and status')
+provider_errors = Counter('fuel_route_provider_errors_total', 'Failed geocoding and routing provider calls')
+
+REGISTRY = [stage_seconds, request_seconds, provider_errors]
+
+# Stage durations of the request being served, or None outside @timed_view
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+def record_stage(name, seconds):
+    stage_seconds.observe(seconds, stage=name)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("stage %s took %.1fms", name, seconds * 1000,
+                     extra={'stage': name, 'duration_ms': round(seconds * 1000, 3)})
+    stages = _request_stages.get()
+    if stages is not None:
+        # A stage that runs more than once per request adds up
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def timed_stage(name):
+    """Decorator timing every call of a function as one pipeline stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect_stages():
+    """Collect the stages timed inside the block (in this context) into a dict"""
+    stages = {}
+    token = _request_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _request_stages.reset(token)
+
+
+def in_request_context(func):
+    """
+    Callable running func in the current context, so stages timed in an
+    executor thread count towards the request that submitted them
+    """
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def iterate_in_context(iterable):
+    """
+    Iterator over iterable in the current context, so a streaming body
+    keeps the request's log fields and stages after the view has returned
+    """
+    return _iterate(contextvars.copy_context(), iter(iterable))
+
+
+def _iterate(context, iterator):
+    try:
+        while True:
+            try:
+                item = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            context.run(close)
+
+
+def server_timing(stages):
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in stages.items())
+
+
+def finish_request(endpoint, response, stages, started):
+    response['Server-Timing'] = server_timing({**stages, 'total': time.perf_counter() - started})
+    if response.streaming:
+        # Stages keep running while the body streams, record the request
+        # once it has been sent
+        response.streaming_content = _record_after(
+            response.streaming_content, in_request_context(functools.partial(
+                record_request, endpoint, response, stages, started
+            ))
+        )
+    else:
+        record_request(endpoint, response, stages, started)
+    return response
+
+
+def _record_after(content, record):
+    try:
+        yield from content
+    finally:
+        record()
+
+
+def record_request(endpoint, response, stages, started):
+    total = time.perf_counter() - started
+    stages['total'] = total
+    request_seconds.observe(total, endpoint=endpoint, status=response.status_code)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "%s request finished with %s in %.1fms", endpoint, response.status_code, total * 1000,
+            extra={
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'duration_ms': round(total * 1000, 3),
+                'stages': {name: round(seconds * 1000, 3) for name, seconds in stages.items() if name != 'total'},
+            }
+        )
+
+
+def timed_view(endpoint):
+    """
+    Decorator for sync and async views: collects the request's stages,
+    adds the Server-Timing header and records the request duration.
+    The Server-Timing header of a streaming response covers the stages
+    finished before streaming starts; the request is recorded and logged
+    with all of its stages once the body has been sent.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                started = time.perf_counter()
+                with collect_stages() as stages:
+                    response = await view(request, *args, **kwargs)
+                return finish_request(endpoint, response, stages, started)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            started = time.perf_counter()
+            with collect_stages() as stages:
+                response = view(request, *args, **kwargs)
+            return finish_request(endpoint, response, stages, started)
+        return wrapper
+    return decorator
+
+
+def cache_samples():
+    """Cache hit/miss counters and hit ratios per tier and key namespace"""
+    from django.core.cache import cache
+
+    if not hasattr(cache, 'get_stats'):
+        return []
+
+    samples = []
+    for namespace, tiers in cache.get_stats().get('namespaces', {}).items():
+        for tier, counts in tiers.items():
+            labels = (('namespace', namespace), ('tier', tier))
+            samples.append(('fuel_route_cache_hits_total', labels, counts['hits']))
+            samples.append(('fuel_route_cache_misses_total', labels, counts['misses']))
+            samples.append(('fuel_route_cache_hit_ratio', labels, counts['hit_ratio']))
+    return samples
+
+
+CACHE_METRICS = (
+    ('fuel_route_cache_hits_total', 'counter', 'Cache hits per tier and key namespace'),
+    ('fuel_route_cache_misses_total', 'counter', 'Cache misses per tier and key namespace'),
+    ('fuel_route_cache_hit_ratio', 'gauge', 'Cache hit ratio per tier and key namespace'),
+)
+
+
+def render_metrics():
+    """All metrics of this worker in the Prometheus text format"""
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for sample_name, labels, value in samples:
+            lines.append(f'{sample_name}{_format_labels(labels)} {value}')
+
+    for metric in REGISTRY:
+        family(metric.name, metric.kind, metric.help_text, metric.samples())
+
+    samples = cache_samples()
+    for name, kind, help_text in CACHE_METRICS:
+        family(name, kind, help_text, [sample for sample in samples if sample[0] == name])
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """GET /api/metrics, Prometheus text exposition format"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
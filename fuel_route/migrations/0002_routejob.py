@@ -0,0 +1,40 @@
+# Generated by Django 4.2.10 on 2026-10-19 05:10
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fuel_route', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('route', 'Route'), ('batch', 'Batch')], max_length=10)),
+                ('job_key', models.CharField(help_text='Hash of the normalized request, used to deduplicate identical jobs', max_length=64)),
+                ('payload', models.JSONField()),
+                ('priority', models.IntegerField(default=0, help_text='Higher priority jobs run first')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('result_ttl', models.PositiveIntegerField(default=3600, help_text='Seconds the result is kept after the job finishes')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, help_text='When the result is discarded', null=True)),
+            ],
+            options={
+                'verbose_name': 'Route Job',
+                'verbose_name_plural': 'Route Jobs',
+                'db_table': 'route_jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', '-priority', 'created_at'], name='job_queue_idx'), models.Index(fields=['job_key', 'status'], name='job_key_idx'), models.Index(fields=['expires_at'], name='job_expires_idx')],
+            },
+        ),
+    ]
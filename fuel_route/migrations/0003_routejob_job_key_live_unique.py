@@ -0,0 +1,29 @@
+# Generated by Django 4.2.10 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+def fail_duplicate_live_jobs(apps, schema_editor):
+    """Keep the oldest queued/running job per job_key so the constraint can be added"""
+    RouteJob = apps.get_model('fuel_route', 'RouteJob')
+    live = RouteJob.objects.filter(status__in=['queued', 'running']).order_by('job_key', 'created_at')
+    previous_key = None
+    for job in live.only('id', 'job_key'):
+        if job.job_key == previous_key:
+            RouteJob.objects.filter(id=job.id).update(status='failed', error='Duplicate of an identical live job')
+        previous_key = job.job_key
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fuel_route', '0002_routejob'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_live_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='routejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('job_key',), name='job_key_live_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-19 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fuel_route', '0003_routejob_job_key_live_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routejob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last heartbeat of the worker running the job', null=True),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -78,3 +80,82 @@ class FuelStation(models.Model):
     def has_coordinates(self):
         """Check if station has valid coordinates"""
         return self.latitude is not None and self.longitude is not None
+
+
+class RouteJob(models.Model):
+    """Queued route planning request processed by the run_route_worker command"""
+    
+    KIND_ROUTE = 'route'
+    KIND_BATCH = 'batch'
+    KIND_CHOICES = [
+        (KIND_ROUTE, 'Route'),
+        (KIND_BATCH, 'Batch'),
+    ]
+    
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    job_key = models.CharField(
+        max_length=64,
+        help_text="Hash of the normalized request, used to deduplicate identical jobs"
+    )
+    payload = models.JSONField()
+    priority = models.IntegerField(
+        default=0,
+        help_text="Higher priority jobs run first"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    result_ttl = models.PositiveIntegerField(
+        default=3600,
+        help_text="Seconds the result is kept after the job finishes"
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Last heartbeat of the worker running the job"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the result is discarded"
+    )
+    
+    class Meta:
+        app_label = 'fuel_route'
+        db_table = 'route_jobs'
+        verbose_name = 'Route Job'
+        verbose_name_plural = 'Route Jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'created_at'], name='job_queue_idx'),
+            models.Index(fields=['job_key', 'status'], name='job_key_idx'),
+            models.Index(fields=['expires_at'], name='job_expires_idx'),
+        ]
+        constraints = [
+            # At most one queued or running job per request (see jobs.enqueue_job)
+            models.UniqueConstraint(
+                fields=['job_key'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='job_key_live_unique',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
@@ -0,0 +1,180 @@
+"""
+Location string normalization shared by the request serializer, the
+gazetteer and the cache keys.
+
+"New York, NY", "new york ny" and "New York, New York" all normalize to
+"new york, ny", so they share one geocode, geometry and fuel plan entry.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+
+STATE_CODES = {
+    'alabama': 'al', 'alaska': 'ak', 'arizona': 'az', 'arkansas': 'ar',
+    'california': 'ca', 'colorado': 'co', 'connecticut': 'ct', 'delaware': 'de',
+    'district of columbia': 'dc', 'florida': 'fl', 'georgia': 'ga', 'hawaii': 'hi',
+    'idaho': 'id', 'illinois': 'il', 'indiana': 'in', 'iowa': 'ia',
+    'kansas': 'ks', 'kentucky': 'ky', 'louisiana': 'la', 'maine': 'me',
+    'maryland': 'md', 'massachusetts': 'ma', 'michigan': 'mi', 'minnesota': 'mn',
+    'mississippi': 'ms', 'missouri': 'mo', 'montana': 'mt', 'nebraska': 'ne',
+    'nevada': 'nv', 'new hampshire': 'nh', 'new jersey': 'nj', 'new mexico': 'nm',
+    'new york': 'ny', 'north carolina': 'nc', 'north dakota': 'nd', 'ohio': 'oh',
+    'oklahoma': 'ok', 'oregon': 'or', 'pennsylvania': 'pa', 'rhode island': 'ri',
+    'south carolina': 'sc', 'south dakota': 'sd', 'tennessee': 'tn', 'texas': 'tx',
+    'utah': 'ut', 'vermont': 'vt', 'virginia': 'va', 'washington': 'wa',
+    'west virginia': 'wv', 'wisconsin': 'wi', 'wyoming': 'wy',
+}
+USPS_CODES = set(STATE_CODES.values())
+
+# Leading words of city names
+CITY_PREFIXES = {'st': 'saint', 'ste': 'sainte', 'ft': 'fort', 'mt': 'mount', 'pt': 'point'}
+
+# Street words are reduced to their USPS abbreviations
+STREET_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'boulevard': 'blvd',
+    'highway': 'hwy', 'drive': 'dr', 'lane': 'ln', 'parkway': 'pkwy',
+    'interstate': 'i', 'route': 'rte', 'north': 'n', 'south': 's',
+    'east': 'e', 'west': 'w', 'suite': 'ste',
+}
+
+COUNTRY_SUFFIXES = {'usa', 'us', 'united states', 'united states of america'}
+
+PUNCTUATION_RE = re.compile(r"[^\w\s,#&'-]")
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_city(city):
+    """Canonical city name: lowercase, no punctuation, expanded Saint/Fort/Mount"""
+    words = WHITESPACE_RE.sub(' ', PUNCTUATION_RE.sub(' ', city.lower())).split()
+    if words and words[0] in CITY_PREFIXES:
+        words[0] = CITY_PREFIXES[words[0]]
+    return ' '.join(words)
+
+
+def normalize_state(state):
+    """USPS code for a state name or code, or None"""
+    state = WHITESPACE_RE.sub(' ', PUNCTUATION_RE.sub(' ', state.lower())).strip()
+    if state in USPS_CODES:
+        return state
+    return STATE_CODES.get(state)
+
+
+def _normalize_address_part(part):
+    words = WHITESPACE_RE.sub(' ', PUNCTUATION_RE.sub(' ', part.lower())).split()
+    return ' '.join(STREET_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def _split_trailing_state(text):
+    """Split "new york ny" / "new york new york" into (city, state code)"""
+    # A bare state name ("west virginia") is not a city in a shorter state
+    if normalize_state(text):
+        return text, None
+    words = text.split()
+    # Longest state names have three words ("district of columbia")
+    for size in (3, 2, 1):
+        if len(words) > size:
+            state = normalize_state(' '.join(words[-size:]))
+            if state:
+                return ' '.join(words[:-size]), state
+    return text, None
+
+
+def normalize_location(location_string):
+    """
+    Canonical form of a US location string used for cache keys and lookups.
+
+    City/state inputs become "city, st"; longer addresses keep their parts
+    with street words abbreviated and the state reduced to its USPS code.
+    """
+    parts = [
+        part for part in (
+            WHITESPACE_RE.sub(' ', piece).strip()
+            for piece in PUNCTUATION_RE.sub(' ', location_string.lower()).split(',')
+        )
+        if part
+    ]
+    while parts and parts[-1] in COUNTRY_SUFFIXES:
+        parts.pop()
+    if not parts:
+        return ''
+
+    state = normalize_state(parts[-1])
+    if state and len(parts) > 1:
+        parts = parts[:-1]
+    else:
+        # "new york ny" or "denver colorado" without a comma
+        city, state = _split_trailing_state(parts[-1])
+        if state:
+            parts = parts[:-1] + [city]
+
+    city = normalize_city(parts[-1])
+    address = [_normalize_address_part(part) for part in parts[:-1]]
+    normalized = ', '.join(address + [city])
+    return f"{normalized}, {state}" if state else normalized
+
+
+def parse_city_state(location_string):
+    """(city, state code) for a plain "City, ST" input, otherwise None"""
+    normalized = normalize_location(location_string)
+    parts = normalized.split(', ')
+    if len(parts) == 2 and parts[1] in USPS_CODES:
+        return parts[0], parts[1]
+    return None
+
+
+class NormalizationStats:
+    """
+    Estimates the cache hit rate with and without normalization.
+
+    Each lookup is checked against bounded sets of recently seen raw and
+    normalized keys; the difference between the two hit rates is the gain
+    from normalization.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._seen = {}
+            self._counts = {}
+
+    def _seen_before(self, seen, key):
+        if key in seen:
+            seen.move_to_end(key)
+            return True
+        seen[key] = True
+        if len(seen) > self.max_keys:
+            seen.popitem(last=False)
+        return False
+
+    def record(self, kind, raw_key, normalized_key):
+        with self._lock:
+            seen = self._seen.setdefault(kind, {'raw': OrderedDict(), 'normalized': OrderedDict()})
+            counts = self._counts.setdefault(kind, {'lookups': 0, 'raw_hits': 0, 'normalized_hits': 0})
+            counts['lookups'] += 1
+            if self._seen_before(seen['raw'], raw_key):
+                counts['raw_hits'] += 1
+            if self._seen_before(seen['normalized'], normalized_key):
+                counts['normalized_hits'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                kind: {
+                    **counts,
+                    'raw_hit_rate': _rate(counts['raw_hits'], counts['lookups']),
+                    'normalized_hit_rate': _rate(counts['normalized_hits'], counts['lookups']),
+                }
+                for kind, counts in self._counts.items()
+            }
+
+
+def _rate(hits, lookups):
+    return round(hits / lookups, 4) if lookups else 0.0
+
+
+normalization_stats = NormalizationStats()
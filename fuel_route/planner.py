@@ -0,0 +1,191 @@
+"""
+Per-process route planning service.
+
+RoutePlanner is built once per worker process when the fuel_route app is
+ready. It owns the provider clients (one Nominatim geocoder and one
+pooled HTTP session for OpenRouteService), the FuelRouteView every
+function view, batch and job shares, and access to the station index,
+gazetteer and cache.
+
+preload() builds the gazetteer and station index up front so the first
+request does not pay for them; the WSGI and ASGI entry points call it
+when ROUTE_PLANNER_PRELOAD is on. readiness() backs GET /api/ready/.
+
+Under gunicorn with GUNICORN_PRELOAD (see gunicorn.conf.py) that happens
+once in the master, and prepare_for_fork() packs the station index into
+a flat buffer and freezes the collected heap so workers keep sharing the
+pages copy-on-write.
+"""
+import gc
+import logging
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .gazetteer import get_gazetteer
+from .station_index import get_station_index, pack_station_index
+from .views import FuelRouteView, nominatim_geolocator
+
+
+logger = logging.getLogger(__name__)
+
+
+class RoutePlanner:
+    """Provider clients, planner and preloaded data of one worker process"""
+
+    def __init__(self):
+        started = time.perf_counter()
+        self.geolocator = nominatim_geolocator()
+        self.http_session = requests.Session()
+        self.view = FuelRouteView(geolocator=self.geolocator, http_session=self.http_session)
+        self.cache = cache
+        self.pid = os.getpid()
+        self.build_ms = (time.perf_counter() - started) * 1000
+        self.preloaded = False
+        self.preload_error = None
+        self.preload_timings = {}
+        self.worker_startup_ms = None
+        self._preload_lock = threading.Lock()
+
+    @property
+    def station_index(self):
+        return get_station_index()
+
+    @property
+    def gazetteer(self):
+        return get_gazetteer()
+
+    def preload(self):
+        """Build the gazetteer and station index and touch the cache; safe to call again"""
+        with self._preload_lock:
+            if self.preloaded:
+                return True
+
+            timings = {}
+            try:
+                for name, load in (
+                    ('gazetteer', get_gazetteer),
+                    ('station_index', get_station_index),
+                    ('cache', self.check_cache),
+                ):
+                    started = time.perf_counter()
+                    load()
+                    timings[name] = round((time.perf_counter() - started) * 1000, 2)
+            except Exception as e:
+                # Requests still work; whatever failed is built on first use
+                logger.exception("Route planner preload failed: %s", e)
+                self.preload_error = str(e)
+                return False
+            finally:
+                self.preload_timings = timings
+
+            self.preloaded = True
+            self.preload_error = None
+            return True
+
+    def prepare_for_fork(self):
+        """
+        Called in a preloading master before workers fork: pack the station
+        index into one buffer and move every tracked object into the GC's
+        permanent generation, so neither refcount changes on station rows
+        nor collections in the workers write to the shared pages.
+        """
+        if self.preloaded:
+            pack_station_index()
+        # Close inherited connections; each worker opens its own
+        connection.close()
+        self.http_session.close()
+        gc.freeze()
+
+    def after_fork(self):
+        self.pid = os.getpid()
+
+    def check_database(self):
+        connection.ensure_connection()
+        return True
+
+    def check_cache(self):
+        key = f'planner_ready_{self.pid}'
+        cache.set(key, 1, 60)
+        return cache.get(key) == 1
+
+    def readiness(self):
+        """Readiness document; 'ready' is False until preload finished and the backends respond"""
+        checks = {}
+        for name, check in (('database', self.check_database), ('cache', self.check_cache)):
+            try:
+                checks[name] = bool(check())
+            except Exception as e:
+                logger.warning("Readiness check %r failed: %s", name, e)
+                checks[name] = False
+
+        preload_required = getattr(settings, 'ROUTE_PLANNER_PRELOAD', True)
+        checks['preloaded'] = self.preloaded or not preload_required
+
+        status = {
+            'ready': all(checks.values()),
+            'pid': self.pid,
+            'checks': checks,
+            'build_ms': round(self.build_ms, 2),
+            'preload_ms': self.preload_timings,
+            'preload_error': self.preload_error,
+            'worker_startup_ms': self.worker_startup_ms,
+            'memory': memory_usage(),
+        }
+        if self.preloaded:
+            status['stations'] = len(self.station_index.latitudes)
+            status['places'] = len(self.gazetteer)
+        return status
+
+
+def memory_usage():
+    """
+    Memory of this process in MB. 'pss' splits shared pages between the
+    processes sharing them and 'private' is what this process alone holds,
+    so copy-on-write sharing shows up as private well below rss.
+    """
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as file:
+            for line in file:
+                field, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    usage[field] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        # Peak RSS only; kB on Linux, bytes on macOS
+        return {'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+    return {
+        'rss': round(usage.get('Rss', 0), 1),
+        'pss': round(usage.get('Pss', 0), 1),
+        'shared': round(usage.get('Shared_Clean', 0) + usage.get('Shared_Dirty', 0), 1),
+        'private': round(usage.get('Private_Clean', 0) + usage.get('Private_Dirty', 0), 1),
+    }
+
+
+_route_planner = None
+_route_planner_lock = threading.Lock()
+
+
+def get_route_planner():
+    """The worker's RoutePlanner, built on first use if the app registry has not built it"""
+    global _route_planner
+    if _route_planner is None:
+        with _route_planner_lock:
+            if _route_planner is None:
+                _route_planner = RoutePlanner()
+    return _route_planner
+
+
+def preload_route_planner():
+    """Preload the worker's planner unless ROUTE_PLANNER_PRELOAD is off"""
+    planner = get_route_planner()
+    if getattr(settings, 'ROUTE_PLANNER_PRELOAD', True):
+        planner.preload()
+    return planner
@@ -0,0 +1,233 @@
+"""
+On-demand profiling of single route requests.
+
+Off unless settings.ROUTE_PROFILING_TOKEN is set. A request sending the
+token in an X-Route-Profile header runs under cProfile and tracemalloc;
+its response gets an X-Response-ID header and the report is stored under
+that ID. The token is only accepted as a header, never in the URL, where
+access logs and proxies would record it:
+
+    curl -H "X-Route-Profile: $TOKEN" -X POST /api/route/ -d '...' -i
+    curl -H "X-Route-Profile: $TOKEN" /api/profiles/<X-Response-ID>/
+
+A report holds the top functions by cumulative time, the top allocation
+sites by size (memory still held when the request finished, plus the
+peak), the Server-Timing stages and the wall time. Reports live in the
+cache for ROUTE_PROFILING_TTL seconds; with ROUTE_PROFILING_DIR they are
+also written there as <id>.json plus a <id>.prof pstats file.
+
+cProfile sees only the request's own thread, so work done in executor
+threads shows up as time spent waiting for it. tracemalloc is process
+wide, so only one request is profiled at a time and allocations by
+concurrent requests in the same worker can show up in the report.
+"""
+import asyncio
+import cProfile
+import functools
+import hmac
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+PROFILE_HEADER = 'HTTP_X_ROUTE_PROFILE'
+PROFILE_KEY_PREFIX = 'route_profile'
+
+# tracemalloc and the profiler hooks are process wide
+_profile_lock = threading.Lock()
+
+
+def profiling_token_valid(request):
+    """True when profiling is enabled and the request carries its token"""
+    token = getattr(settings, 'ROUTE_PROFILING_TOKEN', '')
+    if not token:
+        return False
+    given = request.META.get(PROFILE_HEADER, '')
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+def short_path(filename):
+    """Project-relative or site-packages-relative file name"""
+    for root in (str(settings.BASE_DIR), 'site-packages', 'lib/python'):
+        index = filename.find(root)
+        if index != -1:
+            return filename[index + len(root):].lstrip('/')
+    return filename
+
+
+def top_functions(profiler, limit):
+    stats = pstats.Stats(profiler)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            'function': f'{short_path(filename)}:{line}({name})',
+            'calls': total_calls,
+            'primitive_calls': primitive_calls,
+            'total_ms': round(total_time * 1000, 3),
+            'cumulative_ms': round(cumulative_time * 1000, 3),
+        }
+        for (filename, line, name), (primitive_calls, total_calls, total_time, cumulative_time, _) in rows
+    ]
+
+
+def top_allocations(before, after, limit):
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    ]
+    differences = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+    differences = sorted(
+        (difference for difference in differences if difference.size_diff > 0),
+        key=lambda difference: difference.size_diff, reverse=True
+    )[:limit]
+    return [
+        {
+            'site': f'{short_path(difference.traceback[0].filename)}:{difference.traceback[0].lineno}',
+            'size_kb': round(difference.size_diff / 1024, 1),
+            'count': difference.count_diff,
+        }
+        for difference in differences
+    ]
+
+
+class RequestProfile:
+    """cProfile and tracemalloc around one request: start(), run it, stop()"""
+
+    def __init__(self):
+        self.limit = getattr(settings, 'ROUTE_PROFILING_TOP', 30)
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self):
+        """Report with the wall time, peak, top functions and allocation sites"""
+        self.profiler.disable()
+        wall = time.perf_counter() - self.started
+        try:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if self.started_tracing:
+                tracemalloc.stop()
+
+        return {
+            'wall_ms': round(wall * 1000, 3),
+            'peak_traced_kb': round(peak / 1024, 1),
+            'functions': top_functions(self.profiler, self.limit),
+            'allocations': top_allocations(self.before, after, self.limit),
+        }
+
+
+def store_profile(report, profiler):
+    cache.set(f"{PROFILE_KEY_PREFIX}:{report['id']}", report, getattr(settings, 'ROUTE_PROFILING_TTL', 86400))
+
+    directory = getattr(settings, 'ROUTE_PROFILING_DIR', None)
+    if directory:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(directory, f"{report['id']}.prof"))
+            with open(os.path.join(directory, f"{report['id']}.json"), 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+        except OSError as e:
+            logger.warning("Error writing profile %s: %s", report['id'], e)
+
+
+def profile_report(request, response, profiler, report):
+    """Complete, store and announce the report of a profiled request"""
+    report.update({
+        'id': uuid.uuid4().hex,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'method': request.method,
+        'path': request.get_full_path().split('?')[0],
+        'status': response.status_code,
+        'server_timing': response.get('Server-Timing', ''),
+        'streaming': response.streaming,
+    })
+    try:
+        store_profile(report, profiler)
+    except Exception as e:
+        logger.warning("Error storing profile %s: %s", report['id'], e)
+    response['X-Response-ID'] = report['id']
+    return response
+
+
+def profiled_view(view):
+    """
+    Decorator for sync and async views profiling the requests that carry
+    the profiling token. Other requests, and requests arriving while
+    another is being profiled (X-Route-Profile: busy), are served
+    unchanged. Put it outside @timed_view so the report includes the stages.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not profiling_token_valid(request):
+                return await view(request, *args, **kwargs)
+            if not _profile_lock.acquire(blocking=False):
+                response = await view(request, *args, **kwargs)
+                response['X-Route-Profile'] = 'busy'
+                return response
+            try:
+                profile = RequestProfile()
+                profile.start()
+                try:
+                    response = await view(request, *args, **kwargs)
+                finally:
+                    report = profile.stop()
+            finally:
+                _profile_lock.release()
+            return profile_report(request, response, profile.profiler, report)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not profiling_token_valid(request):
+            return view(request, *args, **kwargs)
+        if not _profile_lock.acquire(blocking=False):
+            response = view(request, *args, **kwargs)
+            response['X-Route-Profile'] = 'busy'
+            return response
+        try:
+            profile = RequestProfile()
+            profile.start()
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                report = profile.stop()
+        finally:
+            _profile_lock.release()
+        return profile_report(request, response, profile.profiler, report)
+    return wrapper
+
+
+def profile_detail_view(request, profile_id):
+    """GET /api/profiles/<id>/, gated by the profiling token"""
+    if not profiling_token_valid(request):
+        return JsonResponse({'error': 'Not found'}, status=404)
+
+    report = cache.get(f'{PROFILE_KEY_PREFIX}:{profile_id}')
+    if report is None:
+        return JsonResponse({'error': 'Profile not found or expired'}, status=404)
+    return JsonResponse(report)
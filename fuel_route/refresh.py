@@ -0,0 +1,120 @@
+"""
+Stale-while-revalidate caching with probabilistic early refresh.
+
+Entries are stored as envelopes carrying their logical expiry and how long
+the value took to compute, and are physically kept CACHE_STALE_TTL seconds
+longer. On each hit the XFetch rule (Vattani et al.) decides whether to
+refresh early:
+
+    now - delta * beta * log(random()) >= expires
+
+so popular keys refresh shortly before expiry instead of all at once.
+Past expiry the stale value keeps being served while exactly one
+background refresh (guarded by a cache lock) recomputes it.
+"""
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+
+ENVELOPE_MARKER = '__swr__'
+
+refresh_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'CACHE_REFRESH_THREADS', 2),
+    thread_name_prefix='cache-refresh'
+)
+
+
+class StaleWhileRevalidateCache:
+    """Envelope-based wrapper around the default cache"""
+
+    def __init__(self, beta=None, stale_ttl=None, lock_timeout=None):
+        self.beta = beta or getattr(settings, 'CACHE_REFRESH_BETA', 1.0)
+        self.stale_ttl = stale_ttl or getattr(settings, 'CACHE_STALE_TTL', 900)
+        self.lock_timeout = lock_timeout or getattr(settings, 'CACHE_REFRESH_LOCK_TIMEOUT', 60)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    def _envelope(self, value, timeout, compute_time):
+        return {
+            ENVELOPE_MARKER: True,
+            'value': value,
+            'expires': time.time() + timeout,
+            'timeout': timeout,
+            'delta': compute_time,
+        }
+
+    def set(self, key, value, timeout, compute_time=0.0):
+        """Store value as fresh for timeout seconds, then stale for CACHE_STALE_TTL more"""
+        cache.set(key, self._envelope(value, timeout, compute_time), timeout + self.stale_ttl)
+
+    async def aset(self, key, value, timeout, compute_time=0.0):
+        await cache.aset(key, self._envelope(value, timeout, compute_time), timeout + self.stale_ttl)
+
+    def get(self, key, refresh=None):
+        """
+        Return the cached value (possibly stale) or None.
+        refresh is a zero-argument callable computing a fresh value; it runs
+        in the background when the entry is due for an early refresh.
+        """
+        return self._unwrap(key, cache.get(key), refresh)
+
+    async def aget(self, key, refresh=None):
+        return self._unwrap(key, await cache.aget(key), refresh)
+
+    def should_refresh(self, entry, now=None):
+        """XFetch early expiration test"""
+        now = time.time() if now is None else now
+        # 1 - random() is in (0, 1], so the log is always defined
+        jitter = -entry['delta'] * self.beta * math.log(1.0 - random.random())
+        return now + jitter >= entry['expires']
+
+    def _unwrap(self, key, entry, refresh):
+        if entry is None:
+            return None
+        # Entries written before envelopes were introduced are plain values
+        if not isinstance(entry, dict) or not entry.get(ENVELOPE_MARKER):
+            return entry
+        if refresh is not None and self.should_refresh(entry):
+            self._schedule_refresh(key, entry['timeout'], refresh)
+        return entry['value']
+
+    def _schedule_refresh(self, key, timeout, refresh):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        refresh_executor.submit(self._refresh, key, timeout, refresh)
+
+    def _refresh(self, key, timeout, refresh):
+        lock_key = f"refresh_lock_{key}"
+        try:
+            # Only one worker refreshes a key, the others keep serving stale data
+            if not cache.add(lock_key, 1, self.lock_timeout):
+                return
+            try:
+                start = time.monotonic()
+                value = refresh()
+                if value is not None:
+                    self.set(key, value, timeout, time.monotonic() - start)
+            finally:
+                cache.delete(lock_key)
+        except Exception as e:
+            logger.warning("Background cache refresh failed for %s: %s", key, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+            close_old_connections()
+
+
+stale_cache = StaleWhileRevalidateCache()
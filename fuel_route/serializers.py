@@ -1,5 +1,69 @@
+from django.conf import settings
 from rest_framework import serializers
 
+from .normalization import normalize_location
+
+
+# One routing call covers start, waypoints and end; providers cap the points per request
+MAX_WAYPOINTS = 8
+
+
+class VehicleSerializer(serializers.Serializer):
+    """
+    Optional per-request vehicle parameters.
+    
+    Accepts a named profile from settings.VEHICLE_PROFILES ("box_truck" or
+    {"profile": "box_truck"}), explicit fields, or a profile with some
+    fields overridden. Omitted fields use the planner defaults.
+    """
+    
+    profile = serializers.CharField(
+        required=False,
+        max_length=50,
+        help_text="Name of a vehicle profile from settings.VEHICLE_PROFILES"
+    )
+    max_range_miles = serializers.FloatField(
+        required=False,
+        min_value=50,
+        max_value=3000,
+        help_text="Distance the vehicle can travel on a full tank"
+    )
+    miles_per_gallon = serializers.FloatField(
+        required=False,
+        min_value=1,
+        max_value=100,
+        help_text="Fuel efficiency in miles per gallon"
+    )
+    max_station_distance_miles = serializers.FloatField(
+        required=False,
+        min_value=1,
+        max_value=100,
+        help_text="Maximum detour from the route to a fuel station"
+    )
+    
+    def to_internal_value(self, data):
+        # A bare string is a profile name
+        if isinstance(data, str):
+            data = {'profile': data}
+        return super().to_internal_value(data)
+    
+    def validate_profile(self, value):
+        """Validate that the profile exists"""
+        profiles = getattr(settings, 'VEHICLE_PROFILES', {})
+        if value not in profiles:
+            raise serializers.ValidationError(
+                f"Unknown vehicle profile. Available profiles: {', '.join(sorted(profiles))}"
+            )
+        return value
+    
+    def validate(self, data):
+        """Resolve the profile into explicit parameters; explicit fields win"""
+        data = dict(data)
+        profile = data.pop('profile', None)
+        if profile:
+            data = {**settings.VEHICLE_PROFILES[profile], **data}
+        return data
+
 
 class RouteRequestSerializer(serializers.Serializer):
     """Serializer for route request data"""
@@ -20,6 +84,16 @@ class RouteRequestSerializer(serializers.Serializer):
             'blank': 'End location cannot be empty'
         }
     )
+    waypoints = serializers.ListField(
+        child=serializers.CharField(max_length=200),
+        required=False,
+        max_length=MAX_WAYPOINTS,
+        help_text="Optional stops between start and end, visited in order"
+    )
+    vehicle = VehicleSerializer(
+        required=False,
+        help_text="Optional vehicle profile name or parameters"
+    )
     
     def validate_start_location(self, value):
         """Validate start location format"""
@@ -35,12 +109,23 @@ class RouteRequestSerializer(serializers.Serializer):
             raise serializers.ValidationError("End location must be at least 3 characters long")
         return value
     
+    def validate_waypoints(self, value):
+        """Validate waypoint format"""
+        waypoints = [waypoint.strip() for waypoint in value]
+        if any(len(waypoint) < 3 for waypoint in waypoints):
+            raise serializers.ValidationError("Each waypoint must be at least 3 characters long")
+        return waypoints
+    
     def validate(self, data):
-        """Validate that start and end locations are different"""
-        start = data.get('start_location', '').strip().lower()
-        end = data.get('end_location', '').strip().lower()
+        """Validate that consecutive locations are different"""
+        locations = [
+            normalize_location(location)
+            for location in (data.get('start_location', ''), *data.get('waypoints', ()), data.get('end_location', ''))
+        ]
         
-        if start == end:
+        if any(current == following for current, following in zip(locations, locations[1:])):
+            if data.get('waypoints'):
+                raise serializers.ValidationError("Consecutive route locations must be different")
             raise serializers.ValidationError("Start and end locations must be different")
         
         return data
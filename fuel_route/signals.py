@@ -0,0 +1,62 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .epochs import bump_price_epoch, bump_station_epochs
+from .models import FuelStation
+
+
+_bulk_changes = contextvars.ContextVar('bulk_station_changes', default=False)
+
+
+@contextmanager
+def bulk_station_changes():
+    """
+    Skip the per-row signal work of stations created, loaded, saved or
+    deleted inside the block; the caller bumps once with
+    bump_station_epochs() afterwards
+    """
+    token = _bulk_changes.set(True)
+    try:
+        yield
+    finally:
+        _bulk_changes.reset(token)
+
+
+def _location(instance):
+    # Read from __dict__ so deferred fields are never loaded here
+    return (instance.__dict__.get('latitude'), instance.__dict__.get('longitude'))
+
+
+@receiver(post_init, sender=FuelStation)
+def station_loaded(sender, instance, **kwargs):
+    # Remember the location to tell a move from a price update on save
+    if not _bulk_changes.get():
+        instance._loaded_location = _location(instance)
+
+
+@receiver(post_save, sender=FuelStation)
+def station_saved(sender, instance, created, update_fields=None, **kwargs):
+    """New or moved stations change the corridor candidates, any save may change a price"""
+    # Instances built during bulk changes have no loaded location and count as moved
+    moved = _location(instance) != getattr(instance, '_loaded_location', None)
+    if update_fields is not None and not {'latitude', 'longitude'} & set(update_fields):
+        moved = False
+    instance._loaded_location = _location(instance)
+    if _bulk_changes.get():
+        return
+
+    # Bump after commit so a rolled back change never versions a cached plan
+    if created or moved:
+        transaction.on_commit(bump_station_epochs)
+    else:
+        transaction.on_commit(bump_price_epoch)
+
+
+@receiver(post_delete, sender=FuelStation)
+def station_deleted(sender, instance, **kwargs):
+    if not _bulk_changes.get():
+        transaction.on_commit(bump_station_epochs)
@@ -0,0 +1,314 @@
+"""
+In-memory spatial index of fuel stations.
+
+Stations with coordinates are loaded once per process into a grid of
+GRID_DEGREES cells. A corridor query only measures distances to the
+stations in cells near the sampled route points instead of scanning
+every station. The index is rebuilt when the station layout epoch
+changes; price updates keep it, so its prices are those at build time
+and the serving path reads current prices from the database.
+
+An index can also be written to a snapshot file and opened with
+SnapshotStationIndex, which memory-maps the columns so worker processes
+share one copy of the station data through the page cache. A
+PackedStationIndex holds the same layout in one bytes buffer; built in a
+gunicorn master before forking, its pages stay shared copy-on-write
+because lookups only read array buffers and never touch the reference
+counts of per-station Python objects.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .distance import distance_precision
+from .epochs import get_layout_epoch, get_price_epoch
+
+
+GRID_DEGREES = 0.5
+# Grid cells are encoded as (row << CELL_BITS) + col, so the cells of one
+# row are a contiguous range of codes
+CELL_BITS = 16
+MILES_PER_DEGREE_LAT = 69.0
+
+STATION_FIELDS = (
+    'id', 'name', 'address', 'city', 'state', 'retail_price',
+    'latitude', 'longitude', 'rack_id'
+)
+
+
+def sample_route_points(route_coordinates, samples=20):
+    """About `samples` evenly spaced route points used for corridor searches"""
+    return route_coordinates[::max(1, len(route_coordinates) // samples)]
+
+
+class StationIndex:
+    """Grid index over station rows (dicts with STATION_FIELDS)"""
+
+    def __init__(self, stations, epochs=None):
+        self.stations = list(stations)
+        self.epochs = epochs
+        self.latitudes = array('d', (station['latitude'] for station in self.stations))
+        self.longitudes = array('d', (station['longitude'] for station in self.stations))
+        self._build_grid()
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def _build_grid(self):
+        """
+        Sorted cell codes, the start of each cell in cell_positions, and the
+        station positions grouped by cell (all flat arrays)
+        """
+        codes = array('q', (
+            self._cell_code(*self._cell(self.latitudes[position], self.longitudes[position]))
+            for position in range(len(self.latitudes))
+        ))
+        positions = sorted(range(len(codes)), key=codes.__getitem__)
+
+        self.cell_codes = array('q')
+        self.cell_starts = array('q')
+        for offset, position in enumerate(positions):
+            if not self.cell_codes or self.cell_codes[-1] != codes[position]:
+                self.cell_codes.append(codes[position])
+                self.cell_starts.append(offset)
+        self.cell_starts.append(len(positions))
+        self.cell_positions = array('q', positions)
+
+    def station(self, position):
+        """Station row at a position as a new dict"""
+        return dict(self.stations[position])
+
+    @staticmethod
+    def _cell(latitude, longitude):
+        return (math.floor(latitude / GRID_DEGREES), math.floor(longitude / GRID_DEGREES))
+
+    @staticmethod
+    def _cell_code(row, col):
+        return (row << CELL_BITS) + col
+
+    def candidates_near(self, latitude, longitude, radius_miles):
+        """Positions of stations in grid cells overlapping the radius around a point"""
+        lat_span = radius_miles / MILES_PER_DEGREE_LAT
+        cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+        lon_span = radius_miles / (MILES_PER_DEGREE_LAT * cos_lat)
+
+        min_row, min_col = self._cell(latitude - lat_span, longitude - lon_span)
+        max_row, max_col = self._cell(latitude + lat_span, longitude + lon_span)
+
+        positions = []
+        for row in range(min_row, max_row + 1):
+            first = bisect_left(self.cell_codes, self._cell_code(row, min_col))
+            last = bisect_right(self.cell_codes, self._cell_code(row, max_col))
+            if first < last:
+                positions.extend(self.cell_positions[self.cell_starts[first]:self.cell_starts[last]])
+        return positions
+
+    def corridor(self, route_coordinates, max_distance_miles, precision=None):
+        """
+        Stations within max_distance_miles of a sampled route point, each as a
+        new dict with 'distance_from_route' (same rules as the original full
+        scan), with distances at the given or configured precision
+        """
+        precision = precision or distance_precision()
+        sample_points = sample_route_points(route_coordinates)
+
+        candidates = set()
+        for point in sample_points:
+            candidates.update(self.candidates_near(point[0], point[1], max_distance_miles))
+
+        nearby_stations = []
+        # Keep the database order so results match a full scan
+        for position in sorted(candidates):
+            station_coords = (self.latitudes[position], self.longitudes[position])
+            # Early exit if station is very close
+            min_distance_to_route = precision.nearest_miles(
+                station_coords, sample_points, limit=max_distance_miles, stop_below=5
+            )
+
+            if min_distance_to_route <= max_distance_miles:
+                station = self.station(position)
+                station['distance_from_route'] = round(min_distance_to_route, 2)
+                nearby_stations.append(station)
+
+        return nearby_stations
+
+
+SNAPSHOT_MAGIC = b'FSIDX001'
+SNAPSHOT_HEADER = struct.Struct('<8sQQQ')
+
+
+def snapshot_prefix(count, epochs, text_length):
+    """Snapshot header followed by the epochs as JSON padded to 8 bytes"""
+    epochs = json.dumps(epochs).encode('utf-8')
+    epochs += b' ' * (-len(epochs) % 8)
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, count, len(epochs), text_length) + epochs
+
+
+def snapshot_bytes(index):
+    """
+    An index in the snapshot layout: header (magic, station count, epochs
+    length, text length), the epochs as JSON padded to 8 bytes, then the
+    id, rack_id, latitude, longitude and price columns, text offsets and
+    the JSON text of each station's name, address, city and state.
+    """
+    count = len(index)
+    stations = [index.station(position) for position in range(count)]
+    texts = [
+        json.dumps([station['name'], station['address'], station['city'], station['state']]).encode('utf-8')
+        for station in stations
+    ]
+    offsets = array('q', [0])
+    for text in texts:
+        offsets.append(offsets[-1] + len(text))
+
+    return b''.join([
+        snapshot_prefix(count, index.epochs, offsets[-1]),
+        array('q', (station['id'] for station in stations)).tobytes(),
+        array('q', (station['rack_id'] for station in stations)).tobytes(),
+        array('d', index.latitudes).tobytes(),
+        array('d', index.longitudes).tobytes(),
+        array('d', (float(station['retail_price']) for station in stations)).tobytes(),
+        offsets.tobytes(),
+        *texts,
+    ])
+
+
+def write_snapshot(index, path):
+    """Write an index to a snapshot file (see snapshot_bytes for the layout)"""
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(snapshot_bytes(index))
+    os.replace(temp_path, path)
+
+
+def write_snapshot_columns(path, ids, rack_ids, latitudes, longitudes, prices, text_offsets, text, epochs=None):
+    """
+    Write a snapshot straight from columns without building an index:
+    'q' arrays of ids and rack ids, 'd' arrays of coordinates and prices,
+    'q' text offsets (one more than stations) and the concatenated JSON
+    texts. Used for generated datasets too large for station dicts.
+    """
+    count = len(ids)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(snapshot_prefix(count, epochs, text_offsets[count]))
+        for column in (ids, rack_ids, latitudes, longitudes, prices, text_offsets):
+            file.write(column)
+        file.write(memoryview(text)[:text_offsets[count]])
+    os.replace(temp_path, path)
+
+
+class SnapshotStationIndex(StationIndex):
+    """StationIndex over a memory-mapped snapshot file (prices are floats)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._load(self._mmap)
+
+    def _load(self, buffer):
+        """Point the columns at a buffer in the snapshot layout"""
+        magic, count, epochs_size, _ = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f'Not a station index snapshot: {self.path}')
+
+        view = memoryview(buffer)
+        offset = SNAPSHOT_HEADER.size
+        epochs = json.loads(bytes(view[offset:offset + epochs_size]))
+        self.epochs = tuple(epochs) if epochs is not None else None
+        offset += epochs_size
+
+        def column(typecode, length):
+            nonlocal offset
+            values = view[offset:offset + length * 8].cast(typecode)
+            offset += length * 8
+            return values
+
+        self.ids = column('q', count)
+        self.rack_ids = column('q', count)
+        self.latitudes = column('d', count)
+        self.longitudes = column('d', count)
+        self.prices = column('d', count)
+        self.text_offsets = column('q', count + 1)
+        self.text = view[offset:]
+        self._build_grid()
+
+    def station(self, position):
+        name, address, city, state = json.loads(
+            bytes(self.text[self.text_offsets[position]:self.text_offsets[position + 1]])
+        )
+        return {
+            'id': self.ids[position],
+            'name': name,
+            'address': address,
+            'city': city,
+            'state': state,
+            'retail_price': self.prices[position],
+            'latitude': self.latitudes[position],
+            'longitude': self.longitudes[position],
+            'rack_id': self.rack_ids[position],
+        }
+
+
+class PackedStationIndex(SnapshotStationIndex):
+    """
+    StationIndex packed into one in-memory buffer in the snapshot layout,
+    so forked workers share its pages (prices are floats)
+    """
+
+    def __init__(self, index):
+        self.path = None
+        self._buffer = snapshot_bytes(index)
+        self._load(self._buffer)
+
+
+def load_stations():
+    """Station rows with coordinates, in model ordering"""
+    from .models import FuelStation
+
+    return FuelStation.objects.filter(
+        latitude__isnull=False,
+        longitude__isnull=False
+    ).values(*STATION_FIELDS)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def pack_station_index():
+    """
+    Replace the process-wide index with a PackedStationIndex. Called in a
+    gunicorn master before forking; workers rebuild a regular index only
+    if the station layout epoch changes.
+    """
+    global _index
+    index = get_station_index()
+    with _index_lock:
+        if _index is index and not isinstance(index, PackedStationIndex):
+            _index = PackedStationIndex(index)
+    return _index
+
+
+def _index_current(layout_epoch):
+    return _index is not None and _index.epochs is not None and _index.epochs[0] == layout_epoch
+
+
+def get_station_index():
+    """
+    Process-wide station index, rebuilt after stations are added, removed
+    or moved. The index remembers (layout epoch, price epoch) at build time.
+    """
+    global _index
+    layout_epoch = get_layout_epoch()
+    if not _index_current(layout_epoch):
+        with _index_lock:
+            if not _index_current(layout_epoch):
+                _index = StationIndex(load_stations(), (layout_epoch, get_price_epoch()))
+    return _index
@@ -0,0 +1,105 @@
+"""
+Streaming NDJSON mode of the route endpoint.
+
+Requested with ?stream=true or an "Accept: application/x-ndjson" header.
+The response is one JSON object per line, flushed as each stage finishes:
+
+    {"event": "geocode", "label": "start", "location": ..., "latitude": ..., "longitude": ...}
+    {"event": "geometry", "distance_miles": ..., "route_source": ..., "points": ...}
+    {"event": "fuel_stop", "index": 0, ...stop fields}
+    {"event": "summary", "total_distance_miles": ..., "total_fuel_cost": ..., ...}
+
+The summary carries the totals and api_info of the regular response,
+without the polyline and route coordinates.
+
+Locations are geocoded before the response starts, so one that cannot be
+found gets the same 400 response as the regular endpoint. A failure after
+the response has started is reported as {"event": "error", "error": ...}
+and ends the stream.
+"""
+import json
+import logging
+
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .coalescing import route_single_flight
+from .metrics import iterate_in_context
+from .views import LocationNotFoundError, location_labels
+
+
+logger = logging.getLogger(__name__)
+
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+def wants_stream(request):
+    """True when the client opted into NDJSON streaming"""
+    if request.GET.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return NDJSON_CONTENT_TYPE in request.META.get('HTTP_ACCEPT', '')
+
+
+def encode_event(event, **fields):
+    return (json.dumps({'event': event, **fields}) + '\n').encode('utf-8')
+
+
+def route_events(planner, start_location, end_location, waypoints, coords):
+    """Yield NDJSON lines for each pipeline stage of one route with geocoded locations"""
+    try:
+        locations = [start_location, *waypoints, end_location]
+        for label, location, found in zip(location_labels(len(locations)), locations, coords):
+            yield encode_event('geocode', label=label, location=location, latitude=found[0], longitude=found[1])
+
+        route_data = planner.get_route_geometry(start_location, end_location, waypoints, coords)
+        geometry = {
+            'distance_miles': round(route_data.get('distance_miles', 0), 2),
+            'route_source': route_data.get('api_used', 'unknown'),
+            'points': len(route_data.get('coordinates', [])),
+        }
+        if route_data.get('leg_distances_miles'):
+            geometry['leg_distances_miles'] = route_data['leg_distances_miles']
+        yield encode_event('geometry', **geometry)
+
+        response_data = planner.get_cached_response(start_location, end_location, waypoints)
+        if not response_data:
+            # Identical concurrent requests share one computation
+            response_data = route_single_flight.do(
+                planner.get_plan_cache_key(start_location, end_location, waypoints),
+                lambda: planner.plan_route(start_location, end_location, route_data, waypoints)
+            )
+
+        for index, stop in enumerate(response_data['fuel_stops']):
+            yield encode_event('fuel_stop', index=index, **stop)
+
+        yield encode_event('summary', **{
+            key: value for key, value in response_data.items()
+            if key not in ('fuel_stops', 'route_coordinates', 'route_polyline')
+        })
+
+    except LocationNotFoundError as e:
+        yield encode_event('error', error=str(e))
+    except Exception as e:
+        logger.exception("Unexpected error in streaming route optimization: %s", e)
+        yield encode_event(
+            'error', error='An unexpected error occurred while processing your request. Please try again.'
+        )
+
+
+def streaming_route_response(planner, start_location, end_location, waypoints=()):
+    """StreamingHttpResponse that emits route events as they are computed"""
+    try:
+        coords = planner.geocode_route_locations(start_location, end_location, waypoints)
+    except LocationNotFoundError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # The body is generated after the view and middleware have returned,
+    # run it in the request's context for its log fields and stages
+    response = StreamingHttpResponse(
+        iterate_in_context(route_events(planner, start_location, end_location, waypoints, coords)),
+        content_type=NDJSON_CONTENT_TYPE
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,256 @@
+"""
+Synthetic fuel stations for scale testing.
+
+Stations are clustered at exits along the major US interstates, with a
+share scattered off the corridors, and priced from a per-state base with
+a brand premium and noise, roughly matching the spread of the OPIS file.
+Generation is deterministic for a seed, and the first N stations of a
+larger run are exactly the stations of a run of size N, so snapshots of
+several sizes can be cut from one run.
+"""
+import json
+import random
+from array import array
+
+from .distance import sphere_miles
+
+
+# Interstates as (city, state, latitude, longitude) waypoints
+INTERSTATES = {
+    'I-5': [
+        ('San Diego', 'CA', 32.7157, -117.1611), ('Los Angeles', 'CA', 34.0522, -118.2437),
+        ('Bakersfield', 'CA', 35.3733, -119.0187), ('Sacramento', 'CA', 38.5816, -121.4944),
+        ('Redding', 'CA', 40.5865, -122.3917), ('Medford', 'OR', 42.3265, -122.8756),
+        ('Portland', 'OR', 45.5152, -122.6784), ('Seattle', 'WA', 47.6062, -122.3321),
+    ],
+    'I-10': [
+        ('Los Angeles', 'CA', 34.0522, -118.2437), ('Phoenix', 'AZ', 33.4484, -112.0740),
+        ('Tucson', 'AZ', 32.2226, -110.9747), ('El Paso', 'TX', 31.7619, -106.4850),
+        ('San Antonio', 'TX', 29.4241, -98.4936), ('Houston', 'TX', 29.7604, -95.3698),
+        ('Baton Rouge', 'LA', 30.4515, -91.1871), ('Mobile', 'AL', 30.6954, -88.0399),
+        ('Tallahassee', 'FL', 30.4383, -84.2807), ('Jacksonville', 'FL', 30.3322, -81.6557),
+    ],
+    'I-15': [
+        ('San Diego', 'CA', 32.7157, -117.1611), ('Barstow', 'CA', 34.8958, -117.0173),
+        ('Las Vegas', 'NV', 36.1699, -115.1398), ('St. George', 'UT', 37.0965, -113.5684),
+        ('Salt Lake City', 'UT', 40.7608, -111.8910), ('Idaho Falls', 'ID', 43.4917, -112.0339),
+        ('Great Falls', 'MT', 47.5053, -111.3008),
+    ],
+    'I-20': [
+        ('Pecos', 'TX', 31.4229, -103.4932), ('Midland', 'TX', 31.9973, -102.0779),
+        ('Dallas', 'TX', 32.7767, -96.7970), ('Shreveport', 'LA', 32.5252, -93.7502),
+        ('Jackson', 'MS', 32.2988, -90.1848), ('Birmingham', 'AL', 33.5207, -86.8025),
+        ('Atlanta', 'GA', 33.7490, -84.3880), ('Columbia', 'SC', 34.0007, -81.0348),
+    ],
+    'I-25': [
+        ('Las Cruces', 'NM', 32.3199, -106.7637), ('Albuquerque', 'NM', 35.0844, -106.6504),
+        ('Pueblo', 'CO', 38.2544, -104.6091), ('Denver', 'CO', 39.7392, -104.9903),
+        ('Cheyenne', 'WY', 41.1400, -104.8202), ('Buffalo', 'WY', 44.3483, -106.6989),
+    ],
+    'I-35': [
+        ('Laredo', 'TX', 27.5306, -99.4803), ('San Antonio', 'TX', 29.4241, -98.4936),
+        ('Austin', 'TX', 30.2672, -97.7431), ('Dallas', 'TX', 32.7767, -96.7970),
+        ('Oklahoma City', 'OK', 35.4676, -97.5164), ('Wichita', 'KS', 37.6872, -97.3301),
+        ('Kansas City', 'MO', 39.0997, -94.5786), ('Des Moines', 'IA', 41.5868, -93.6250),
+        ('Minneapolis', 'MN', 44.9778, -93.2650), ('Duluth', 'MN', 46.7867, -92.1005),
+    ],
+    'I-40': [
+        ('Barstow', 'CA', 34.8958, -117.0173), ('Flagstaff', 'AZ', 35.1983, -111.6513),
+        ('Albuquerque', 'NM', 35.0844, -106.6504), ('Amarillo', 'TX', 35.2220, -101.8313),
+        ('Oklahoma City', 'OK', 35.4676, -97.5164), ('Little Rock', 'AR', 34.7465, -92.2896),
+        ('Memphis', 'TN', 35.1495, -90.0490), ('Nashville', 'TN', 36.1627, -86.7816),
+        ('Knoxville', 'TN', 35.9606, -83.9207), ('Greensboro', 'NC', 36.0726, -79.7920),
+        ('Raleigh', 'NC', 35.7796, -78.6382),
+    ],
+    'I-55': [
+        ('New Orleans', 'LA', 29.9511, -90.0715), ('Jackson', 'MS', 32.2988, -90.1848),
+        ('Memphis', 'TN', 35.1495, -90.0490), ('St. Louis', 'MO', 38.6270, -90.1994),
+        ('Springfield', 'IL', 39.7817, -89.6501), ('Chicago', 'IL', 41.8781, -87.6298),
+    ],
+    'I-65': [
+        ('Mobile', 'AL', 30.6954, -88.0399), ('Montgomery', 'AL', 32.3668, -86.3000),
+        ('Birmingham', 'AL', 33.5207, -86.8025), ('Nashville', 'TN', 36.1627, -86.7816),
+        ('Louisville', 'KY', 38.2527, -85.7585), ('Indianapolis', 'IN', 39.7684, -86.1581),
+        ('Gary', 'IN', 41.5934, -87.3464),
+    ],
+    'I-70': [
+        ('Cove Fort', 'UT', 38.6000, -112.5850), ('Grand Junction', 'CO', 39.0639, -108.5506),
+        ('Denver', 'CO', 39.7392, -104.9903), ('Salina', 'KS', 38.8403, -97.6114),
+        ('Kansas City', 'MO', 39.0997, -94.5786), ('St. Louis', 'MO', 38.6270, -90.1994),
+        ('Indianapolis', 'IN', 39.7684, -86.1581), ('Columbus', 'OH', 39.9612, -82.9988),
+        ('Pittsburgh', 'PA', 40.4406, -79.9959), ('Baltimore', 'MD', 39.2904, -76.6122),
+    ],
+    'I-75': [
+        ('Miami', 'FL', 25.7617, -80.1918), ('Tampa', 'FL', 27.9506, -82.4572),
+        ('Atlanta', 'GA', 33.7490, -84.3880), ('Chattanooga', 'TN', 35.0456, -85.3097),
+        ('Lexington', 'KY', 38.0406, -84.5037), ('Cincinnati', 'OH', 39.1031, -84.5120),
+        ('Toledo', 'OH', 41.6528, -83.5379), ('Detroit', 'MI', 42.3314, -83.0458),
+        ('Sault Ste. Marie', 'MI', 46.4953, -84.3453),
+    ],
+    'I-80': [
+        ('San Francisco', 'CA', 37.7749, -122.4194), ('Sacramento', 'CA', 38.5816, -121.4944),
+        ('Reno', 'NV', 39.5296, -119.8138), ('Salt Lake City', 'UT', 40.7608, -111.8910),
+        ('Rock Springs', 'WY', 41.5875, -109.2029), ('Cheyenne', 'WY', 41.1400, -104.8202),
+        ('North Platte', 'NE', 41.1403, -100.7601), ('Omaha', 'NE', 41.2565, -95.9345),
+        ('Des Moines', 'IA', 41.5868, -93.6250), ('Chicago', 'IL', 41.8781, -87.6298),
+        ('Toledo', 'OH', 41.6528, -83.5379), ('Cleveland', 'OH', 41.4993, -81.6944),
+        ('Harrisburg', 'PA', 40.2732, -76.8867), ('Newark', 'NJ', 40.7357, -74.1724),
+    ],
+    'I-81': [
+        ('Knoxville', 'TN', 35.9606, -83.9207), ('Roanoke', 'VA', 37.2710, -79.9414),
+        ('Harrisburg', 'PA', 40.2732, -76.8867), ('Scranton', 'PA', 41.4090, -75.6624),
+        ('Syracuse', 'NY', 43.0481, -76.1474), ('Watertown', 'NY', 43.9748, -75.9108),
+    ],
+    'I-90': [
+        ('Seattle', 'WA', 47.6062, -122.3321), ('Spokane', 'WA', 47.6588, -117.4260),
+        ('Missoula', 'MT', 46.8721, -113.9940), ('Billings', 'MT', 45.7833, -108.5007),
+        ('Rapid City', 'SD', 44.0805, -103.2310), ('Sioux Falls', 'SD', 43.5446, -96.7311),
+        ('Madison', 'WI', 43.0731, -89.4012), ('Chicago', 'IL', 41.8781, -87.6298),
+        ('Cleveland', 'OH', 41.4993, -81.6944), ('Buffalo', 'NY', 42.8864, -78.8784),
+        ('Albany', 'NY', 42.6526, -73.7562), ('Boston', 'MA', 42.3601, -71.0589),
+    ],
+    'I-94': [
+        ('Billings', 'MT', 45.7833, -108.5007), ('Bismarck', 'ND', 46.8083, -100.7837),
+        ('Fargo', 'ND', 46.8772, -96.7898), ('Minneapolis', 'MN', 44.9778, -93.2650),
+        ('Madison', 'WI', 43.0731, -89.4012), ('Milwaukee', 'WI', 43.0389, -87.9065),
+        ('Chicago', 'IL', 41.8781, -87.6298), ('Detroit', 'MI', 42.3314, -83.0458),
+    ],
+    'I-95': [
+        ('Miami', 'FL', 25.7617, -80.1918), ('Jacksonville', 'FL', 30.3322, -81.6557),
+        ('Savannah', 'GA', 32.0809, -81.0912), ('Florence', 'SC', 34.1954, -79.7626),
+        ('Richmond', 'VA', 37.5407, -77.4360), ('Baltimore', 'MD', 39.2904, -76.6122),
+        ('Philadelphia', 'PA', 39.9526, -75.1652), ('New York', 'NY', 40.7128, -74.0060),
+        ('Hartford', 'CT', 41.7658, -72.6734), ('Boston', 'MA', 42.3601, -71.0589),
+        ('Portland', 'ME', 43.6591, -70.2568),
+    ],
+}
+
+# Typical diesel retail price by state; other states use DEFAULT_PRICE
+STATE_PRICES = {
+    'CA': 4.95, 'WA': 4.55, 'OR': 4.35, 'NV': 4.20, 'AZ': 3.95, 'UT': 3.85, 'ID': 3.80,
+    'MT': 3.70, 'WY': 3.65, 'CO': 3.70, 'NM': 3.60, 'TX': 3.30, 'OK': 3.25, 'KS': 3.35,
+    'NE': 3.45, 'SD': 3.50, 'ND': 3.55, 'MN': 3.50, 'IA': 3.40, 'MO': 3.30, 'AR': 3.35,
+    'LA': 3.30, 'MS': 3.28, 'AL': 3.35, 'TN': 3.40, 'KY': 3.50, 'IL': 3.75, 'IN': 3.70,
+    'OH': 3.65, 'MI': 3.70, 'WI': 3.60, 'PA': 4.10, 'NY': 4.25, 'NJ': 3.85, 'CT': 4.20,
+    'MA': 4.15, 'ME': 4.20, 'MD': 3.90, 'VA': 3.75, 'NC': 3.65, 'SC': 3.45, 'GA': 3.45,
+    'FL': 3.60,
+}
+DEFAULT_PRICE = 3.70
+
+BRANDS = (
+    ('PILOT TRAVEL CENTER', 0.06), ('LOVES TRAVEL STOP', 0.05), ('FLYING J TRAVEL CENTER', 0.06),
+    ('TA TRAVEL CENTER', 0.08), ('PETRO STOPPING CENTER', 0.07), ('KWIK TRIP', -0.05),
+    ('SHELL', 0.04), ('CIRCLE K', -0.02), ('SPEEDWAY', -0.03), ('ROAD RANGER', 0.0),
+    ('SAPP BROS', 0.02), ('BUCKEES', -0.06),
+)
+
+# Miles between exits that get stations, and the share of off-corridor stations
+EXIT_SPACING_MILES = 12
+OFF_CORRIDOR_SHARE = 0.1
+
+# Synthetic stations use rack ids from here on so they can be told apart
+SYNTHETIC_RACK_ID_BASE = 100_000_000
+
+
+class Corridor:
+    """One interstate with cumulative mileage at each waypoint"""
+
+    def __init__(self, name, waypoints):
+        self.name = name
+        self.waypoints = waypoints
+        self.miles = [0.0]
+        for start, end in zip(waypoints, waypoints[1:]):
+            self.miles.append(self.miles[-1] + sphere_miles(start[2:], end[2:]))
+        self.length = self.miles[-1]
+
+    def point_at(self, mile):
+        """(latitude, longitude, nearest waypoint) at a mileage"""
+        for index in range(1, len(self.miles)):
+            if mile <= self.miles[index] or index == len(self.miles) - 1:
+                start, end = self.waypoints[index - 1], self.waypoints[index]
+                span = self.miles[index] - self.miles[index - 1]
+                ratio = min(1.0, max(0.0, (mile - self.miles[index - 1]) / span)) if span else 0.0
+                nearest = start if ratio < 0.5 else end
+                return (
+                    start[2] + (end[2] - start[2]) * ratio,
+                    start[3] + (end[3] - start[3]) * ratio,
+                    nearest,
+                )
+
+
+def generate_stations(count, seed=42):
+    """
+    Yield (name, address, city, state, rack_id, retail_price, latitude,
+    longitude) tuples for `count` synthetic stations
+    """
+    corridors = [Corridor(name, waypoints) for name, waypoints in INTERSTATES.items()]
+    total_miles = sum(corridor.length for corridor in corridors)
+    cities = [waypoint for corridor in corridors for waypoint in corridor.waypoints]
+    rng = random.Random(seed)
+
+    for position in range(count):
+        if rng.random() < OFF_CORRIDOR_SHARE:
+            # Local stations around a corridor city
+            city, state, latitude, longitude = rng.choice(cities)
+            latitude += rng.gauss(0, 0.35)
+            longitude += rng.gauss(0, 0.45)
+            address = f'{rng.randint(100, 9999)} {rng.choice(("Main St", "Highway 30", "Commerce Dr", "Truck Plaza Rd"))}'
+        else:
+            # Pick a corridor by length, then an exit along it
+            target = rng.random() * total_miles
+            for corridor in corridors:
+                if target <= corridor.length:
+                    break
+                target -= corridor.length
+            exit_mile = min(corridor.length, round(target / EXIT_SPACING_MILES) * EXIT_SPACING_MILES)
+            latitude, longitude, (city, state, _, _) = corridor.point_at(exit_mile)
+            # Stations sit within a mile or so of the exit
+            latitude += rng.gauss(0, 0.01)
+            longitude += rng.gauss(0, 0.012)
+            address = f'{corridor.name}, EXIT {int(exit_mile)}'
+
+        brand, premium = rng.choice(BRANDS)
+        price = STATE_PRICES.get(state, DEFAULT_PRICE) + premium + rng.gauss(0, 0.12)
+        yield (
+            f'{brand} #{position + 1}',
+            address,
+            city,
+            state,
+            SYNTHETIC_RACK_ID_BASE + position,
+            round(min(6.5, max(2.5, price)), 3),
+            round(latitude, 6),
+            round(longitude, 6),
+        )
+
+
+class StationColumns:
+    """Generated stations held as snapshot columns instead of dicts"""
+
+    def __init__(self):
+        self.ids = array('q')
+        self.rack_ids = array('q')
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.prices = array('d')
+        self.text_offsets = array('q', [0])
+        self.text = bytearray()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, station_id, station):
+        name, address, city, state, rack_id, price, latitude, longitude = station
+        self.ids.append(station_id)
+        self.rack_ids.append(rack_id)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.prices.append(price)
+        self.text += json.dumps([name, address, city, state]).encode('utf-8')
+        self.text_offsets.append(len(self.text))
+
+    def prefix(self, count):
+        """Column arguments of write_snapshot_columns for the first `count` stations"""
+        return (
+            self.ids[:count], self.rack_ids[:count], self.latitudes[:count], self.longitudes[:count],
+            self.prices[:count], self.text_offsets[:count + 1], self.text,
+        )
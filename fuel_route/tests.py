@@ -0,0 +1,1225 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from geopy.distance import geodesic
+
+from .async_views import provider_client, with_http_client_lifespan
+from .batch import plan_batch
+from .benchmark import compare_reports, in_conus, route_polyline, synthetic_routes
+from .cache_backends import SQLiteCache
+from .coalescing import SingleFlight, route_single_flight
+from .distance import (
+    FLAT_RELATIVE_ERROR, SPHERE_RELATIVE_ERROR, DistancePrecision, approx_miles, distance_precision, exact_miles,
+    sphere_miles,
+)
+from .epochs import bump_price_epoch, get_layout_epoch, get_price_epoch
+from .fast_path import validate_simple_request
+from .gazetteer import Gazetteer, build_gazetteer
+from . import jobs
+from .logs import ContextFilter, current_log_context, log_context
+from .management.commands import plan_routes
+from .management.commands.warm_route_cache import Command as WarmRouteCacheCommand
+from .metrics import Counter, Histogram, in_request_context, iterate_in_context, render_metrics, stage, timed_view
+from .models import FuelStation, RouteJob
+from .normalization import NormalizationStats, normalize_location, parse_city_state
+from .planner import RoutePlanner
+from .profiling import profiling_token_valid
+from .refresh import StaleWhileRevalidateCache
+from .serializers import RouteRequestSerializer
+from .signals import bulk_station_changes
+from .station_index import PackedStationIndex, SnapshotStationIndex, get_station_index, pack_station_index
+from .synthetic import SYNTHETIC_RACK_ID_BASE, generate_stations
+from .views import FuelRouteView
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fuel-route-tests',
+    },
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncSingleFlightTests(SimpleTestCase):
+    """SingleFlight.ado followers when the leader fails, is cancelled or is slow"""
+
+    def setUp(self):
+        cache.clear()
+
+    async def start_leader(self, flight, leader_fn):
+        leader = asyncio.create_task(flight.ado('lane', leader_fn))
+        # Let the leader register its call before followers arrive
+        while 'lane' not in flight._async_calls:
+            await asyncio.sleep(0)
+        return leader
+
+    async def test_followers_share_the_leader_result(self):
+        flight = SingleFlight(wait_timeout=5)
+        release = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return 'plan'
+
+        leader = await self.start_leader(flight, compute)
+        follower = asyncio.create_task(flight.ado('lane', compute))
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await leader, 'plan')
+        self.assertEqual(await follower, 'plan')
+        self.assertEqual(len(calls), 1)
+
+    async def test_leader_error_reaches_followers(self):
+        flight = SingleFlight(wait_timeout=5)
+        release = asyncio.Event()
+
+        async def fail():
+            await release.wait()
+            raise ValueError('routing failed')
+
+        leader = await self.start_leader(flight, fail)
+        follower = asyncio.create_task(flight.ado('lane', fail))
+        await asyncio.sleep(0)
+        release.set()
+
+        with self.assertRaises(ValueError):
+            await leader
+        with self.assertRaises(ValueError):
+            await follower
+        self.assertNotIn('lane', flight._async_calls)
+
+    async def test_followers_compute_when_leader_is_cancelled(self):
+        flight = SingleFlight(wait_timeout=5)
+
+        async def hang():
+            await asyncio.Event().wait()
+
+        async def compute():
+            return 'plan'
+
+        leader = await self.start_leader(flight, hang)
+        follower = asyncio.create_task(flight.ado('lane', compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        self.assertEqual(await asyncio.wait_for(follower, 2), 'plan')
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertNotIn('lane', flight._async_calls)
+
+    async def test_followers_stop_waiting_after_wait_timeout(self):
+        flight = SingleFlight(wait_timeout=0.1)
+
+        async def hang():
+            await asyncio.Event().wait()
+
+        async def compute():
+            return 'plan'
+
+        leader = await self.start_leader(flight, hang)
+        try:
+            self.assertEqual(await asyncio.wait_for(flight.ado('lane', compute), 2), 'plan')
+        finally:
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RouteCoalescingKeyTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_price_change_starts_a_new_flight(self):
+        planner = FuelRouteView()
+        lane = ('Omaha, NE', 'Denver, CO')
+        with mock.patch.object(FuelRouteView, 'get_cached_response', return_value=None), \
+                mock.patch.object(route_single_flight, 'do', return_value={}) as do:
+            planner.get_route_response(*lane)
+            planner.get_route_response(*lane)
+            bump_price_epoch()
+            planner.get_route_response(*lane)
+
+        keys = [call.args[0] for call in do.call_args_list]
+        self.assertEqual(keys[0], keys[1])
+        # Followers never pick up a result published under the old prices
+        self.assertNotEqual(keys[1], keys[2])
+        self.assertEqual(keys[2], planner.get_plan_cache_key(*lane))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.stale_cache = StaleWhileRevalidateCache(beta=1.0, stale_ttl=60)
+
+    def wait_for_refreshes(self):
+        # Keys leave _refreshing when their background refresh is done
+        for _ in range(500):
+            if not self.stale_cache._refreshing:
+                return
+            threading.Event().wait(0.01)
+        self.fail('Background refresh did not finish')
+
+    def test_xfetch_refreshes_more_eagerly_for_slow_entries(self):
+        entry = {'expires': 1000.0, 'delta': 1.0}
+        # random() = 0.9 scales delta by -log(0.1) = 2.3 seconds
+        with mock.patch('fuel_route.refresh.random.random', return_value=0.9):
+            self.assertTrue(self.stale_cache.should_refresh(entry, now=998.0))
+            self.assertFalse(self.stale_cache.should_refresh(entry, now=997.0))
+        with mock.patch('fuel_route.refresh.random.random', return_value=0.0):
+            self.assertFalse(self.stale_cache.should_refresh(entry, now=999.9))
+            self.assertTrue(self.stale_cache.should_refresh(entry, now=1000.0))
+
+    def test_fresh_entry_is_served_without_refresh(self):
+        self.stale_cache.set('plan', 'cached', 3600)
+        refresh = mock.Mock(return_value='new')
+        self.assertEqual(self.stale_cache.get('plan', refresh), 'cached')
+        self.wait_for_refreshes()
+        refresh.assert_not_called()
+
+    def test_expired_entry_is_served_stale_while_one_refresh_runs(self):
+        self.stale_cache.set('plan', 'stale', -1)
+        release = threading.Event()
+        calls = []
+
+        def refresh():
+            calls.append(1)
+            release.wait(5)
+            return 'fresh'
+
+        for _ in range(5):
+            self.assertEqual(self.stale_cache.get('plan', refresh), 'stale')
+        release.set()
+        self.wait_for_refreshes()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.stale_cache.get('plan'), 'fresh')
+
+    def test_plain_values_pass_through(self):
+        cache.set('plan', 'legacy')
+        self.assertEqual(self.stale_cache.get('plan', refresh=mock.Mock()), 'legacy')
+
+
+class SQLiteCacheIncrTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SQLiteCache(str(Path(directory.name) / 'cache.sqlite3'), {})
+
+    def test_concurrent_increments_are_not_lost(self):
+        self.cache.set('epoch', 0, None)
+
+        def bump():
+            for _ in range(50):
+                self.cache.incr('epoch')
+
+        threads = [threading.Thread(target=bump) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('epoch'), 200)
+
+    def test_missing_key_raises(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StationEpochSignalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.station = FuelStation.objects.create(
+                name='Test Stop', address='I-80', city='Omaha', state='NE', rack_id=1,
+                retail_price='3.199', latitude=41.25, longitude=-95.93,
+            )
+
+    def save(self, station, **kwargs):
+        layout, price = get_layout_epoch(), get_price_epoch()
+        with self.captureOnCommitCallbacks(execute=True):
+            station.save(**kwargs)
+        return get_layout_epoch() != layout, get_price_epoch() != price
+
+    def test_price_update_bumps_price_epoch_only(self):
+        station = FuelStation.objects.get(pk=self.station.pk)
+        station.retail_price = '3.299'
+        self.assertEqual(self.save(station), (False, True))
+
+    def test_move_bumps_layout_epoch(self):
+        station = FuelStation.objects.get(pk=self.station.pk)
+        station.latitude = 41.5
+        self.assertEqual(self.save(station), (True, True))
+        # Saved location is the new baseline
+        station.retail_price = '3.299'
+        self.assertEqual(self.save(station), (False, True))
+
+    def test_update_fields_without_location_is_not_a_move(self):
+        station = FuelStation.objects.get(pk=self.station.pk)
+        station.latitude = 41.5
+        station.retail_price = '3.299'
+        self.assertEqual(self.save(station, update_fields=['retail_price']), (False, True))
+
+    def test_bulk_changes_skip_per_row_bumps(self):
+        station = FuelStation.objects.get(pk=self.station.pk)
+        station.latitude = 41.5
+        with bulk_station_changes():
+            self.assertEqual(self.save(station), (False, False))
+
+
+class EnqueueJobTests(TestCase):
+    payload = {'start_location': 'Omaha, NE', 'end_location': 'Denver, CO'}
+
+    def test_identical_request_joins_the_live_job(self):
+        job, created = jobs.enqueue_job(RouteJob.KIND_ROUTE, self.payload)
+        duplicate, duplicate_created = jobs.enqueue_job(RouteJob.KIND_ROUTE, dict(self.payload), priority=5)
+        self.assertEqual((created, duplicate_created), (True, False))
+        self.assertEqual(duplicate.id, job.id)
+        self.assertEqual(RouteJob.objects.get(id=job.id).priority, 5)
+
+    def test_insert_race_returns_the_winning_job(self):
+        job, _ = jobs.enqueue_job(RouteJob.KIND_ROUTE, self.payload)
+        # The losing request checked before the winner's insert was visible
+        find_live_job = jobs.find_live_job
+        with mock.patch.object(jobs, 'find_live_job', side_effect=[None, find_live_job(job.job_key)]):
+            duplicate, created = jobs.enqueue_job(RouteJob.KIND_ROUTE, self.payload)
+        self.assertFalse(created)
+        self.assertEqual(duplicate.id, job.id)
+        self.assertEqual(RouteJob.objects.filter(job_key=job.job_key).count(), 1)
+
+
+class StreamingContextTests(SimpleTestCase):
+    def test_streamed_body_keeps_the_request_context(self):
+        seen = []
+
+        def events():
+            with stage('optimize'):
+                seen.append(current_log_context().get('request_id'))
+            yield b'{}\n'
+
+        @timed_view('route')
+        def view(request):
+            return StreamingHttpResponse(iterate_in_context(events()))
+
+        with log_context(request_id='abc'):
+            response = view(RequestFactory().get('/api/route/'))
+
+        records = []
+        handler = logging.Handler()
+        handler.addFilter(ContextFilter())
+        handler.emit = records.append
+        metrics_logger = logging.getLogger('fuel_route.metrics')
+        metrics_logger.addHandler(handler)
+        self.addCleanup(metrics_logger.removeHandler, handler)
+
+        self.assertEqual(records, [])
+        self.assertEqual(b''.join(response.streaming_content), b'{}\n')
+        self.assertEqual(seen, ['abc'])
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].context, {'request_id': 'abc'})
+        self.assertIn('optimize', records[0].stages)
+
+
+@override_settings(ROUTE_PROFILING_TOKEN='secret')
+class ProfilingTokenTests(SimpleTestCase):
+    def test_token_is_accepted_from_the_header(self):
+        request = RequestFactory().post('/api/route/', HTTP_X_ROUTE_PROFILE='secret')
+        self.assertTrue(profiling_token_valid(request))
+
+    def test_token_in_the_query_string_is_ignored(self):
+        self.assertFalse(profiling_token_valid(RequestFactory().post('/api/route/?profile=secret')))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, NOMINATIM_URL='http://127.0.0.1:9', ROUTE_REQUEST_LOG=None)
+class AsyncRouteViewTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        # Cities only the station data knows about
+        FuelStation.objects.create(
+            name='East Stop', address='I-80', city='Eastfield', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.25, longitude=-95.93,
+        )
+        FuelStation.objects.create(
+            name='West Stop', address='I-76', city='Westfield', state='CO', rack_id=2,
+            retail_price='3.299', latitude=39.74, longitude=-104.99,
+        )
+        # A worker that was not preloaded, without an OpenRouteService key
+        for patcher in (
+            mock.patch('fuel_route.gazetteer._gazetteer', None),
+            mock.patch('fuel_route.station_index._index', None),
+            mock.patch.dict(os.environ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('OPENROUTE_API_KEY', None)
+
+    async def test_cold_planner_resolves_station_cities(self):
+        response = await self.async_client.post(
+            '/api/route/async/',
+            {'start_location': 'Eastfield, NE', 'end_location': 'Westfield, CO'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['api_info']['route_source'], 'fallback')
+
+
+class ProviderClientTests(SimpleTestCase):
+    async def test_client_without_lifespan_is_closed_after_use(self):
+        async with provider_client() as client:
+            self.assertFalse(client.is_closed)
+        self.assertTrue(client.is_closed)
+
+    async def test_lifespan_owns_the_shared_client(self):
+        messages = asyncio.Queue()
+        sent = []
+
+        async def send(message):
+            sent.append(message['type'])
+
+        app = with_http_client_lifespan(None)
+        lifespan = asyncio.create_task(app({'type': 'lifespan'}, messages.get, send))
+        await messages.put({'type': 'lifespan.startup'})
+        while not sent:
+            await asyncio.sleep(0)
+
+        async with provider_client() as first:
+            pass
+        async with provider_client() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertFalse(first.is_closed)
+
+        await messages.put({'type': 'lifespan.shutdown'})
+        await lifespan
+        self.assertTrue(first.is_closed)
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+class WarmRouteCacheInputTests(SimpleTestCase):
+    def write(self, name, text):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / name
+        path.write_text(text, encoding='utf-8')
+        return str(path)
+
+    def test_lanes_file_skips_the_header_and_duplicates(self):
+        path = self.write(
+            'lanes.csv',
+            'start_location,end_location\n"Omaha, NE","Denver, CO"\n"omaha, ne","DENVER, CO"\n"Denver, CO",\n'
+        )
+        lanes = WarmRouteCacheCommand().read_lanes_file(path)
+        self.assertEqual(lanes, [('Omaha, NE', 'Denver, CO')])
+
+    def test_request_log_ranks_recent_two_stop_lanes(self):
+        now = time.time()
+        entries = [
+            {'timestamp': now, 'start_location': 'Omaha, NE', 'end_location': 'Denver, CO'},
+            {'timestamp': now, 'start_location': 'Omaha, NE', 'end_location': 'Denver, CO'},
+            {'timestamp': now, 'start_location': 'Lincoln, NE', 'end_location': 'Denver, CO'},
+            # Too old, and a multi-stop route
+            {'timestamp': now - 48 * 3600, 'start_location': 'Reno, NV', 'end_location': 'Elko, NV'},
+            {'timestamp': now, 'start_location': 'Reno, NV', 'end_location': 'Elko, NV', 'waypoints': ['Ely, NV']},
+        ]
+        path = self.write('requests.jsonl', '\n'.join(map(json.dumps, entries)) + '\nnot json\n')
+        lanes = WarmRouteCacheCommand().read_request_log(path, top=5, since_hours=24)
+        self.assertEqual(lanes, [('Omaha, NE', 'Denver, CO'), ('Lincoln, NE', 'Denver, CO')])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class WarmRouteCacheCommandTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        # Offline: no geocoder hits and straight-line fallback routes
+        for patcher in (
+            mock.patch('fuel_route.station_index._index', None),
+            mock.patch.object(FuelRouteView, 'geocode_from_provider', return_value=None),
+            mock.patch.dict(os.environ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('OPENROUTE_API_KEY', None)
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Lexington', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.13, longitude=-99.92,
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.lanes = Path(directory.name) / 'lanes.csv'
+        self.lanes.write_text('"Omaha, NE","Salt Lake City, UT"\n"Nowhere, ZZ","Denver, CO"\n', encoding='utf-8')
+
+    def warm(self):
+        out = StringIO()
+        call_command('warm_route_cache', str(self.lanes), stdout=out)
+        return out.getvalue()
+
+    def test_warms_every_stage_and_reports_coverage(self):
+        output = self.warm()
+        self.assertIn('Lanes warmed: 1/2', output)
+        self.assertIn('Plan coverage before warming: 0/2', output)
+        self.assertIn('FAILED Nowhere, ZZ -> Denver, CO', output)
+
+        plan = FuelRouteView().get_cached_response('Omaha, NE', 'Salt Lake City, UT')
+        self.assertEqual({stop['city'] for stop in plan['fuel_stops']}, {'Lexington'})
+
+        output = self.warm()
+        self.assertIn('Geometry coverage before warming: 1/2', output)
+        self.assertIn('Plan coverage before warming: 1/2', output)
+
+
+class NormalizeLocationTests(SimpleTestCase):
+    def test_spellings_of_a_city_share_one_key(self):
+        for spelling in ('New York, NY', 'new york ny', 'New York, New York', ' NEW  YORK,NY, USA'):
+            self.assertEqual(normalize_location(spelling), 'new york, ny')
+        self.assertEqual(normalize_location('St. Louis, Missouri'), 'saint louis, mo')
+
+    def test_multi_word_states(self):
+        self.assertEqual(normalize_location('Charleston West Virginia'), 'charleston, wv')
+        self.assertEqual(normalize_location('Raleigh North Carolina'), 'raleigh, nc')
+        self.assertEqual(normalize_location('Santa Fe New Mexico'), 'santa fe, nm')
+
+    def test_bare_state_names_are_not_split(self):
+        self.assertEqual(normalize_location('West Virginia'), 'west virginia')
+        self.assertNotEqual(normalize_location('West Virginia'), normalize_location('West, VA'))
+        self.assertEqual(normalize_location('North Carolina'), 'north carolina')
+        self.assertEqual(normalize_location('New Mexico'), 'new mexico')
+        self.assertIsNone(parse_city_state('West Virginia'))
+
+    def test_addresses_keep_their_parts(self):
+        self.assertEqual(
+            normalize_location('123 Main Street, Springfield, Illinois, USA'), '123 main st, springfield, il'
+        )
+        self.assertIsNone(parse_city_state('123 Main Street, Springfield, IL'))
+        self.assertEqual(parse_city_state('Ft. Worth TX'), ('fort worth', 'tx'))
+
+    def test_stats_compare_raw_and_normalized_hits(self):
+        stats = NormalizationStats()
+        stats.record('geocode', 'New York, NY', 'new york, ny')
+        stats.record('geocode', 'new york ny', 'new york, ny')
+        snapshot = stats.snapshot()['geocode']
+        self.assertEqual((snapshot['raw_hits'], snapshot['normalized_hits']), (0, 1))
+        self.assertEqual(snapshot['normalized_hit_rate'], 0.5)
+
+
+class GazetteerTests(SimpleTestCase):
+    def setUp(self):
+        self.gazetteer = Gazetteer([
+            ('Saint Louis', 'MO', 38.627, -90.199),
+            ('Portland', 'OR', 45.515, -122.679),
+            ('Portland', 'ME', 43.659, -70.257),
+            # Later sources never override earlier ones
+            ('Portland', 'OR', 0.0, 0.0),
+        ])
+
+    def test_lookup_accepts_any_normalized_spelling(self):
+        self.assertEqual(self.gazetteer.lookup('St. Louis, Missouri'), (38.627, -90.199))
+        self.assertEqual(self.gazetteer.lookup('portland or'), (45.515, -122.679))
+        self.assertIsNone(self.gazetteer.lookup('Portland, WA'))
+        self.assertIsNone(self.gazetteer.lookup('1 Main St, Portland, OR'))
+
+    def test_search_prefix(self):
+        results = self.gazetteer.search_prefix('portland|')
+        self.assertEqual([(place['city'], place['state']) for place in results], [('Portland', 'ME'), ('Portland', 'OR')])
+
+
+class GazetteerStationTests(TestCase):
+    def test_station_cities_fill_gaps_in_the_place_file(self):
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Eastfield', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.25, longitude=-95.93,
+        )
+        FuelStation.objects.create(
+            name='Downtown Stop', address='Main St', city='Denver', state='CO', rack_id=2,
+            retail_price='3.299', latitude=0.0, longitude=0.0,
+        )
+        gazetteer = build_gazetteer()
+        self.assertEqual(gazetteer.lookup('Eastfield, NE'), (41.25, -95.93))
+        # The curated place file wins over station coordinates
+        self.assertAlmostEqual(gazetteer.lookup('Denver, CO')[0], 39.7392)
+
+    def test_planner_resolves_places_without_the_geocoder(self):
+        with mock.patch.object(FuelRouteView, 'geocode_from_provider') as geocode:
+            coords = FuelRouteView().geocode_locations(['Omaha, NE', 'Denver, Colorado'])
+        geocode.assert_not_called()
+        self.assertAlmostEqual(coords[0][0], 41.2565)
+        self.assertAlmostEqual(coords[1][1], -104.9903)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BatchPlanningTests(TransactionTestCase):
+    trips = [
+        {'start_location': 'Omaha, NE', 'end_location': 'Salt Lake City, UT'},
+        # Same lane spelled differently, then the lane for another vehicle
+        {'start_location': 'omaha ne', 'end_location': 'Salt Lake City, Utah'},
+        {'start_location': 'Omaha, NE', 'end_location': 'Salt Lake City, UT', 'vehicle': 'box_truck'},
+        {'start_location': 'Nowhere, ZZ', 'end_location': 'Denver, CO'},
+        {'start_location': 'Omaha, NE'},
+    ]
+
+    def setUp(self):
+        cache.clear()
+        for patcher in (
+            mock.patch('fuel_route.station_index._index', None),
+            mock.patch.object(FuelRouteView, 'geocode_from_provider', return_value=None),
+            mock.patch.dict(os.environ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('OPENROUTE_API_KEY', None)
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Lexington', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.13, longitude=-99.92,
+        )
+
+    def test_locations_and_lanes_are_resolved_once(self):
+        planner = FuelRouteView()
+        with mock.patch.object(FuelRouteView, 'geocode_location', autospec=True,
+                               side_effect=FuelRouteView.geocode_location) as geocode, \
+                mock.patch.object(FuelRouteView, 'get_route_from_openrouteservice', autospec=True,
+                                  side_effect=FuelRouteView.get_route_from_openrouteservice) as route:
+            results, errors, summary = plan_batch(self.trips, planner)
+
+        self.assertEqual(geocode.call_count, 4)
+        self.assertEqual(route.call_count, 1)
+        self.assertEqual((summary['unique_locations'], summary['unique_lanes']), (4, 2))
+        self.assertEqual((summary['succeeded'], summary['failed'], summary['cached']), (3, 2, 0))
+        self.assertEqual([error['index'] for error in errors], [3, 4])
+        self.assertIn('start location', errors[0]['error'])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[2]['api_info']['vehicle_range_miles'], 350)
+        self.assertEqual({stop['city'] for stop in results[0]['fuel_stops']}, {'Lexington'})
+
+        _, _, summary = plan_batch(self.trips, planner)
+        self.assertEqual(summary['cached'], 3)
+
+    @override_settings(ROUTE_BATCH_MAX_TRIPS=2)
+    def test_view_rejects_oversized_and_malformed_batches(self):
+        response = self.client.post('/api/routes/batch/', {'trips': self.trips}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 2 trips', response.json()['error'])
+        response = self.client.post('/api/routes/batch/', {'trips': {}}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/routes/batch/', {'trips': self.trips[:2]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary']['succeeded'], 2)
+
+
+class PlanRoutesWorkerTests(SimpleTestCase):
+    def test_parsed_vehicles_are_not_shared(self):
+        vehicle = plan_routes.parse_vehicle(('600', '7', ''))
+        self.assertEqual(vehicle, {'max_range_miles': 600, 'miles_per_gallon': 7})
+        vehicle['max_range_miles'] = 100
+        self.assertEqual(plan_routes.parse_vehicle(('600', '7', ''))['max_range_miles'], 600)
+        self.assertIsInstance(plan_routes.parse_vehicle(('-1', '', '')), str)
+
+    def test_corridors_are_shared_per_lane_and_detour_limit(self):
+        index = mock.Mock()
+        index.corridor.return_value = []
+        route = {'coordinates': [[41.26, -95.93], [40.76, -111.89]], 'distance_miles': 834.0}
+        jobs = [
+            # Separately unpickled copies of one lane's geometry
+            (0, 'Omaha, NE', 'Salt Lake City, UT', {}, 'lane-a', dict(route), None),
+            (1, 'Omaha, NE', 'Salt Lake City, UT', {}, 'lane-a', dict(route), None),
+            (2, 'Omaha, NE', 'Salt Lake City, UT', {'max_station_distance_miles': 10}, 'lane-a', dict(route), None),
+            (3, 'Omaha, NE', 'Denver, CO', {}, 'lane-b', dict(route), None),
+            (4, 'Nowhere, ZZ', 'Denver, CO', {}, None, None, 'Could not find coordinates'),
+        ]
+        with mock.patch.object(plan_routes, '_worker_index', index), \
+                mock.patch.object(plan_routes, '_worker_planner', FuelRouteView()):
+            rows, _ = plan_routes.plan_chunk(jobs)
+
+        self.assertEqual(index.corridor.call_count, 3)
+        self.assertEqual([row[0] for row in rows], [0, 1, 2, 3, 4])
+        self.assertEqual(rows[4][4], 'Could not find coordinates')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PlanRoutesCommandTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        for patcher in (
+            mock.patch('fuel_route.station_index._index', None),
+            mock.patch.object(FuelRouteView, 'geocode_from_provider', return_value=None),
+            mock.patch.dict(os.environ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('OPENROUTE_API_KEY', None)
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Lexington', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.13, longitude=-99.92,
+        )
+
+    def test_plans_a_trip_file_in_worker_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        trips = Path(directory.name) / 'trips.csv'
+        trips.write_text(
+            'start_location,end_location,max_range_miles\n'
+            '"Omaha, NE","Salt Lake City, UT",\n'
+            '"Nowhere, ZZ","Denver, CO",\n'
+            '"Omaha, NE","Salt Lake City, UT",-5\n'
+            '"omaha ne","Salt Lake City, UT",900\n',
+            encoding='utf-8'
+        )
+        output = Path(directory.name) / 'plans.ndjson'
+
+        call_command(
+            'plan_routes', str(trips), '--workers', '2', '--chunk-size', '2',
+            '--output', str(output), '--format', 'ndjson', stderr=StringIO(),
+        )
+
+        lines = [json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([line['index'] for line in lines], [0, 1, 2, 3])
+        self.assertEqual({stop['city'] for stop in lines[0]['result']['fuel_stops']}, {'Lexington'})
+        self.assertIn('start location', lines[1]['error'])
+        self.assertIn('max_range_miles', lines[2]['error'])
+        self.assertEqual(lines[3]['result']['api_info']['vehicle_range_miles'], 900)
+
+
+class StaleJobTests(TestCase):
+    payload = {'start_location': 'Omaha, NE', 'end_location': 'Denver, CO'}
+
+    def running_job(self, heartbeat_age, attempts=1):
+        # A distinct request per job
+        end_location = f'Town {RouteJob.objects.count()}, CO'
+        job, _ = jobs.enqueue_job(RouteJob.KIND_ROUTE, {**self.payload, 'end_location': end_location})
+        now = timezone.now()
+        RouteJob.objects.filter(id=job.id).update(
+            status=RouteJob.STATUS_RUNNING, attempts=attempts,
+            started_at=now - timedelta(hours=1), heartbeat_at=now - timedelta(seconds=heartbeat_age),
+        )
+        return job
+
+    @override_settings(ROUTE_JOB_RUNNING_TIMEOUT=120, ROUTE_JOB_MAX_ATTEMPTS=3)
+    def test_only_jobs_without_a_recent_heartbeat_are_requeued(self):
+        slow = self.running_job(heartbeat_age=10)
+        dead = self.running_job(heartbeat_age=300)
+        exhausted = self.running_job(heartbeat_age=300, attempts=3)
+
+        self.assertEqual(jobs.requeue_stale_jobs(), (1, 1))
+        statuses = dict(RouteJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[slow.id], RouteJob.STATUS_RUNNING)
+        self.assertEqual(statuses[dead.id], RouteJob.STATUS_QUEUED)
+        self.assertEqual(statuses[exhausted.id], RouteJob.STATUS_FAILED)
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    @override_settings(ROUTE_JOB_HEARTBEAT_INTERVAL=0.01)
+    def test_running_job_heartbeats_until_it_finishes(self):
+        jobs.enqueue_job(RouteJob.KIND_ROUTE, {'start_location': 'Omaha, NE', 'end_location': 'Denver, CO'})
+        job = jobs.claim_next_job()
+        claimed_at = job.heartbeat_at
+
+        with jobs.heartbeat(job):
+            time.sleep(0.1)
+        beat_at = RouteJob.objects.get(id=job.id).heartbeat_at
+        self.assertGreater(beat_at, claimed_at)
+
+        time.sleep(0.05)
+        self.assertEqual(RouteJob.objects.get(id=job.id).heartbeat_at, beat_at)
+
+
+class LegFuelStateTests(SimpleTestCase):
+    def test_fuel_is_carried_across_waypoints(self):
+        planner = FuelRouteView(geolocator=mock.Mock(), http_session=mock.Mock())
+        legs = planner.get_leg_fuel_states([300, 400, 300], [500], 1000)
+        self.assertEqual([leg['fuel_stops'] for leg in legs], [0, 1, 0])
+        self.assertEqual([leg['range_at_arrival_miles'] for leg in legs], [200, 300, 0])
+        self.assertEqual([leg['fuel_at_arrival_gallons'] for leg in legs], [20, 30, 0])
+
+    def test_provider_leg_distances_are_scaled_to_the_route(self):
+        planner = FuelRouteView(geolocator=mock.Mock(), http_session=mock.Mock())
+        legs = planner.get_leg_fuel_states([110, 110], [0, 150], 200)
+        # Leg ends at 100 and 200 route miles
+        self.assertEqual([leg['fuel_stops'] for leg in legs], [1, 1])
+        self.assertEqual([leg['distance_miles'] for leg in legs], [110, 110])
+        self.assertEqual([leg['range_at_arrival_miles'] for leg in legs], [400, 450])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ROUTE_REQUEST_LOG=None)
+class RouteWaypointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for patcher in (
+            mock.patch('fuel_route.station_index._index', None),
+            mock.patch.object(FuelRouteView, 'geocode_from_provider', return_value=None),
+            mock.patch.dict(os.environ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('OPENROUTE_API_KEY', None)
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Lexington', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.13, longitude=-99.92,
+        )
+
+    def post(self, payload):
+        return self.client.post('/api/route/', payload, content_type='application/json')
+
+    def test_route_through_waypoint_reports_each_leg(self):
+        # Near the straight Omaha - Cheyenne leg of the fallback route
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Kearney', state='NE', rack_id=2,
+            retail_price='3.099', latitude=41.2, longitude=-98.9,
+        )
+        response = self.post({
+            'start_location': 'Omaha, NE', 'end_location': 'Salt Lake City, UT', 'waypoints': ['Cheyenne, WY'],
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['leg_distances_miles']), 2)
+        self.assertEqual([leg['distance_miles'] for leg in data['legs']], data['leg_distances_miles'])
+        self.assertEqual(sum(leg['fuel_stops'] for leg in data['legs']), len(data['fuel_stops']))
+        self.assertEqual({stop['city'] for stop in data['fuel_stops']}, {'Kearney'})
+        for leg in data['legs']:
+            self.assertLessEqual(leg['range_at_arrival_miles'], data['api_info']['vehicle_range_miles'])
+
+        # The waypoint is part of the lane, the direct route is planned separately
+        direct = self.post({'start_location': 'Omaha, NE', 'end_location': 'Salt Lake City, UT'}).json()
+        self.assertNotIn('legs', direct)
+        self.assertNotIn('leg_distances_miles', direct)
+
+    def test_unknown_waypoint_is_named_in_the_error(self):
+        response = self.post({
+            'start_location': 'Omaha, NE', 'end_location': 'Salt Lake City, UT',
+            'waypoints': ['Cheyenne, WY', 'Nowhere, ZZ'],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('waypoint 2 location: "Nowhere, ZZ"', response.json()['error'])
+
+
+class VehicleProfileTests(SimpleTestCase):
+    def vehicle(self, vehicle):
+        serializer = RouteRequestSerializer(data={
+            'start_location': 'Omaha, NE', 'end_location': 'Denver, CO', 'vehicle': vehicle,
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.validated_data['vehicle']
+
+    def test_profiles_resolve_to_parameters(self):
+        box_truck = {'max_range_miles': 350, 'miles_per_gallon': 12, 'max_station_distance_miles': 20}
+        self.assertEqual(self.vehicle('box_truck'), box_truck)
+        self.assertEqual(self.vehicle({'profile': 'box_truck'}), box_truck)
+        self.assertEqual(
+            self.vehicle({'profile': 'box_truck', 'miles_per_gallon': 9}), {**box_truck, 'miles_per_gallon': 9}
+        )
+        self.assertEqual(self.vehicle({'max_range_miles': 600}), {'max_range_miles': 600})
+
+    def test_invalid_vehicles_are_rejected(self):
+        for vehicle in ('tractor', {'max_range_miles': 10}, {'miles_per_gallon': 'many'}):
+            serializer = RouteRequestSerializer(data={
+                'start_location': 'Omaha, NE', 'end_location': 'Denver, CO', 'vehicle': vehicle,
+            })
+            self.assertFalse(serializer.is_valid())
+            self.assertIn('vehicle', serializer.errors)
+            if vehicle == 'tractor':
+                self.assertIn('box_truck', str(serializer.errors['vehicle']))
+
+    def test_vehicle_is_part_of_the_plan_key_only(self):
+        planner = FuelRouteView(geolocator=mock.Mock(), http_session=mock.Mock())
+        box_truck = planner.with_vehicle(self.vehicle('box_truck'))
+        self.assertEqual((planner.max_range_miles, box_truck.max_range_miles), (500, 350))
+        self.assertEqual(planner.with_vehicle({'max_range_miles': 500.0}).get_vehicle_key(), planner.get_vehicle_key())
+
+        lane = ('Omaha, NE', 'Denver, CO')
+        self.assertNotEqual(box_truck.get_plan_cache_key(*lane), planner.get_plan_cache_key(*lane))
+        self.assertEqual(box_truck.get_geometry_cache_key(*lane), planner.get_geometry_cache_key(*lane))
+        # Detour limits up to the corridor width share one corridor search
+        self.assertEqual(box_truck.get_corridor_width(), planner.get_corridor_width())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ROUTE_REQUEST_LOG=None)
+class StreamingRouteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for patcher in (
+            mock.patch('fuel_route.station_index._index', None),
+            mock.patch.object(FuelRouteView, 'geocode_from_provider', return_value=None),
+            mock.patch.dict(os.environ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('OPENROUTE_API_KEY', None)
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Lexington', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.13, longitude=-99.92,
+        )
+
+    def stream(self, payload):
+        return self.client.post('/api/route/?stream=true', payload, content_type='application/json')
+
+    def test_stages_are_streamed_with_one_geocode_pass(self):
+        with mock.patch.object(FuelRouteView, 'geocode_locations', autospec=True,
+                               side_effect=FuelRouteView.geocode_locations) as geocode:
+            response = self.stream({'start_location': 'Omaha, NE', 'end_location': 'Salt Lake City, UT'})
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual(geocode.call_count, 1)
+        self.assertEqual([event['event'] for event in events[:3]], ['geocode', 'geocode', 'geometry'])
+        self.assertEqual(events[-1]['event'], 'summary')
+        self.assertEqual({event['city'] for event in events if event['event'] == 'fuel_stop'}, {'Lexington'})
+        self.assertNotIn('route_coordinates', events[-1])
+
+    def test_unknown_location_is_rejected_before_streaming(self):
+        response = self.stream({'start_location': 'Omaha, NE', 'end_location': 'Nowhere, ZZ'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+        self.assertIn('end location: "Nowhere, ZZ"', response.json()['error'])
+
+
+class SimpleRequestValidationTests(SimpleTestCase):
+    def test_plain_requests_are_validated_inline(self):
+        self.assertEqual(
+            validate_simple_request({'start_location': ' Omaha, NE ', 'end_location': 'Denver, CO'}),
+            {'start_location': 'Omaha, NE', 'end_location': 'Denver, CO'},
+        )
+
+    def test_everything_else_goes_to_the_serializer(self):
+        for data in (
+            [],
+            {'start_location': 'Omaha, NE'},
+            {'start_location': 'Omaha, NE', 'end_location': 'Denver, CO', 'vehicle': 'box_truck'},
+            {'start_location': 'Omaha, NE', 'end_location': 'Denver, CO', 'waypoints': ['Lincoln, NE']},
+            {'start_location': 'Omaha, NE', 'end_location': 42},
+            {'start_location': 'Omaha, NE', 'end_location': 'CO'},
+            {'start_location': 'Omaha, NE', 'end_location': 'omaha ne'},
+        ):
+            self.assertIsNone(validate_simple_request(data), data)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ROUTE_REQUEST_LOG=None)
+class RouteViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for patcher in (
+            mock.patch('fuel_route.station_index._index', None),
+            mock.patch.object(FuelRouteView, 'geocode_from_provider', return_value=None),
+            mock.patch.dict(os.environ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('OPENROUTE_API_KEY', None)
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Lexington', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.13, longitude=-99.92,
+        )
+
+    def post(self, body):
+        return self.client.post('/api/route/', body, content_type='application/json')
+
+    def test_plain_request(self):
+        response = self.post({'start_location': 'Omaha, NE', 'end_location': 'Salt Lake City, UT'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        self.assertEqual({stop['city'] for stop in data['fuel_stops']}, {'Lexington'})
+        self.assertEqual(data['api_info']['vehicle_range_miles'], 500)
+
+        # Spelled differently, served from the plan cache
+        with mock.patch.object(FuelRouteView, 'compute_route_response') as compute:
+            response = self.post({'start_location': 'omaha ne', 'end_location': 'Salt Lake City, Utah'})
+        compute.assert_not_called()
+        self.assertEqual(response.json(), data)
+
+    def test_serializer_handles_the_rest(self):
+        response = self.post({
+            'start_location': 'Omaha, NE', 'end_location': 'Salt Lake City, UT', 'vehicle': 'box_truck',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['api_info']['vehicle_range_miles'], 350)
+
+        response = self.post({'start_location': 'Omaha, NE'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'end_location': ['End location is required']})
+
+        response = self.post({'start_location': 'Omaha, NE', 'end_location': 'omaha ne'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': ['Start and end locations must be different']})
+
+    def test_invalid_requests(self):
+        response = self.post('{"start_location": ')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid JSON data'})
+
+        response = self.client.get('/api/route/')
+        self.assertEqual(response.status_code, 405)
+
+        response = self.post({'start_location': 'Nowhere, ZZ', 'end_location': 'Denver, CO'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start location: "Nowhere, ZZ"', response.json()['error'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ROUTE_PLANNER_PRELOAD=True)
+class RoutePlannerReadinessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.planner = RoutePlanner()
+        for patcher in (
+            mock.patch('fuel_route.station_index._index', None),
+            mock.patch('fuel_route.gazetteer._gazetteer', None),
+            mock.patch('fuel_route.planner._route_planner', self.planner),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Lexington', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.13, longitude=-99.92,
+        )
+
+    def test_ready_once_preloaded(self):
+        response = self.client.get('/api/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks'], {'database': True, 'cache': True, 'preloaded': False})
+
+        self.assertTrue(self.planner.preload())
+        self.assertEqual(set(self.planner.preload_timings), {'gazetteer', 'station_index', 'cache'})
+        response = self.client.get('/api/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stations'], 1)
+        self.assertGreater(response.json()['places'], 0)
+
+        # Preloading again is a no-op
+        with mock.patch('fuel_route.planner.get_station_index') as build:
+            self.assertTrue(self.planner.preload())
+        build.assert_not_called()
+
+    def test_failed_preload_is_reported(self):
+        with mock.patch('fuel_route.planner.get_station_index', side_effect=RuntimeError('no stations')):
+            self.assertFalse(self.planner.preload())
+        status = self.planner.readiness()
+        self.assertFalse(status['ready'])
+        self.assertEqual(status['preload_error'], 'no stations')
+
+        self.assertTrue(self.planner.preload())
+        self.assertIsNone(self.planner.readiness()['preload_error'])
+
+    @override_settings(ROUTE_PLANNER_PRELOAD=False)
+    def test_preload_not_required_when_disabled(self):
+        self.assertTrue(self.planner.readiness()['ready'])
+
+    def test_packed_index_matches_the_built_index(self):
+        self.planner.preload()
+        route = [[41.26, -95.93], [41.0, -100.0], [40.76, -111.89]]
+        def corridor():
+            # Packed prices are floats; the planner reads current prices from the database
+            return [
+                (station['id'], station['distance_from_route'], float(station['retail_price']))
+                for station in get_station_index().corridor(route, 30)
+            ]
+
+        expected = corridor()
+        self.assertEqual(len(expected), 1)
+
+        with mock.patch('fuel_route.planner.connection'), mock.patch('fuel_route.planner.gc') as gc:
+            self.planner.prepare_for_fork()
+        gc.freeze.assert_called_once_with()
+        self.assertIsInstance(get_station_index(), PackedStationIndex)
+        self.assertIs(pack_station_index(), get_station_index())
+        self.assertEqual(corridor(), expected)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_seconds', 'Test durations', buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(seconds, stage='geocode')
+        samples = {(name, labels[-1][1] if name.endswith('_bucket') else None): value
+                   for name, labels, value in histogram.samples()}
+        self.assertEqual(samples[('test_seconds_bucket', '0.1')], 1)
+        self.assertEqual(samples[('test_seconds_bucket', '1')], 3)
+        self.assertEqual(samples[('test_seconds_bucket', '+Inf')], 4)
+        self.assertEqual(samples[('test_seconds_count', None)], 4)
+        self.assertAlmostEqual(samples[('test_seconds_sum', None)], 4.05)
+
+    def test_counter_keeps_one_series_per_label_set(self):
+        counter = Counter('test_total', 'Test events')
+        counter.inc(provider='nominatim')
+        counter.inc(2, provider='nominatim')
+        counter.inc(provider='openrouteservice')
+        self.assertEqual(sorted(value for _, _, value in counter.samples()), [1, 3])
+
+    def test_timed_view_adds_server_timing_and_records_the_request(self):
+        @timed_view('metrics_test')
+        def view(request):
+            with stage('geocode'):
+                pass
+            # Stages run in executor threads count towards the request
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(in_request_context(self.timed_block), 'optimize').result()
+            return HttpResponse('ok')
+
+        response = view(RequestFactory().get('/'))
+        names = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(names, ['geocode', 'optimize', 'total'])
+
+        metrics = render_metrics()
+        self.assertIn('# TYPE fuel_route_request_seconds histogram', metrics)
+        self.assertIn('fuel_route_request_seconds_count{endpoint="metrics_test",status="200"} 1', metrics)
+        self.assertIn('fuel_route_stage_seconds_bucket{stage="optimize",le="+Inf"}', metrics)
+
+    def timed_block(self, name):
+        with stage(name):
+            pass
+
+    def test_metrics_endpoint(self):
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE fuel_route_provider_errors_total counter', response.content)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_synthetic_routes_are_reproducible(self):
+        routes = synthetic_routes(20, seed=7)
+        self.assertEqual(routes, synthetic_routes(20, seed=7))
+        self.assertNotEqual(routes, synthetic_routes(20, seed=8))
+        for route in routes:
+            self.assertTrue(in_conus(route['start']) and in_conus(route['end']))
+            self.assertTrue(100 <= route['miles'] <= 3000)
+            # destination_point and sphere_miles agree on the great circle
+            self.assertAlmostEqual(sphere_miles(route['start'], route['end']), route['miles'], delta=0.1)
+
+    def test_route_polyline_follows_the_legs(self):
+        points = [(41.2565, -95.9345), (39.7392, -104.9903), (40.7608, -111.891)]
+        coordinates, meters, leg_meters = route_polyline(points)
+        self.assertEqual(len(leg_meters), 2)
+        self.assertAlmostEqual(meters, sum(leg_meters))
+        self.assertEqual(coordinates[0], [points[0][1], points[0][0]])
+        self.assertEqual(coordinates[-1], [points[-1][1], points[-1][0]])
+        straight = sum(sphere_miles(start, end) for start, end in zip(points, points[1:])) * 1609.344
+        self.assertGreaterEqual(meters, straight)
+        self.assertLess(meters, straight * 1.05)
+
+    def test_compare_reports_flags_regressions(self):
+        baseline = {
+            'end_to_end': {'p50_ms': 10.0, 'p95_ms': 20.0},
+            'stages': {'optimize': {'p50_ms': 0.01, 'p95_ms': 0.02}},
+        }
+        current = {
+            'end_to_end': {'p50_ms': 10.5, 'p95_ms': 25.0},
+            'stages': {'optimize': {'p50_ms': 0.02, 'p95_ms': 0.04}},
+        }
+        rows, regressions = compare_reports(baseline, current)
+        self.assertEqual(len(rows), 4)
+        # optimize doubled but by less than min_delta_ms
+        self.assertEqual([(row['name'], row['metric']) for row in regressions], [('end_to_end', 'p95_ms')])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GenerateStationsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        FuelStation.objects.create(
+            name='Stop', address='I-80', city='Lexington', state='NE', rack_id=1,
+            retail_price='3.199', latitude=41.13, longitude=-99.92,
+        )
+
+    def generate(self, *args):
+        out = StringIO()
+        call_command('generate_stations', *args, stdout=out)
+        return out.getvalue()
+
+    def test_smaller_runs_are_prefixes(self):
+        self.assertEqual(list(generate_stations(10, seed=3)), list(generate_stations(30, seed=3))[:10])
+
+    def test_replace_only_touches_generated_stations(self):
+        layout = get_layout_epoch()
+        self.generate('40', '--batch-size', '15')
+        self.assertEqual(FuelStation.objects.filter(rack_id__gte=SYNTHETIC_RACK_ID_BASE).count(), 40)
+        self.assertNotEqual(get_layout_epoch(), layout)
+
+        with self.assertRaises(CommandError):
+            self.generate('40')
+
+        output = self.generate('25', '--replace')
+        self.assertIn('Deleted 40 previously generated stations', output)
+        self.assertEqual(FuelStation.objects.filter(rack_id__gte=SYNTHETIC_RACK_ID_BASE).count(), 25)
+        self.assertTrue(FuelStation.objects.filter(rack_id=1).exists())
+
+    def test_snapshots_without_loading(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.generate('30', '--no-load', '--snapshot-dir', directory.name, '--snapshot-sizes', '10,30')
+        self.assertEqual(FuelStation.objects.count(), 1)
+        self.assertEqual(len(SnapshotStationIndex(os.path.join(directory.name, 'stations_10.idx'))), 10)
+        self.assertEqual(len(SnapshotStationIndex(os.path.join(directory.name, 'stations_30.idx'))), 30)
+
+    def test_bulk_changes_skip_post_init_work(self):
+        with bulk_station_changes():
+            station = FuelStation(name='Stop', city='Omaha', state='NE', rack_id=2, retail_price='3.1')
+        self.assertFalse(hasattr(station, '_loaded_location'))
+        self.assertTrue(hasattr(FuelStation(name='Stop', rack_id=3, retail_price='3.1'), '_loaded_location'))
+
+
+class DistancePrecisionTests(SimpleTestCase):
+    origin = (41.13, -99.92)
+
+    def point_at(self, miles, bearing=45):
+        destination = geodesic(miles=miles).destination(self.origin, bearing)
+        return (destination.latitude, destination.longitude)
+
+    def test_approximations_stay_within_their_error_bounds(self):
+        for miles in (0.5, 5, 30, 99, 101, 500, 2500):
+            for bearing in (0, 45, 90, 135):
+                point = self.point_at(miles, bearing)
+                approx, error = approx_miles(self.origin, point)
+                self.assertLess(abs(approx - miles) / miles, error)
+                self.assertEqual(error, FLAT_RELATIVE_ERROR if miles < 100 else SPHERE_RELATIVE_ERROR)
+
+    def test_modes_agree_near_the_limit(self):
+        modes = [DistancePrecision(mode) for mode in ('fast', 'balanced', 'exact')]
+        for miles in (29.97, 29.99, 29.999, 30.001, 30.01, 30.03):
+            others = [self.point_at(miles), self.point_at(80, 200)]
+            decisions = {precision.nearest_miles(self.origin, others, limit=30) <= 30 for precision in modes}
+            self.assertEqual(decisions, {miles <= 30}, miles)
+
+    def test_fast_mode_escalates_only_near_the_limit(self):
+        fast = DistancePrecision('fast')
+        nearest, exact_count = fast.nearest(self.origin, [self.point_at(30.005), self.point_at(90)], limit=30)
+        self.assertEqual(exact_count, 1)
+        self.assertAlmostEqual(nearest, 30.005, places=6)
+
+        nearest, exact_count = fast.nearest(self.origin, [self.point_at(20), self.point_at(90)], limit=30)
+        self.assertEqual(exact_count, 0)
+        self.assertAlmostEqual(nearest, 20, delta=20 * FLAT_RELATIVE_ERROR)
+
+    def test_balanced_mode_reports_exact_distances(self):
+        balanced = DistancePrecision('balanced')
+        point = self.point_at(12)
+        self.assertEqual(balanced.nearest_miles(self.origin, [point, self.point_at(90)], limit=30),
+                         exact_miles(self.origin, point))
+        self.assertEqual(balanced.nearest_miles(self.origin, [point], stop_below=5), exact_miles(self.origin, point))
+        self.assertEqual(balanced.nearest_miles(self.origin, []), float('inf'))
+        # Long legs are exact, short ones approximate
+        far = self.point_at(400)
+        self.assertEqual(balanced.miles(self.origin, far), exact_miles(self.origin, far))
+
+    def test_unknown_mode_is_a_configuration_error(self):
+        with override_settings(ROUTE_DISTANCE_PRECISION='approximate'):
+            with self.assertRaises(ImproperlyConfigured):
+                distance_precision()
+        self.assertEqual(distance_precision('exact').mode, 'exact')
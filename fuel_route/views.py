@@ -1,18 +1,57 @@
 from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
+from django.conf import settings
 from django.core.cache import cache
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import requests
+import copy
 import json
+import logging
 import time
 import hashlib
-from geopy.distance import geodesic
+from concurrent.futures import ThreadPoolExecutor
 from geopy.geocoders import Nominatim
+from .coalescing import route_single_flight
+from .distance import distance_precision
+from .epochs import get_layout_epoch, get_price_epoch
+from .gazetteer import get_gazetteer
+from .metrics import in_request_context, provider_errors, timed_stage
+from .normalization import normalization_stats, normalize_location
+from .refresh import stale_cache
 from .models import FuelStation
-from .serializers import RouteRequestSerializer, RouteResponseSerializer, ErrorResponseSerializer
+from .station_index import get_station_index
 import os
+from urllib.parse import urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+
+NOMINATIM_USER_AGENT = "fuel_route_optimizer_v1"
+
+
+def nominatim_geolocator():
+    """geopy Nominatim client for settings.NOMINATIM_URL"""
+    url = urlsplit(settings.NOMINATIM_URL)
+    return Nominatim(user_agent=NOMINATIM_USER_AGENT, domain=url.netloc + url.path.rstrip('/'), scheme=url.scheme)
+
+
+class LocationNotFoundError(Exception):
+    """Raised when a route endpoint cannot be geocoded"""
+    pass
+
+
+def location_labels(count):
+    """Labels used in errors for the start, waypoints and end of a route"""
+    return ['start'] + [f'waypoint {number}' for number in range(1, count - 1)] + ['end']
+
+
+def location_not_found_message(label, location):
+    """User-facing error for a location that could not be geocoded"""
+    return (
+        f'Could not find coordinates for {label} location: "{location}". '
+        f'Please check spelling and ensure it\'s a valid US location.'
+    )
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -28,174 +67,318 @@ class FuelRouteView(APIView):
     5. Calculates total fuel cost assuming 10 miles per gallon
     """
     
-    def __init__(self):
-        super().__init__()
-        self.geolocator = Nominatim(user_agent="fuel_route_optimizer_v1")
+    def __init__(self, geolocator=None, http_session=None, **kwargs):
+        super().__init__(**kwargs)
+        # Provider clients are passed in by RoutePlanner so a worker shares one of each
+        self.geolocator = geolocator or nominatim_geolocator()
+        self.http_session = http_session or requests.Session()
         self.max_range_miles = 500
         self.miles_per_gallon = 10
         self.max_station_distance_miles = 30
     
-    def get_cache_key(self, start_location, end_location):
-        """Generate cache key for route data"""
-        key_string = f"route_{start_location}_{end_location}".lower().replace(" ", "_")
+    def with_vehicle(self, vehicle):
+        """Copy of this view planning for different vehicle parameters"""
+        planner = copy.copy(self)
+        for field in ('max_range_miles', 'miles_per_gallon', 'max_station_distance_miles'):
+            if vehicle.get(field) is not None:
+                setattr(planner, field, vehicle[field])
+        return planner
+    
+    def get_vehicle_key(self):
+        """Vehicle parameters as a cache key part (500 and 500.0 give the same key)"""
+        return f"{self.max_range_miles:g}_{self.miles_per_gallon:g}_{self.max_station_distance_miles:g}"
+    
+    def get_corridor_width(self):
+        """
+        Search width of the cached corridor. Vehicles allowing a detour up to
+        ROUTE_CORRIDOR_WIDTH_MILES share one corridor and filter it down.
+        """
+        return max(self.max_station_distance_miles, getattr(settings, 'ROUTE_CORRIDOR_WIDTH_MILES', 30))
+    
+    def get_lane_hash(self, start_location, end_location, waypoints=()):
+        """
+        Stable hash of the normalized start, waypoints and end shared by the
+        split cache keys (a lane without waypoints hashes "start|end")
+        """
+        key_string = "|".join(
+            normalize_location(location) for location in (start_location, *waypoints, end_location)
+        )
         return hashlib.md5(key_string.encode()).hexdigest()[:16]
     
-    def get_cached_response(self, start_location, end_location):
-        """Get cached route response if available"""
-        cache_key = self.get_cache_key(start_location, end_location)
-        return cache.get(cache_key)
+    def get_geometry_cache_key(self, start_location, end_location, waypoints=()):
+        """Route geometry only depends on the lane"""
+        return f"geometry_{self.get_lane_hash(start_location, end_location, waypoints)}"
+    
+    def get_corridor_cache_key(self, start_location, end_location, route_data, waypoints=()):
+        """
+        Corridor candidates depend on the geometry, search width, station
+        layout and distance precision
+        """
+        return (
+            f"corridor_{self.get_lane_hash(start_location, end_location, waypoints)}"
+            f"_{route_data.get('api_used', 'unknown')}"
+            f"_{self.get_corridor_width():g}_{get_layout_epoch()}_{distance_precision().mode}"
+        )
+    
+    def get_plan_cache_key(self, start_location, end_location, waypoints=()):
+        """Fuel plans also depend on the vehicle and current station prices"""
+        return (
+            f"plan_{self.get_lane_hash(start_location, end_location, waypoints)}"
+            f"_{self.get_vehicle_key()}"
+            f"_{get_layout_epoch()}_{get_price_epoch()}"
+        )
+    
+    @timed_stage('cache')
+    def get_cached_response(self, start_location, end_location, waypoints=()):
+        """
+        Get cached fuel plan for the current station prices if available.
+        Plans close to expiry are refreshed in the background.
+        """
+        cache_key = self.get_plan_cache_key(start_location, end_location, waypoints)
+        return stale_cache.get(
+            cache_key,
+            refresh=lambda: self.compute_fuel_plan(
+                start_location, end_location,
+                self.get_route_geometry(start_location, end_location, waypoints),
+                waypoints
+            )
+        )
+    
+    def cache_response(self, start_location, end_location, response_data, timeout=3600, compute_time=0.0,
+                       waypoints=()):
+        """Cache fuel plan for 1 hour (or until station prices change)"""
+        cache_key = self.get_plan_cache_key(start_location, end_location, waypoints)
+        stale_cache.set(cache_key, response_data, timeout, compute_time)
+    
+    def log_route_request(self, start_location, end_location, waypoints=()):
+        """
+        Append the lane to ROUTE_REQUEST_LOG (JSON lines) when configured.
+        The warm_route_cache command replays the most requested lanes.
+        """
+        log_path = getattr(settings, 'ROUTE_REQUEST_LOG', None)
+        if not log_path:
+            return
+        try:
+            entry = {
+                'timestamp': time.time(),
+                'start_location': start_location,
+                'end_location': end_location
+            }
+            if waypoints:
+                entry['waypoints'] = list(waypoints)
+            line = json.dumps(entry)
+            with open(log_path, 'a', encoding='utf-8') as log_file:
+                log_file.write(line + '\n')
+        except OSError as e:
+            logger.warning("Error writing route request log: %s", e)
+    
+    def get_geocode_cache_key(self, location_string):
+        """Generate cache key for geocoding results"""
+        normalized = normalize_location(location_string)
+        normalization_stats.record('geocode', location_string, normalized)
+        return f"geocode_{hashlib.md5(normalized.encode()).hexdigest()[:12]}"
     
-    def cache_response(self, start_location, end_location, response_data, timeout=3600):
-        """Cache route response for 1 hour"""
-        cache_key = self.get_cache_key(start_location, end_location)
-        cache.set(cache_key, response_data, timeout)
+    def record_lane_normalization(self, start_location, end_location):
+        """Compare lane cache hit rates with the old raw keys and normalized keys"""
+        raw_key = f"{start_location}_{end_location}".lower().replace(" ", "_")
+        normalized_key = f"{normalize_location(start_location)}|{normalize_location(end_location)}"
+        normalization_stats.record('lane', raw_key, normalized_key)
     
     def geocode_location(self, location_string):
         """
         Convert location string to coordinates using Nominatim geocoder
         Returns tuple (latitude, longitude) or None if not found
         """
+        # "City, ST" inputs resolve from the offline gazetteer
+        coords = get_gazetteer().lookup(location_string)
+        if coords:
+            return coords
+        
         try:
             # Check cache first
-            cache_key = f"geocode_{hashlib.md5(location_string.encode()).hexdigest()[:12]}"
-            cached_coords = cache.get(cache_key)
+            cache_key = self.get_geocode_cache_key(location_string)
+            cached_coords = stale_cache.get(
+                cache_key, refresh=lambda: self.geocode_from_provider(location_string)
+            )
             if cached_coords:
                 return cached_coords
             
-            # Geocode with USA bias
-            location_query = f"{location_string}, USA"
-            location = self.geolocator.geocode(location_query, timeout=10)
+            start = time.monotonic()
+            coords = self.geocode_from_provider(location_string)
             
-            if location:
-                coords = (location.latitude, location.longitude)
+            if coords:
                 # Cache geocoding result for 24 hours
                 try:
-                    cache.set(cache_key, coords, 86400)
+                    stale_cache.set(cache_key, coords, 86400, time.monotonic() - start)
                 except Exception as e:
-                    print(f"Error caching geocode result: {e}")
+                    logger.warning("Error caching geocode result: %s", e)
                 return coords
                 
         except Exception as e:
-            print(f"Geocoding error for '{location_string}': {e}")
+            logger.warning("Geocoding error for %r: %s", location_string, e)
         
         return None
     
-    def get_route_from_openrouteservice(self, start_coords, end_coords):
+    @timed_stage('geocode')
+    def geocode_locations(self, locations):
         """
-        Get route using OpenRouteService Directions API (free tier)
-        This makes exactly ONE external API call as required
+        Coordinates (or None) for each location, in order.
+        Gazetteer hits resolve inline; the rest are geocoded concurrently.
+        """
+        gazetteer = get_gazetteer()
+        coords = [gazetteer.lookup(location) for location in locations]
+        missing = [index for index, found in enumerate(coords) if not found]
+        
+        if len(missing) == 1:
+            coords[missing[0]] = self.geocode_location(locations[missing[0]])
+        elif missing:
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                futures = [executor.submit(in_request_context(self.geocode_location), locations[i]) for i in missing]
+                for index, future in zip(missing, futures):
+                    coords[index] = future.result()
+        
+        return coords
+    
+    def geocode_from_provider(self, location_string):
+        """Geocode with Nominatim, bypassing the cache"""
+        # Geocode with USA bias
+        location_query = f"{location_string}, USA"
+        try:
+            location = self.geolocator.geocode(location_query, timeout=10)
+        except Exception as e:
+            provider_errors.inc(provider='nominatim', error=type(e).__name__)
+            raise
+        
+        if location:
+            return (location.latitude, location.longitude)
+        return None
+    
+    def get_openrouteservice_request(self, start_coords, end_coords, via_coords=()):
+        """
+        Build the OpenRouteService request as (url, headers, body)
+        Returns None for headers when no API key is configured
         """
-        url = "https://api.openrouteservice.org/v2/directions/driving-car"
+        url = f"{settings.OPENROUTESERVICE_URL.rstrip('/')}/v2/directions/driving-car"
         
         # Get API key from environment variable or use fallback
         api_key = os.environ.get('OPENROUTE_API_KEY', '')
+        if not api_key:
+            return url, None, None
         
         headers = {
             'Accept': 'application/json, application/geo+json',
-            'Authorization': f'Bearer {api_key}' if api_key else '',
+            'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json'
         }
         
         body = {
-            "coordinates": [[start_coords[1], start_coords[0]], [end_coords[1], end_coords[0]]],
+            "coordinates": [[coords[1], coords[0]] for coords in (start_coords, *via_coords, end_coords)],
             "format": "geojson",
             "instructions": False,
             "geometry_simplify": True
         }
         
+        return url, headers, body
+    
+    def parse_openrouteservice_response(self, data):
+        """Convert an OpenRouteService geojson response into route data"""
+        route = data['features'][0]
+        coordinates = route['geometry']['coordinates']
+        distance_meters = route['properties']['summary']['distance']
+        distance_miles = distance_meters * 0.000621371
+        
+        # Convert coordinates from [lng, lat] to [lat, lng] format
+        route_coords = [[coord[1], coord[0]] for coord in coordinates]
+        
+        route_data = {
+            'coordinates': route_coords,
+            'distance_miles': distance_miles,
+            'polyline': route['geometry'],
+            'api_used': 'openrouteservice'
+        }
+        
+        # Routes through waypoints have one segment per leg
+        segments = route['properties'].get('segments', [])
+        if len(segments) > 1:
+            route_data['leg_distances_miles'] = [
+                round(segment['distance'] * 0.000621371, 2) for segment in segments
+            ]
+        
+        return route_data
+    
+    @timed_stage('routing')
+    def get_route_from_openrouteservice(self, start_coords, end_coords, via_coords=()):
+        """
+        Get route using OpenRouteService Directions API (free tier)
+        This makes exactly ONE external API call as required, also for
+        routes through waypoints (via_coords)
+        """
+        url, headers, body = self.get_openrouteservice_request(start_coords, end_coords, via_coords)
+        
         try:
             # Only make API call if we have a valid key
-            if api_key:
-                response = requests.post(url, json=body, headers=headers, timeout=15)
+            if headers:
+                response = self.http_session.post(url, json=body, headers=headers, timeout=15)
                 
                 if response.status_code == 200:
-                    data = response.json()
-                    route = data['features'][0]
-                    coordinates = route['geometry']['coordinates']
-                    distance_meters = route['properties']['summary']['distance']
-                    distance_miles = distance_meters * 0.000621371
-                    
-                    # Convert coordinates from [lng, lat] to [lat, lng] format
-                    route_coords = [[coord[1], coord[0]] for coord in coordinates]
-                    
-                    return {
-                        'coordinates': route_coords,
-                        'distance_miles': distance_miles,
-                        'polyline': route['geometry'],
-                        'api_used': 'openrouteservice'
-                    }
+                    return self.parse_openrouteservice_response(response.json())
                 else:
-                    print(f"OpenRouteService API error: {response.status_code} - {response.text}")
+                    provider_errors.inc(provider='openrouteservice', error=f'http_{response.status_code}')
+                    logger.warning("OpenRouteService API error: %s - %s", response.status_code, response.text)
             else:
-                print("No OpenRouteService API key found, using fallback route")
+                logger.info("No OpenRouteService API key found, using fallback route")
                 
         except Exception as e:
-            print(f"OpenRouteService API request failed: {e}")
+            provider_errors.inc(provider='openrouteservice', error=type(e).__name__)
+            logger.warning("OpenRouteService API request failed: %s", e)
         
         # Fallback to straight-line route if API fails or no key
-        return self.create_fallback_route(start_coords, end_coords)
+        return self.create_fallback_route(start_coords, end_coords, via_coords)
     
-    def create_fallback_route(self, start_coords, end_coords):
+    def create_fallback_route(self, start_coords, end_coords, via_coords=()):
         """
         Create a fallback straight-line route when external API is unavailable
+        Routes through waypoints are straight lines between consecutive points
         """
-        distance_miles = geodesic(start_coords, end_coords).miles
-        
-        # Create intermediate points for better fuel stop placement
-        num_segments = max(3, int(distance_miles / 200))  # Segment every ~200 miles
+        points = [start_coords, *via_coords, end_coords]
+        precision = distance_precision()
         coordinates = []
+        leg_distances = []
+        total_segments = 0
         
-        for i in range(num_segments + 1):
-            ratio = i / num_segments
-            lat = start_coords[0] + (end_coords[0] - start_coords[0]) * ratio
-            lng = start_coords[1] + (end_coords[1] - start_coords[1]) * ratio
-            coordinates.append([lat, lng])
+        for leg_start, leg_end in zip(points, points[1:]):
+            distance_miles = precision.miles(leg_start, leg_end)
+            leg_distances.append(distance_miles)
+            
+            # Create intermediate points for better fuel stop placement
+            num_segments = max(3, int(distance_miles / 200))  # Segment every ~200 miles
+            total_segments += num_segments
+            
+            # Legs after the first start at the previous leg's last point
+            for i in range(0 if not coordinates else 1, num_segments + 1):
+                ratio = i / num_segments
+                lat = leg_start[0] + (leg_end[0] - leg_start[0]) * ratio
+                lng = leg_start[1] + (leg_end[1] - leg_start[1]) * ratio
+                coordinates.append([lat, lng])
         
-        return {
+        route_data = {
             'coordinates': coordinates,
-            'distance_miles': distance_miles,
-            'polyline': f"Fallback straight-line route with {num_segments} segments",
+            'distance_miles': sum(leg_distances),
+            'polyline': f"Fallback straight-line route with {total_segments} segments",
             'api_used': 'fallback'
         }
+        if via_coords:
+            route_data['leg_distances_miles'] = [round(distance, 2) for distance in leg_distances]
+        return route_data
     
-    def get_nearby_fuel_stations(self, route_coordinates):
+    def get_nearby_fuel_stations(self, route_coordinates, max_distance_miles=None):
         """
         Get fuel stations from database that are near the route
-        Returns stations within max_station_distance_miles of any route point
-        """
-        # Get all stations with valid coordinates
-        all_stations = FuelStation.objects.filter(
-            latitude__isnull=False,
-            longitude__isnull=False
-        ).values(
-            'name', 'address', 'city', 'state', 'retail_price',
-            'latitude', 'longitude', 'rack_id'
-        )
-        
-        nearby_stations = []
-        
-        # Sample route points for performance (every 10th point or so)
-        sample_points = route_coordinates[::max(1, len(route_coordinates) // 20)]
-        
-        for station in all_stations:
-            station_coords = (station['latitude'], station['longitude'])
-            min_distance_to_route = float('inf')
-            
-            # Find minimum distance from station to any sampled route point
-            for route_point in sample_points:
-                distance = geodesic(route_point, station_coords).miles
-                min_distance_to_route = min(min_distance_to_route, distance)
-                
-                # Early exit if station is very close
-                if min_distance_to_route < 5:
-                    break
-            
-            # Include station if within reasonable distance of route
-            if min_distance_to_route <= self.max_station_distance_miles:
-                station['distance_from_route'] = round(min_distance_to_route, 2)
-                nearby_stations.append(station)
-        
-        return nearby_stations
+        Returns stations within max_distance_miles (default max_station_distance_miles)
+        of any route point
+        """
+        # Only stations in grid cells near the route are measured
+        return get_station_index().corridor(route_coordinates, max_distance_miles or self.max_station_distance_miles)
     
     def find_optimal_fuel_stops(self, route_coordinates, nearby_stations):
         """
@@ -204,23 +387,24 @@ class FuelRouteView(APIView):
         2. Fuel price optimization
         3. Distance from route minimization
         """
+        fuel_stops, refuel_miles, total_distance = self.plan_fuel_stops(route_coordinates, nearby_stations)
+        return fuel_stops, total_distance
+    
+    def plan_fuel_stops(self, route_coordinates, nearby_stations):
+        """
+        Fuel stops as find_optimal_fuel_stops, plus the route mile at which
+        the tank is refilled for each stop
+        """
         if not nearby_stations:
-            return [], 0
+            return [], [], 0
         
         fuel_stops = []
-        total_distance = 0
+        refuel_miles = []
         current_range = 0
         
-        # Calculate total route distance
-        for i in range(len(route_coordinates) - 1):
-            segment_distance = geodesic(route_coordinates[i], route_coordinates[i + 1]).miles
-            total_distance += segment_distance
-        
-        # Calculate cumulative distances along route
-        route_distances = [0]
-        for i in range(len(route_coordinates) - 1):
-            segment_distance = geodesic(route_coordinates[i], route_coordinates[i + 1]).miles
-            route_distances.append(route_distances[-1] + segment_distance)
+        # Calculate cumulative distances along route; the last is the total
+        route_distances = distance_precision().cumulative_miles(route_coordinates)
+        total_distance = route_distances[-1]
         
         current_distance_covered = 0
         last_fuel_distance = 0
@@ -263,11 +447,37 @@ class FuelRouteView(APIView):
                     
                     # Reset range after fuel stop
                     last_fuel_distance = current_distance_covered
+                    refuel_miles.append(current_distance_covered)
             
             # Move forward along route
             current_distance_covered += 100  # Check every 100 miles
         
-        return fuel_stops, total_distance
+        return fuel_stops, refuel_miles, total_distance
+    
+    def get_leg_fuel_states(self, leg_distances, refuel_miles, total_distance):
+        """
+        Tank state at the end of each leg of a route through waypoints.
+        The vehicle starts full and every fuel stop fills the tank, so the
+        fuel left at a waypoint is carried into the next leg.
+        """
+        # Leg distances come from the routing provider, scale them onto the
+        # route length the stops were planned on
+        scale = total_distance / sum(leg_distances) if sum(leg_distances) else 0
+        legs = []
+        leg_end = 0
+        stops_before = 0
+        for leg_distance in leg_distances:
+            leg_end += leg_distance * scale
+            refuels = [mile for mile in refuel_miles if mile <= leg_end]
+            range_left = max(0, self.max_range_miles - (leg_end - max(refuels, default=0)))
+            legs.append({
+                'distance_miles': leg_distance,
+                'fuel_stops': len(refuels) - stops_before,
+                'range_at_arrival_miles': round(range_left, 2),
+                'fuel_at_arrival_gallons': round(range_left / self.miles_per_gallon, 2),
+            })
+            stops_before = len(refuels)
+        return legs
     
     def get_route_segment_coords(self, route_coordinates, route_distances, start_dist, end_dist):
         """Get coordinates for a specific distance segment of the route"""
@@ -285,15 +495,15 @@ class FuelRouteView(APIView):
         Scoring considers both price and distance from route
         """
         candidates = []
+        precision = distance_precision()
         
         for station in nearby_stations:
             station_coords = (station['latitude'], station['longitude'])
-            min_distance = float('inf')
             
             # Find minimum distance to segment
-            for coord in segment_coords:
-                distance = geodesic(coord, station_coords).miles
-                min_distance = min(min_distance, distance)
+            min_distance = precision.nearest_miles(
+                station_coords, segment_coords, limit=self.max_station_distance_miles
+            )
             
             if min_distance <= self.max_station_distance_miles:
                 # Calculate composite score: lower is better
@@ -315,129 +525,234 @@ class FuelRouteView(APIView):
         candidates.sort(key=lambda x: x['score'])
         return candidates[0]
     
-    def post(self, request):
+    @timed_stage('optimize')
+    def build_route_plan(self, route_data, nearby_stations=None):
         """
-        Main API endpoint for route optimization
-        
-        POST /api/route/
-        {
-            "start_location": "New York, NY",
-            "end_location": "Los Angeles, CA"
-        }
+        Find fuel stops for a computed route and assemble the response payload.
+        This step is CPU and database bound only - no external API calls.
         """
-        try:
-            # Handle both DRF Request and Django WSGIRequest
-            if hasattr(request, 'data'):
-                data = request.data
-            else:
-                # For Django WSGIRequest, parse JSON from body
-                import json
-                try:
-                    data = json.loads(request.body.decode('utf-8'))
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    return Response(
-                        {'error': 'Invalid JSON data'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            # Validate request data
-            serializer = RouteRequestSerializer(data=data)
-            if not serializer.is_valid():
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-            
-            start_location = serializer.validated_data['start_location'].strip()
-            end_location = serializer.validated_data['end_location'].strip()
-            
-            # Check cache for existing result
-            cached_response = self.get_cached_response(start_location, end_location)
-            if cached_response:
-                return Response(cached_response, status=status.HTTP_200_OK)
-            
-            # Geocode locations
-            start_coords = self.geocode_location(start_location)
-            end_coords = self.geocode_location(end_location)
-            
-            if not start_coords:
-                return Response(
-                    {'error': f'Could not find coordinates for start location: "{start_location}". Please check spelling and ensure it\'s a valid US location.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            if not end_coords:
-                return Response(
-                    {'error': f'Could not find coordinates for end location: "{end_location}". Please check spelling and ensure it\'s a valid US location.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Get route (single external API call as required)
-            route_data = self.get_route_from_openrouteservice(start_coords, end_coords)
-            
-            # Get nearby fuel stations from database
+        # Get nearby fuel stations from database
+        if nearby_stations is None:
             try:
                 nearby_stations = self.get_nearby_fuel_stations(route_data['coordinates'])
             except Exception as e:
-                print(f"Error getting fuel stations: {e}")
+                logger.warning("Error getting fuel stations: %s", e)
                 nearby_stations = []
-            
-            # Find optimal fuel stops
-            try:
-                fuel_stops, total_distance = self.find_optimal_fuel_stops(
-                    route_data['coordinates'], nearby_stations
-                )
-            except Exception as e:
-                print(f"Error finding fuel stops: {e}")
-                fuel_stops = []
-                total_distance = route_data.get('distance_miles', 0)
-            
-            # Calculate fuel consumption and costs
-            fuel_needed_gallons = total_distance / self.miles_per_gallon
-            
-            if fuel_stops:
-                # Distribute fuel consumption across stops
-                gallons_per_stop = fuel_needed_gallons / len(fuel_stops)
-                total_fuel_cost = sum(stop['price'] * gallons_per_stop for stop in fuel_stops)
-            else:
-                total_fuel_cost = 0
-                # If no fuel stops found, add a note
-                if total_distance > self.max_range_miles:
-                    fuel_stops = [{
-                        'name': 'WARNING: No fuel stations found along route',
-                        'address': 'Please check route or add fuel stations to database',
-                        'city': 'N/A',
-                        'state': 'N/A',
-                        'price': 0.0,
-                        'latitude': 0.0,
-                        'longitude': 0.0,
-                        'distance_from_route': 0.0
-                    }]
-            
-            # Prepare response data
-            response_data = {
-                'total_distance_miles': round(total_distance, 2),
-                'total_fuel_cost': round(total_fuel_cost, 2),
-                'total_fuel_needed_gallons': round(fuel_needed_gallons, 2),
-                'fuel_stops': fuel_stops,
-                'route_polyline': str(route_data.get('polyline', '')),
-                'route_coordinates': route_data.get('coordinates', [])[:50],  # Limit for response size
-                'api_info': {
-                    'route_source': route_data.get('api_used', 'unknown'),
-                    'stations_considered': len(nearby_stations),
-                    'vehicle_range_miles': self.max_range_miles,
-                    'fuel_efficiency_mpg': self.miles_per_gallon
-                }
+        
+        # Find optimal fuel stops
+        try:
+            fuel_stops, refuel_miles, total_distance = self.plan_fuel_stops(
+                route_data['coordinates'], nearby_stations
+            )
+        except Exception as e:
+            logger.exception("Error finding fuel stops: %s", e)
+            fuel_stops, refuel_miles = [], []
+            total_distance = route_data.get('distance_miles', 0)
+        
+        # Calculate fuel consumption and costs
+        fuel_needed_gallons = total_distance / self.miles_per_gallon
+        
+        if fuel_stops:
+            # Distribute fuel consumption across stops
+            gallons_per_stop = fuel_needed_gallons / len(fuel_stops)
+            total_fuel_cost = sum(stop['price'] * gallons_per_stop for stop in fuel_stops)
+        else:
+            total_fuel_cost = 0
+            # If no fuel stops found, add a note
+            if total_distance > self.max_range_miles:
+                fuel_stops = [{
+                    'name': 'WARNING: No fuel stations found along route',
+                    'address': 'Please check route or add fuel stations to database',
+                    'city': 'N/A',
+                    'state': 'N/A',
+                    'price': 0.0,
+                    'latitude': 0.0,
+                    'longitude': 0.0,
+                    'distance_from_route': 0.0
+                }]
+        
+        # Prepare response data
+        response_data = {
+            'total_distance_miles': round(total_distance, 2),
+            'total_fuel_cost': round(total_fuel_cost, 2),
+            'total_fuel_needed_gallons': round(fuel_needed_gallons, 2),
+            'fuel_stops': fuel_stops,
+            'route_polyline': str(route_data.get('polyline', '')),
+            'route_coordinates': route_data.get('coordinates', [])[:50],  # Limit for response size
+            'api_info': {
+                'route_source': route_data.get('api_used', 'unknown'),
+                'stations_considered': len(nearby_stations),
+                'vehicle_range_miles': self.max_range_miles,
+                'fuel_efficiency_mpg': self.miles_per_gallon
             }
-            
-            # Cache successful response
+        }
+        
+        # Fuel is carried across waypoints: stops are planned on the whole route
+        # and each leg reports the tank state on arrival at its waypoint
+        if route_data.get('leg_distances_miles'):
+            response_data['leg_distances_miles'] = route_data['leg_distances_miles']
+            response_data['legs'] = self.get_leg_fuel_states(
+                route_data['leg_distances_miles'], refuel_miles, total_distance
+            )
+        
+        return response_data
+    
+    def get_route_geometry(self, start_location, end_location, waypoints=(), coords=None):
+        """
+        Route geometry for a lane, cached for 24 hours and refreshed in the
+        background near expiry. Pass coords when the locations are already
+        geocoded. Raises LocationNotFoundError for bad locations.
+        """
+        cache_key = self.get_geometry_cache_key(start_location, end_location, waypoints)
+        route_data = stale_cache.get(
+            cache_key, refresh=lambda: self.fetch_route_geometry(start_location, end_location, waypoints, coords)
+        )
+        if route_data:
+            return route_data
+        
+        start = time.monotonic()
+        route_data = self.fetch_route_geometry(start_location, end_location, waypoints, coords)
+        
+        try:
+            stale_cache.set(
+                cache_key, route_data, self.get_geometry_cache_timeout(route_data),
+                time.monotonic() - start
+            )
+        except Exception as e:
+            logger.warning("Error caching route geometry: %s", e)
+        
+        return route_data
+    
+    def geocode_route_locations(self, start_location, end_location, waypoints=()):
+        """
+        Coordinates of the start, waypoints and end in route order.
+        Raises LocationNotFoundError for bad locations.
+        """
+        locations = [start_location, *waypoints, end_location]
+        coords = self.geocode_locations(locations)
+        
+        for label, location, found in zip(location_labels(len(locations)), locations, coords):
+            if not found:
+                raise LocationNotFoundError(location_not_found_message(label, location))
+        
+        return coords
+    
+    def fetch_route_geometry(self, start_location, end_location, waypoints=(), coords=None):
+        """
+        Geocode all locations (unless coords are given) and fetch the route,
+        bypassing the geometry cache. Raises LocationNotFoundError for bad locations.
+        """
+        if coords is None:
+            coords = self.geocode_route_locations(start_location, end_location, waypoints)
+        
+        # Get route (single external API call as required)
+        return self.get_route_from_openrouteservice(coords[0], coords[-1], coords[1:-1])
+    
+    def get_geometry_cache_timeout(self, route_data):
+        """Fallback routes are kept for 1 hour only so the real route is retried"""
+        return 3600 if route_data.get('api_used') == 'fallback' else 86400
+    
+    @timed_stage('station_search')
+    def get_corridor_stations(self, start_location, end_location, route_data, waypoints=()):
+        """
+        Stations near the route with current prices.
+        The candidate set (without prices) is cached per station layout, prices
+        are always read fresh so a price update does not redo the corridor search.
+        """
+        cache_key = self.get_corridor_cache_key(start_location, end_location, route_data, waypoints)
+        candidates = cache.get(cache_key)
+        
+        if candidates is None:
+            candidates = [
+                {key: value for key, value in station.items() if key != 'retail_price'}
+                for station in self.get_nearby_fuel_stations(route_data['coordinates'], self.get_corridor_width())
+            ]
             try:
-                self.cache_response(start_location, end_location, response_data)
+                cache.set(cache_key, candidates, 86400)
             except Exception as e:
-                print(f"Error caching response: {e}")
-            
-            return Response(response_data, status=status.HTTP_200_OK)
-            
+                logger.warning("Error caching corridor stations: %s", e)
+        
+        # Narrow the shared corridor to this vehicle's detour limit. Distances
+        # under 5 miles are early-exit upper bounds, so those stations are kept
+        # and left to the exact check in find_best_station_in_segment.
+        if self.max_station_distance_miles < self.get_corridor_width():
+            candidates = [
+                station for station in candidates
+                if station['distance_from_route'] <= self.max_station_distance_miles
+                or station['distance_from_route'] < 5
+            ]
+        
+        prices = self.get_station_prices([station['id'] for station in candidates])
+        return [
+            {**station, 'retail_price': prices[station['id']]}
+            for station in candidates
+            if station['id'] in prices
+        ]
+    
+    def get_station_prices(self, station_ids):
+        """Current retail price per station id"""
+        prices = {}
+        # Chunk to stay below database parameter limits
+        for i in range(0, len(station_ids), 500):
+            prices.update(
+                FuelStation.objects.filter(id__in=station_ids[i:i + 500]).values_list('id', 'retail_price')
+            )
+        return prices
+    
+    def compute_fuel_plan(self, start_location, end_location, route_data, waypoints=()):
+        """Compute the fuel plan for a route whose geometry is known, without caching it"""
+        try:
+            nearby_stations = self.get_corridor_stations(start_location, end_location, route_data, waypoints)
         except Exception as e:
-            print(f"Unexpected error in route optimization: {e}")
-            return Response(
-                {'error': 'An unexpected error occurred while processing your request. Please try again.'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            logger.warning("Error getting fuel stations: %s", e)
+            nearby_stations = []
+        
+        return self.build_route_plan(route_data, nearby_stations)
+    
+    def plan_route(self, start_location, end_location, route_data, waypoints=()):
+        """Compute and cache the fuel plan for a route whose geometry is known"""
+        start = time.monotonic()
+        response_data = self.compute_fuel_plan(start_location, end_location, route_data, waypoints)
+        
+        # Cache successful response
+        try:
+            self.cache_response(
+                start_location, end_location, response_data,
+                compute_time=time.monotonic() - start, waypoints=waypoints
+            )
+        except Exception as e:
+            logger.warning("Error caching response: %s", e)
+        
+        return response_data
+    
+    def compute_route_response(self, start_location, end_location, waypoints=()):
+        """
+        Run the pipeline (geometry, corridor, fuel plan) for a fuel plan cache miss.
+        Each stage reuses its own cache entry when available.
+        Raises LocationNotFoundError for bad locations.
+        """
+        route_data = self.get_route_geometry(start_location, end_location, waypoints)
+        return self.plan_route(start_location, end_location, route_data, waypoints)
+    
+    def get_route_response(self, start_location, end_location, waypoints=()):
+        """
+        Cached fuel plan, or one computed with identical concurrent requests
+        sharing the work. Raises LocationNotFoundError for bad locations.
+        """
+        # Check cache for existing result
+        cached_response = self.get_cached_response(start_location, end_location, waypoints)
+        if cached_response:
+            return cached_response
+        
+        # Identical concurrent requests share one computation, keyed by the
+        # plan key so a result computed under older station epochs is not shared
+        return route_single_flight.do(
+            self.get_plan_cache_key(start_location, end_location, waypoints),
+            lambda: self.compute_route_response(start_location, end_location, waypoints)
+        )
+
+
+def get_planner():
+    """Per-process FuelRouteView shared by the function views; with_vehicle copies it per request"""
+    from .planner import get_route_planner
+    return get_route_planner().view
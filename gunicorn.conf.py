@@ -0,0 +1,51 @@
+"""
+Gunicorn settings shared by the Procfile, render.yaml and railway.json.
+
+GUNICORN_PRELOAD=true loads the app in the master: the station index and
+gazetteer are built once, packed and frozen (RoutePlanner.prepare_for_fork)
+and the workers share those pages copy-on-write. Without it every worker
+loads the app and builds its own copy.
+
+Each worker logs its startup time and memory once it is ready, e.g.
+
+    Worker 1234 ready (preload) in 4ms: rss=61.2MB pss=24.8MB private=9.1MB
+
+and GET /api/ready/ reports the same for the worker that answers.
+"""
+import os
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+
+mode = 'preload' if preload_app else 'per-worker'
+
+
+def when_ready(server):
+    if preload_app:
+        from fuel_route.planner import get_route_planner
+
+        planner = get_route_planner()
+        planner.prepare_for_fork()
+        server.log.info(
+            'Route planner preloaded in master %s: %s', os.getpid(), planner.preload_timings
+        )
+
+
+def post_fork(server, worker):
+    worker.fork_time = time.monotonic()
+
+
+def post_worker_init(worker):
+    from fuel_route.planner import get_route_planner, memory_usage
+
+    planner = get_route_planner()
+    planner.after_fork()
+    planner.worker_startup_ms = round((time.monotonic() - worker.fork_time) * 1000, 1)
+    memory = memory_usage()
+    worker.log.info(
+        'Worker %s ready (%s) in %.0fms: %s', worker.pid, mode, planner.worker_startup_ms,
+        ' '.join(f'{key}={value}MB' for key, value in memory.items())
+    )